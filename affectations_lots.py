@@ -0,0 +1,208 @@
+"""
+AFFECTATION DES LOTS AUX PRODUITS EN MASSE
+Allocation vectorisée des lots bruts aux besoins hebdomadaires (sans dépendance Streamlit)
+"""
+
+import re
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+OBJECTIFS = {
+    'fifo': "Lots les plus anciens d'abord (Date_Réception)",
+    'dechet_min': "Déchet minimal (lots au Taux_Déchet_Estimé le plus bas d'abord)",
+}
+
+def taux_dechet(serie):
+    """Taux de déchet en décimal (les feuilles en contiennent aussi en %)"""
+    taux = pd.to_numeric(serie, errors='coerce').fillna(0).to_numpy(dtype=float)
+    return np.where(taux > 1, taux / 100, taux)
+
+def prochain_numero_affectation(affectations):
+    """Numéro suivant le plus grand AFF_<n> existant (1 si aucun)"""
+    if len(affectations) == 0 or 'ID_Affectation' not in affectations.columns:
+        return 1
+    numeros = affectations['ID_Affectation'].astype(str).str.extract(r'_(\d+)$', expand=False)
+    numeros = pd.to_numeric(numeros, errors='coerce').dropna()
+    return int(numeros.max()) + 1 if len(numeros) else 1
+
+def _semaine_fin(valeur):
+    """Semaine_Fin d'une affectation : numéro, ou None si ouverte (« Épuisement », « * »)"""
+    correspondance = re.fullmatch(r'\s*(\d+)(\.0+)?\s*', str(valeur))
+    return int(correspondance.group(1)) if correspondance else None
+
+def _besoins(data, semaine_debut, semaine_fin, exclure_affectes):
+    """Besoins nets (produit actif, semaine) triés par variété, semaine puis ordre des produits"""
+    produits = data['Produits']
+    produits = produits[produits['Actif'] == 'OUI'].drop_duplicates('Code_Produit')
+    varietes = dict(zip(produits['Code_Produit'].astype(str), produits['Code_Variété'].astype(str)))
+    rang_produit = {code: i for i, code in enumerate(produits['Code_Produit'].astype(str))}
+
+    previsions = data['Previsions']
+    besoins = pd.DataFrame({
+        'Code_Produit': previsions['Code_Produit'].astype(str).to_numpy(),
+        'Semaine_Num': pd.to_numeric(previsions['Semaine_Num'], errors='coerce').to_numpy(),
+        'Net': pd.to_numeric(previsions['Volume_Prévu_T'], errors='coerce').fillna(0).to_numpy(),
+    })
+    besoins = besoins[besoins['Code_Produit'].isin(varietes) & (besoins['Net'] > 0)
+                      & (besoins['Semaine_Num'] >= semaine_debut)]
+    if semaine_fin is not None:
+        besoins = besoins[besoins['Semaine_Num'] <= semaine_fin]
+    besoins = besoins.groupby(['Code_Produit', 'Semaine_Num'], as_index=False)['Net'].sum()
+
+    if exclure_affectes and len(data['Affectations']) > 0:
+        besoins = besoins[~_deja_couverts(data['Affectations'], besoins)]
+
+    besoins['Code_Variété'] = besoins['Code_Produit'].map(varietes)
+    besoins['_rang'] = besoins['Code_Produit'].map(rang_produit)
+    return besoins.sort_values(['Code_Variété', 'Semaine_Num', '_rang'], kind='stable').reset_index(drop=True)
+
+def _deja_couverts(affectations, besoins):
+    """Masque des besoins (produit, semaine) déjà couverts par une affectation active"""
+    actives = affectations[affectations['Statut_Affectation'] == 'Active']
+    couverture = pd.DataFrame({
+        'Code_Produit': actives['Code_Produit'].astype(str).to_numpy(),
+        '_debut': pd.to_numeric(actives['Semaine_Début'], errors='coerce').fillna(0).to_numpy(),
+        '_fin': [_semaine_fin(v) for v in actives['Semaine_Fin']],
+    })
+    couverture['_fin'] = couverture['_fin'].fillna(np.inf)
+    jointure = besoins.reset_index().merge(couverture, on='Code_Produit')
+    couverts = jointure.loc[(jointure['Semaine_Num'] >= jointure['_debut'])
+                            & (jointure['Semaine_Num'] <= jointure['_fin']), 'index']
+    return besoins.index.isin(couverts)
+
+def _lots(data, objectif, deduire_reserves):
+    """Lots disponibles (tonnage brut restant, moins les réservations actives) dans l'ordre de l'objectif"""
+    lots = data['Lots']
+    lots = pd.DataFrame({
+        'Lot_ID': lots['Lot_ID'].astype(str).to_numpy(),
+        'Code_Variété': lots['Code_Variété'].astype(str).to_numpy(),
+        'Date_Réception': pd.to_datetime(lots['Date_Réception'], errors='coerce').to_numpy()
+        if 'Date_Réception' in lots.columns else pd.NaT,
+        'Dispo': pd.to_numeric(lots['Tonnage_Brut_Restant'], errors='coerce').fillna(0).to_numpy(),
+        'Taux': taux_dechet(lots['Taux_Déchet_Estimé']),
+        '_ordre': np.arange(len(lots)),
+    }).drop_duplicates('Lot_ID')
+
+    if deduire_reserves and len(data['Affectations']) > 0:
+        actives = data['Affectations'][data['Affectations']['Statut_Affectation'] == 'Active']
+        reserve = (pd.to_numeric(actives['Tonnage_Brut_Requis'], errors='coerce').fillna(0)
+                   .groupby(actives['Lot_ID'].astype(str)).sum())
+        lots['Dispo'] = lots['Dispo'] - lots['Lot_ID'].map(reserve).fillna(0).to_numpy()
+
+    lots = lots[(lots['Dispo'] > 0) & (lots['Taux'] < 1)].copy()
+    # Tonnage net que chaque lot peut fournir une fois lavé
+    lots['Net'] = lots['Dispo'] * (1 - lots['Taux'])
+
+    tri = ['Date_Réception', '_ordre'] if objectif == 'fifo' else ['Taux', 'Date_Réception', '_ordre']
+    return lots.sort_values(['Code_Variété'] + tri, kind='stable', na_position='last').reset_index(drop=True)
+
+def _axe_commun(varietes_besoins, net_besoins, varietes_lots, net_lots):
+    """Bornes cumulées des besoins et des lots sur un axe commun, une plage par variété
+
+    Dans chaque variété, besoins et lots sont consommés dans leur ordre :
+    le besoin i reçoit du lot j la longueur de l'intersection de leurs
+    intervalles cumulés. Les variétés sont mises bout à bout.
+    """
+    # Même ordre que le tri des besoins et des lots : bornes croissantes sur tout l'axe
+    toutes = pd.Index(np.unique(np.concatenate([varietes_besoins, varietes_lots]).astype(str)))
+    rang_b = toutes.get_indexer(varietes_besoins)
+    rang_l = toutes.get_indexer(varietes_lots)
+
+    total_b = np.bincount(rang_b, weights=net_besoins, minlength=len(toutes))
+    total_l = np.bincount(rang_l, weights=net_lots, minlength=len(toutes))
+    decalage = np.concatenate([[0.0], np.cumsum(np.maximum(total_b, total_l))[:-1]])
+
+    def bornes(rang, valeurs):
+        fin = np.cumsum(valeurs)
+        debut_variete = np.r_[0, np.flatnonzero(np.diff(rang)) + 1]
+        cumul_avant = np.repeat(np.r_[0.0, fin][debut_variete], np.diff(np.r_[debut_variete, len(rang)]))
+        fin = fin - cumul_avant + decalage[rang]
+        return fin - valeurs, fin
+
+    return bornes(rang_b, net_besoins), bornes(rang_l, net_lots)
+
+def allouer_lots(data, semaine_debut, semaine_fin=None, objectif='fifo',
+                 exclure_affectes=True, deduire_reserves=True):
+    """Affecte les lots bruts aux besoins nets de tous les produits actifs en une passe
+
+    Besoins : prévisions des produits actifs (Actif = OUI) de `semaine_debut`
+    à `semaine_fin` (None : jusqu'à la dernière semaine prévue, soit
+    l'épuisement), servis par semaine croissante. Lots : même variété que le
+    produit, tonnage brut restant > 0 (moins les réservations des affectations
+    actives si `deduire_reserves`), pris dans l'ordre de `objectif` (voir
+    OBJECTIFS). Un besoin net N servi par un lot au taux de déchet t consomme
+    N / (1 - t) T brutes.
+
+    Retourne (affectations, non_couverts, epuisement) :
+    - une ligne par (produit, lot) au format de l'onglet Affectations (sans
+      ID ni date : voir lignes_affectations_sheets) ;
+    - les besoins (produit, semaine) sans stock suffisant, tonnage net manquant ;
+    - par variété : stock brut / net, besoin net et première semaine non couverte.
+    """
+    if objectif not in OBJECTIFS:
+        raise ValueError(f"Objectif inconnu : {objectif}")
+
+    besoins = _besoins(data, semaine_debut, semaine_fin, exclure_affectes)
+    lots = _lots(data, objectif, deduire_reserves)
+
+    (debut_b, fin_b), (debut_l, fin_l) = _axe_commun(
+        besoins['Code_Variété'].to_numpy(), besoins['Net'].to_numpy(),
+        lots['Code_Variété'].to_numpy(), lots['Net'].to_numpy())
+
+    # Segments élémentaires entre deux bornes consécutives (besoins et lots confondus)
+    coupures = np.unique(np.concatenate([debut_b, fin_b, debut_l, fin_l]))
+    a, b = coupures[:-1], coupures[1:]
+    i_besoin = np.searchsorted(fin_b, a, side='right')
+    i_lot = np.searchsorted(fin_l, a, side='right')
+    valide = (i_besoin < len(besoins)) & (i_lot < len(lots)) & (b - a > 1e-9)
+    valide[valide] &= (a[valide] >= debut_b[i_besoin[valide]]) & (a[valide] >= debut_l[i_lot[valide]])
+
+    segments = pd.DataFrame({
+        'Code_Produit': besoins['Code_Produit'].to_numpy()[i_besoin[valide]],
+        'Semaine_Num': besoins['Semaine_Num'].to_numpy()[i_besoin[valide]],
+        'Lot_ID': lots['Lot_ID'].to_numpy()[i_lot[valide]],
+        '_lot': i_lot[valide],
+        'Net': (b - a)[valide],
+    })
+    segments['Brut'] = segments['Net'] / (1 - lots['Taux'].to_numpy()[segments['_lot']])
+
+    affectations = (segments.groupby(['Code_Produit', 'Lot_ID', '_lot'], as_index=False, sort=False)
+                    .agg(Semaine_Début=('Semaine_Num', 'min'), Semaine_Fin=('Semaine_Num', 'max'),
+                         Tonnage_Brut_Requis=('Brut', 'sum')))
+    affectations['Tonnage_Dispo'] = lots['Dispo'].to_numpy()[affectations['_lot']]
+    affectations['Tonnage_Brut_Requis'] = affectations['Tonnage_Brut_Requis'].round(2)
+    affectations['Écart_T'] = (affectations['Tonnage_Dispo'] - affectations['Tonnage_Brut_Requis']).round(2)
+    affectations = affectations.drop(columns='_lot')
+
+    servis = segments.groupby(['Code_Produit', 'Semaine_Num'])['Net'].sum()
+    besoins['Servi'] = besoins.set_index(['Code_Produit', 'Semaine_Num']).index.map(servis).fillna(0).to_numpy()
+    besoins['Manquant'] = (besoins['Net'] - besoins['Servi']).round(2)
+    non_couverts = besoins.loc[besoins['Manquant'] > 0.005,
+                               ['Code_Variété', 'Code_Produit', 'Semaine_Num', 'Net', 'Manquant']]
+
+    epuisement = _epuisement(besoins, lots)
+    return affectations, non_couverts.reset_index(drop=True), epuisement
+
+def _epuisement(besoins, lots):
+    """Stock et besoin par variété, première semaine où le stock ne suffit plus"""
+    stock = lots.groupby('Code_Variété').agg(Stock_Brut_T=('Dispo', 'sum'), Stock_Net_T=('Net', 'sum'))
+    besoin = besoins.groupby('Code_Variété').agg(Besoin_Net_T=('Net', 'sum'))
+    manque = besoins[besoins['Manquant'] > 0.005].groupby('Code_Variété')['Semaine_Num'].min()
+
+    epuisement = stock.join(besoin, how='outer').fillna(0)
+    epuisement['Semaine_Épuisement'] = manque.reindex(epuisement.index)
+    return epuisement.round(2).reset_index()
+
+def lignes_affectations_sheets(affectations, premier_numero, commentaire='', horodatage=None):
+    """Lignes de l'onglet Affectations (IDs AFF_<n> consécutifs à partir de `premier_numero`)"""
+    horodatage = horodatage or datetime.now().strftime('%Y-%m-%d %H:%M')
+    return [
+        [f'AFF_{premier_numero + i:03d}', horodatage, code, int(debut), str(int(fin)), lot,
+         float(dispo), float(brut), float(ecart), 'Active', 'Streamlit', commentaire]
+        for i, (code, debut, fin, lot, dispo, brut, ecart) in enumerate(zip(
+            affectations['Code_Produit'], affectations['Semaine_Début'], affectations['Semaine_Fin'],
+            affectations['Lot_ID'], affectations['Tonnage_Dispo'], affectations['Tonnage_Brut_Requis'],
+            affectations['Écart_T']))
+    ]
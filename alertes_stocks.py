@@ -0,0 +1,215 @@
+"""
+ALERTES DE STOCK PAR VARIÉTÉ
+Besoin brut (prévisions, taux de déchet) face au stock brut restant, recalcul
+limité aux variétés touchées (sans dépendance Streamlit)
+"""
+
+import threading
+
+import numpy as np
+import pandas as pd
+
+from affectations_lots import taux_dechet
+from moteur_planning import parametre
+
+MANQUE = '❌ MANQUE'
+LIMITE = '⚠️ LIMITE'
+OK = '✅ OK'
+STATUTS = [MANQUE, LIMITE, OK]
+
+# Écart (T) sous lequel une variété couverte passe en LIMITE (Parametres : Seuil_Alerte_T)
+SEUIL_ALERTE_T = 50
+
+COLONNES_ALERTES = ['Code_Variété', 'Besoin_T', 'Stock_T', 'Écart_T', 'Affecté_T', 'Statut', 'Action_Recommandée']
+
+_verrou_registre = threading.Lock()
+_calculs = {}
+
+# =============================================================================
+# AGRÉGATS PAR VARIÉTÉ
+# =============================================================================
+
+def besoin_net_par_variete(data):
+    """Volume prévu (T nettes) par variété, via la variété de chaque produit"""
+    produits = data['Produits'].drop_duplicates('Code_Produit')
+    varietes = pd.Series(produits['Code_Variété'].astype(str).to_numpy(),
+                         index=produits['Code_Produit'].astype(str).to_numpy())
+    previsions = data['Previsions']
+    variete = previsions['Code_Produit'].astype(str).map(varietes)
+    volumes = pd.to_numeric(previsions['Volume_Prévu_T'], errors='coerce').fillna(0)
+    return volumes.groupby(variete.to_numpy()).sum().rename('Besoin_Net_T')
+
+def _lots_reduits(lots):
+    return pd.DataFrame({
+        'Code_Variété': lots['Code_Variété'].astype(str).to_numpy(),
+        'Stock_T': pd.to_numeric(lots['Tonnage_Brut_Restant'], errors='coerce').fillna(0).to_numpy(),
+        'Taux': taux_dechet(lots['Taux_Déchet_Estimé']),
+    })
+
+def _affectations_reduites(affectations, lots):
+    """Tonnage brut réservé par les affectations actives, rattaché à la variété du lot"""
+    actives = affectations[affectations['Statut_Affectation'] == 'Active']
+    variete_lot = pd.Series(lots['Code_Variété'].astype(str).to_numpy(),
+                            index=lots['Lot_ID'].astype(str).to_numpy())
+    variete_lot = variete_lot[~variete_lot.index.duplicated()]
+    return pd.DataFrame({
+        'Code_Variété': actives['Lot_ID'].astype(str).map(variete_lot).fillna('').to_numpy(),
+        'Affecté_T': pd.to_numeric(actives['Tonnage_Brut_Requis'], errors='coerce').fillna(0).to_numpy(),
+    })
+
+def _signatures(reduit):
+    """Empreinte du contenu par variété (somme des empreintes de lignes, ordre indifférent)"""
+    if reduit.empty:
+        return pd.Series(dtype='uint64')
+    empreintes = pd.util.hash_pandas_object(reduit, index=False)
+    return empreintes.groupby(reduit['Code_Variété'].to_numpy()).sum()
+
+def _varietes_modifiees(avant, apres):
+    """Variétés dont l'empreinte a changé, est apparue ou a disparu"""
+    toutes = avant.index.union(apres.index)
+    avant, apres = avant.reindex(toutes), apres.reindex(toutes)
+    return toutes[(avant != apres) | avant.isna() | apres.isna()]
+
+def _stock(lots, varietes=None):
+    """Stock brut, somme et nombre des taux de déchet des lots, par variété"""
+    if varietes is not None:
+        lots = lots[lots['Code_Variété'].isin(varietes)]
+    return lots.groupby('Code_Variété').agg(Stock_T=('Stock_T', 'sum'), _somme_taux=('Taux', 'sum'),
+                                            _nb_lots=('Taux', 'size'))
+
+def _reserve(affectations, varietes=None):
+    if varietes is not None:
+        affectations = affectations[affectations['Code_Variété'].isin(varietes)]
+    return affectations.groupby('Code_Variété')[['Affecté_T']].sum()
+
+def _remplacer(agregat, nouveau, varietes):
+    """Agrégat dont les lignes des `varietes` sont remplacées par `nouveau`"""
+    return pd.concat([agregat[~agregat.index.isin(varietes)], nouveau]).sort_index()
+
+def classer(ecart, seuil=SEUIL_ALERTE_T):
+    """MANQUE si le stock ne couvre pas le besoin, LIMITE si l'écart est sous le seuil, sinon OK"""
+    ecart = np.asarray(ecart, dtype=float)
+    return np.where(ecart < 0, MANQUE, np.where(ecart < seuil, LIMITE, OK))
+
+def _assembler(besoin_net, stock, reserve, taux_varietes, seuil):
+    """Tableau des alertes : besoin brut = besoin net / (1 - taux de déchet de la variété)"""
+    tableau = pd.concat([besoin_net, stock, reserve], axis=1)
+    tableau = tableau[tableau.index != '']
+
+    # Taux de la variété (REF_Variétés), sinon moyenne des lots de la variété
+    taux_lots = tableau['_somme_taux'] / tableau['_nb_lots']
+    taux = taux_varietes.reindex(tableau.index).fillna(taux_lots).fillna(0).clip(upper=0.99)
+
+    besoin = (tableau['Besoin_Net_T'].fillna(0) / (1 - taux)).round(1)
+    stock_t = tableau['Stock_T'].fillna(0).round(1)
+    ecart = (stock_t - besoin).round(1)
+    statut = classer(ecart, seuil)
+
+    alertes = pd.DataFrame({
+        'Code_Variété': tableau.index,
+        'Besoin_T': besoin.to_numpy(),
+        'Stock_T': stock_t.to_numpy(),
+        'Écart_T': ecart.to_numpy(),
+        'Affecté_T': tableau['Affecté_T'].fillna(0).round(1).to_numpy(),
+        'Statut': statut,
+        'Action_Recommandée': np.where(statut == MANQUE, [f'Approvisionner {-e:.0f} T' for e in ecart],
+                                       np.where(statut == LIMITE, 'Surveiller', '')),
+    })
+    return alertes.sort_values(['Écart_T', 'Code_Variété']).reset_index(drop=True)[COLONNES_ALERTES]
+
+def _taux_varietes(data):
+    ref = data.get('REF_Variétés')
+    if ref is None or 'Taux_Déchet_Moyen' not in ref.columns or ref.empty:
+        return pd.Series(dtype=float)
+    ref = ref.drop_duplicates('Code_Variété')
+    taux = pd.Series(taux_dechet(ref['Taux_Déchet_Moyen']), index=ref['Code_Variété'].astype(str).to_numpy())
+    return taux[pd.to_numeric(ref['Taux_Déchet_Moyen'], errors='coerce').notna().to_numpy()]
+
+def calculer_alertes(data):
+    """Alertes de toutes les variétés en un calcul (voir CalculAlertes pour le recalcul partiel)"""
+    return CalculAlertes().calculer(data)
+
+# =============================================================================
+# RECALCUL PARTIEL
+# =============================================================================
+
+class CalculAlertes:
+    """Alertes d'un classeur, recalculées seulement là où les données ont changé
+
+    Avec `versions` ({onglet: version}, voir sync_donnees), un onglet dont la
+    version n'a pas bougé n'est pas relu. Quand Lots ou Affectations changent,
+    seules les variétés dont le contenu diffère (empreinte par variété) sont
+    réagrégées ; Previsions / Produits déclenchent le recalcul du besoin net.
+    """
+
+    ONGLETS = ('Previsions', 'Produits', 'REF_Variétés', 'Lots', 'Affectations', 'Parametres')
+
+    def __init__(self):
+        self.versions = {}
+        self.besoin_net = None
+        self.stock = None
+        self.reserve = None
+        self.signatures_lots = None
+        self.signatures_affectations = None
+        self.taux_varietes = None
+        self.seuil = SEUIL_ALERTE_T
+        self.alertes = None
+        self.varietes_recalculees = []
+        self._verrou = threading.Lock()
+
+    def calculer(self, data, versions=None):
+        with self._verrou:
+            if versions is not None:
+                versions = {o: versions.get(o) for o in self.ONGLETS}
+                if self.alertes is not None and versions == self.versions:
+                    self.varietes_recalculees = []
+                    return self.alertes
+            change = (lambda o: True) if versions is None or self.alertes is None \
+                else (lambda o: versions[o] != self.versions.get(o))
+
+            recalculees = set()
+            if change('Previsions') or change('Produits'):
+                self.besoin_net = besoin_net_par_variete(data)
+                recalculees.update(self.besoin_net.index)
+            if change('REF_Variétés'):
+                self.taux_varietes = _taux_varietes(data)
+                recalculees.update(self.taux_varietes.index)
+            if change('Parametres'):
+                self.seuil = parametre(data, 'Seuil_Alerte_T', SEUIL_ALERTE_T)
+
+            if change('Lots') or change('Affectations'):
+                lots = _lots_reduits(data['Lots'])
+                signatures = _signatures(lots)
+                if self.stock is None:
+                    self.stock = _stock(lots)
+                    modifiees = signatures.index
+                else:
+                    modifiees = _varietes_modifiees(self.signatures_lots, signatures)
+                    self.stock = _remplacer(self.stock, _stock(lots, modifiees), modifiees)
+                self.signatures_lots = signatures
+                recalculees.update(modifiees)
+
+                # Les réservations suivent la variété du lot : elles dépendent aussi de Lots
+                affectations = _affectations_reduites(data['Affectations'], data['Lots'])
+                signatures = _signatures(affectations)
+                if self.reserve is None:
+                    self.reserve = _reserve(affectations)
+                    modifiees = signatures.index
+                else:
+                    modifiees = _varietes_modifiees(self.signatures_affectations, signatures)
+                    self.reserve = _remplacer(self.reserve, _reserve(affectations, modifiees), modifiees)
+                self.signatures_affectations = signatures
+                recalculees.update(modifiees)
+
+            self.alertes = _assembler(self.besoin_net, self.stock, self.reserve, self.taux_varietes, self.seuil)
+            self.varietes_recalculees = sorted(recalculees)
+            if versions is not None:
+                self.versions = versions
+            return self.alertes
+
+def obtenir_calcul_alertes(spreadsheet_id):
+    """Calcul d'alertes unique par classeur pour tout le processus"""
+    with _verrou_registre:
+        if spreadsheet_id not in _calculs:
+            _calculs[spreadsheet_id] = CalculAlertes()
+        return _calculs[spreadsheet_id]
@@ -4,29 +4,36 @@ Version complète prête pour déploiement
 """
 
 import streamlit as st
+from streamlit.runtime.scriptrunner import get_script_run_ctx
 import pandas as pd
 import numpy as np
 from datetime import datetime, timedelta
-import gspread
-from google.oauth2.service_account import Credentials
 import plotly.express as px
 import plotly.graph_objects as go
-from io import BytesIO
+import functools
 import json
 import os
 
-# Tentative d'import du module PDF
-try:
-    from reportlab.lib.pagesizes import A4
-    from reportlab.lib.units import cm
-    from reportlab.lib import colors
-    from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer, PageBreak
-    from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-    from reportlab.lib.enums import TA_CENTER
-    PDF_AVAILABLE = True
-except Exception as e:
-    PDF_AVAILABLE = False
-    print(f"PDF module not available: {e}")
+from gspread.exceptions import NoValidUrlKeyFound
+
+from alertes_stocks import LIMITE, MANQUE, OK, STATUTS, CalculAlertes, obtenir_calcul_alertes
+from affectations_lots import OBJECTIFS, allouer_lots, lignes_affectations_sheets, prochain_numero_affectation
+from documents_pdf import PDF_AVAILABLE, generer_pdf_masse, generer_pdf_of, generer_pdf_ol
+from export_donnees import FORMATS, exporter, formats_disponibles, onglets_exportables
+from file_ecritures import obtenir_file
+from mesures import demarrer_releve, mesurer, releve_courant, statistiques_pages, terminer_releve
+from sheets_io import URL_CLASSEUR, ClasseurDiffere, obtenir_client
+from sheets_local import obtenir_client_local
+from moteur_planning import HEURES_PAR_EQUIPE, SANS_LIGNE, ordonnancer_production, parametre
+from previsions import METHODES, calculer_extrapolation, lignes_previsions_sheets, nouvelles_extrapolations
+from resultats_lavage import acquitter_incertaines, enregistrer_resultat_lavage, resoudre_incertaines
+from scenarios import evaluer_scenarios
+from schema_donnees import memoire_onglets
+from sync_donnees import obtenir_cache, statistiques_caches
+
+# Onglets du cache partagés par toutes les sessions sans copie : une
+# modification faite par une page ne touche que sa propre vue (sync_donnees)
+pd.set_option('mode.copy_on_write', True)
 
 # Configuration page
 st.set_page_config(
@@ -145,144 +152,165 @@ st.markdown("""
 # CONNEXION GOOGLE SHEETS
 # =============================================================================
 
-# Pas de cache pour éviter les problèmes d'auth
-# @st.cache_resource
 def connect_to_sheets():
-    """Connexion à Google Sheets avec gestion d'erreurs améliorée"""
+    """Connexion à Google Sheets, sans requête réseau
+    
+    Retourne la fonction qui crée (ou réutilise) le client partagé par tout
+    le processus (voir sheets_io.obtenir_client : jeton rafraîchi avant
+    expiration, session HTTP réutilisée, client recréé après une erreur
+    d'authentification), ou None si aucune authentification n'est configurée.
+    Elle n'est appelée qu'au premier accès à l'API (voir ClasseurDiffere).
+    PLANNING_CLASSEUR_LOCAL (chemin .xlsx ou .sqlite) remplace Google Sheets
+    par un classeur local (voir sheets_local).
+    """
     try:
+        # Développement / mesures : classeur local à la place de Google Sheets
+        if os.environ.get('PLANNING_CLASSEUR_LOCAL'):
+            return functools.partial(obtenir_client_local, os.environ['PLANNING_CLASSEUR_LOCAL'])
         # Heroku : variables d'environnement
-        if 'GCP_SERVICE_ACCOUNT' in os.environ:
-            service_account_info = json.loads(os.environ['GCP_SERVICE_ACCOUNT'])
-            creds = Credentials.from_service_account_info(
-                service_account_info,
-                scopes=[
-                    "https://www.googleapis.com/auth/spreadsheets",
-                    "https://www.googleapis.com/auth/drive"
-                ]
-            )
-            # Créer un nouveau client gspread à chaque fois
-            gc = gspread.authorize(creds)
-            return gc
+        elif 'GCP_SERVICE_ACCOUNT' in os.environ:
+            service_account_info = lire_service_account_env(os.environ['GCP_SERVICE_ACCOUNT'])
         # Streamlit Cloud : secrets
         elif 'gcp_service_account' in st.secrets:
-            creds = Credentials.from_service_account_info(
-                st.secrets["gcp_service_account"],
-                scopes=[
-                    "https://www.googleapis.com/auth/spreadsheets",
-                    "https://www.googleapis.com/auth/drive"
-                ]
-            )
-            gc = gspread.authorize(creds)
-            return gc
+            service_account_info = dict(st.secrets["gcp_service_account"])
         else:
             st.error("❌ Aucune authentification configurée")
             st.info("💡 Configurez GCP_SERVICE_ACCOUNT dans les variables d'environnement")
             return None
         
+        return functools.partial(obtenir_client, service_account_info)
+        
     except Exception as e:
         st.error(f"Erreur connexion : {e}")
         import traceback
         st.error(traceback.format_exc())
         return None
 
-@st.cache_data(ttl=30)
-def charger_donnees(_gc, sheet_url):
-    """Charge les données depuis Google Sheets"""
+@st.cache_resource
+def lire_service_account_env(contenu_json):
+    """Parse le JSON du service account une seule fois par processus"""
+    return json.loads(contenu_json)
+
+def charger_donnees(spreadsheet, forcer=False):
+    """Charge les données depuis Google Sheets
+    
+    Cache partagé versionné par onglet (voir sync_donnees) : les onglets ne
+    sont relus que si le classeur a changé ou après une écriture locale. Au
+    démarrage, le snapshot local est servi sans attendre la connexion.
+    """
     try:
-        spreadsheet = _gc.open_by_url(sheet_url)
-        
-        data = {}
-        onglets = [
-            'REF_Variétés', 'REF_Lignes', 'Produits', 'Lots', 'Lots_Lavés',
-            'Previsions', 'Affectations', 'Planning_Lavage',
-            'Planning_Production', 'Alerte_Stocks', 'Parametres'
-        ]
-        
-        for onglet in onglets:
-            try:
-                worksheet = spreadsheet.worksheet(onglet)
-                records = worksheet.get_all_records()
-                data[onglet] = pd.DataFrame(records)
-            except:
-                data[onglet] = pd.DataFrame()
-        
-        return data, spreadsheet
+        return obtenir_cache(spreadsheet.id).donnees(spreadsheet, forcer=forcer)
     except Exception as e:
         st.error(f"Erreur chargement : {e}")
-        return None, None
+        return None, {}
+
+def index_planning(spreadsheet, onglet):
+    """Index jour / semaine / ligne de l'onglet de planning, recalculé une fois par version"""
+    return obtenir_cache(spreadsheet.id).index_planning(onglet)
+
+def file_ecritures(spreadsheet):
+    """File d'écritures en arrière-plan du classeur (partagée par les sessions)"""
+    return obtenir_file(spreadsheet.id, cache=obtenir_cache(spreadsheet.id))
+
+@st.fragment(run_every=5)
+def afficher_etat_ecritures(spreadsheet):
+    """État des écritures en arrière-plan, actualisé sans recharger la page"""
+    file = file_ecritures(spreadsheet)
+    etat = file.etat(session=id_session())
+    if not (etat['en_attente'] or etat['valide'] or etat['echec'] or etat['incertain']):
+        return
+    
+    st.caption(f"✍️ Écritures : ⏳ {etat['en_attente']} en attente · "
+               f"✅ {etat['valide']} validées · ❌ {etat['echec']} en échec"
+               + (f" · ❓ {etat['incertain']} incertaine(s)" if etat['incertain'] else ""))
+    for e in etat['echecs']:
+        if e['etat'] == 'incertain':
+            st.warning(f"❓ {e['libelle']} ({e['onglet']}) : {e['message']}")
+        else:
+            st.error(f"{e['libelle']} ({e['onglet']}) : {e['message']}")
+    for e in etat['avertissements']:
+        st.warning(f"{e['libelle']} ({e['onglet']}) : {e['message']}")
+    if not etat['en_attente'] and st.button("🧹 Effacer", key="acquitter_ecritures"):
+        file.acquitter(session=id_session())
+        st.rerun(scope="fragment")
 
 # =============================================================================
-# FONCTIONS MÉTIER
+# MESURES DE PERFORMANCE
 # =============================================================================
 
-def calculer_extrapolation(data):
-    """Calcule S4-S5"""
-    previsions = data['Previsions'].copy()
-    prev_saisies = previsions[previsions['Type_Prévision'] == 'SAISIE']
-    
-    if len(prev_saisies) < 3:
-        return pd.DataFrame()
-    
-    moyennes = prev_saisies.groupby('Code_Produit')['Volume_Prévu_T'].mean().reset_index()
-    semaine_max = int(prev_saisies['Semaine_Num'].max())
-    
-    nouvelles_prev = []
-    for _, row in moyennes.iterrows():
-        for offset, sem in [(7, semaine_max+1), (14, semaine_max+2)]:
-            nouvelles_prev.append({
-                'Semaine_Num': sem,
-                'Code_Produit': row['Code_Produit'],
-                'Volume_Prévu_T': round(row['Volume_Prévu_T'], 2),
-                'Type_Prévision': 'EXTRAPOLÉE'
-            })
-    
-    return pd.DataFrame(nouvelles_prev)
+def id_session():
+    ctx = get_script_run_ctx()
+    return ctx.session_id if ctx else None
 
-def generer_planning_production(data):
-    """Génère le planning production"""
-    previsions = data['Previsions'].copy()
-    produits = data['Produits'].copy()
-    lignes = data['REF_Lignes'][data['REF_Lignes']['Type'] == 'Production'].copy()
-    
-    planning = []
-    of_id = 1
-    
-    for semaine in sorted(previsions['Semaine_Num'].unique()):
-        prev_sem = previsions[previsions['Semaine_Num'] == semaine]
-        
-        for _, prev in prev_sem.iterrows():
-            produit = produits[produits['Code_Produit'] == prev['Code_Produit']]
-            if len(produit) == 0:
-                continue
-            
-            ligne_aff = produit['Ligne_Affectée'].iloc[0]
-            if pd.isna(ligne_aff) or ligne_aff == '':
-                continue
-            
-            ligne = lignes[lignes['Code_Ligne'] == ligne_aff]
-            if len(ligne) == 0:
-                continue
-            
-            cadence = ligne['Capacité_T_h'].iloc[0]
-            nb_equipes = ligne['Nb_Équipes'].iloc[0]
-            
-            volume_jour = prev['Volume_Prévu_T'] / 5
-            volume_equipe = volume_jour / nb_equipes
-            
-            for jour_idx in range(5):
-                for equipe in range(1, nb_equipes + 1):
-                    planning.append({
-                        'OF_ID': f'OF_{of_id:03d}',
-                        'Semaine': int(semaine),
-                        'Jour': jour_idx + 1,
-                        'Équipe': f'Équipe_{equipe}' if nb_equipes > 1 else 'Unique',
-                        'Ligne': ligne_aff,
-                        'Produit': prev['Code_Produit'],
-                        'Tonnage': round(volume_equipe, 2)
-                    })
-                    of_id += 1
-    
-    return pd.DataFrame(planning)
+def fragment(fonction):
+    """st.fragment : un widget de la fonction ne relance qu'elle, pas tout le script
+    
+    Les arguments (données chargées comprises) sont ceux de la dernière
+    exécution complète : une relance partielle ne reconnecte ni ne recharge
+    rien. Relancée seule, la fonction a son propre relevé de mesures.
+    """
+    @functools.wraps(fonction)
+    def mesuree(*args, **kwargs):
+        if releve_courant() is not None:
+            return fonction(*args, **kwargs)
+        releve = demarrer_releve(f"fragment {fonction.__name__}", session=id_session())
+        try:
+            return fonction(*args, **kwargs)
+        finally:
+            terminer_releve(releve)
+    return st.fragment(mesuree)
+
+def afficher_graphique(fig):
+    """st.plotly_chart chronométré (sérialisation + envoi de la figure)"""
+    with mesurer('graphique', fig.layout.title.text or 'Plotly'):
+        st.plotly_chart(fig, use_container_width=True)
+
+def afficher_mesures(releve):
+    """Panneau de debug : temps par étape et appels externes de cette exécution"""
+    mesures = releve.vers_dict()
+    appels = mesures['appels']
+    
+    st.sidebar.metric("⏱️ Exécution", f"{mesures['total_s']:.2f} s",
+                      f"dont {mesures['appels_s']:.2f} s d'appels Sheets", delta_color="off")
+    st.sidebar.caption(f"{sum(a['nombre'] for a in appels.values())} appels · "
+                       f"{sum(a['octets_envoyes'] for a in appels.values()) / 1024:.1f} Ko envoyés · "
+                       f"{sum(a['octets_recus'] for a in appels.values()) / 1024:.1f} Ko reçus")
+    
+    if mesures['etapes']:
+        st.sidebar.dataframe(pd.DataFrame([
+            {'Étape': '· ' * e['niveau'] + e['nom'], 'Type': e['categorie'], 'Secondes': e['secondes']}
+            for e in mesures['etapes']
+        ]), hide_index=True, use_container_width=True)
+    
+    if appels:
+        st.sidebar.dataframe(pd.DataFrame([
+            {'Appel': nom, 'Nombre': a['nombre'], 'Secondes': round(a['secondes'], 3),
+             'Ko reçus': round(a['octets_recus'] / 1024, 1)}
+            for nom, a in appels.items()
+        ]), hide_index=True, use_container_width=True)
+    
+    with st.sidebar.expander("Toutes les sessions (ce processus)"):
+        stats = statistiques_pages()
+        if stats:
+            st.dataframe(pd.DataFrame.from_dict(stats, orient='index'), use_container_width=True)
+
+    with st.sidebar.expander("Cache partagé des données (ce processus)"):
+        caches = statistiques_caches()
+        if caches:
+            st.dataframe(pd.DataFrame.from_dict(caches, orient='index'), use_container_width=True)
+            st.caption("servies : sans appel · lectures : menées par une session · "
+                       "regroupees : sessions ayant attendu une lecture en cours")
+
+    with st.sidebar.expander("Mémoire par onglet (schéma typé)"):
+        memoire = memoire_onglets()
+        if memoire:
+            st.dataframe(pd.DataFrame([
+                {'Onglet': onglet, 'Lignes': m['lignes'],
+                 'Ko avant': round(m['octets_avant'] / 1024, 1),
+                 'Ko après': round(m['octets_apres'] / 1024, 1),
+                 'Non typées': ', '.join(m['non_converties'])}
+                for onglet, m in memoire.items()
+            ]), hide_index=True, use_container_width=True)
 
 # =============================================================================
 # SIDEBAR NAVIGATION
@@ -302,6 +330,7 @@ def sidebar_navigation():
             "🧼 Planning Lavage",
             "🧼 Ordres de Lavage",
             "🏭 Planning Production",
+            "🧪 Scénarios",
             "📋 Ordres de Fabrication",
             "⚠️ Alertes Stocks",
             "💾 Export"
@@ -316,7 +345,14 @@ def sidebar_navigation():
 # PAGE : ACCUEIL
 # =============================================================================
 
-def page_accueil(data):
+def alertes_stocks(data, spreadsheet):
+    """Alertes calculées dans l'application (recalcul limité aux variétés modifiées)"""
+    cache = obtenir_cache(spreadsheet.id)
+    versions = {onglet: cache.version(onglet) for onglet in CalculAlertes.ONGLETS}
+    with mesurer('calcul', 'alertes de stock'):
+        return obtenir_calcul_alertes(spreadsheet.id).calculer(data, versions)
+
+def page_accueil(data, spreadsheet):
     st.markdown('<div class="main-header">🥔 PLANNING PRODUCTION - TABLEAU DE BORD</div>', unsafe_allow_html=True)
     
     # KPIs
@@ -350,10 +386,10 @@ def page_accueil(data):
     with col1:
         st.markdown("### 📊 Stocks par variété")
         if len(data['Lots']) > 0:
-            stocks = data['Lots'].groupby('Code_Variété')['Tonnage_Brut_Restant'].sum().reset_index()
+            stocks = data['Lots'].groupby('Code_Variété', observed=True)['Tonnage_Brut_Restant'].sum().reset_index()
             fig = px.bar(stocks, x='Code_Variété', y='Tonnage_Brut_Restant',
                         title='Tonnage disponible')
-            st.plotly_chart(fig, use_container_width=True)
+            afficher_graphique(fig)
         else:
             st.info("Aucun lot")
     
@@ -363,16 +399,16 @@ def page_accueil(data):
             prev_sem = data['Previsions'].groupby('Semaine_Num')['Volume_Prévu_T'].sum().reset_index()
             fig = px.line(prev_sem, x='Semaine_Num', y='Volume_Prévu_T',
                          markers=True, title='Évolution des volumes')
-            st.plotly_chart(fig, use_container_width=True)
+            afficher_graphique(fig)
         else:
             st.info("Aucune prévision")
     
     # Alertes
     st.markdown("### ⚠️ Alertes")
-    alertes = data.get('Alerte_Stocks', pd.DataFrame())
+    alertes = alertes_stocks(data, spreadsheet)
     
     if len(alertes) > 0:
-        critiques = alertes[alertes['Statut'].str.contains('MANQUE', na=False)]
+        critiques = alertes[alertes['Statut'] == MANQUE]
         if len(critiques) > 0:
             st.error(f"❌ {len(critiques)} variété(s) en manque")
             st.dataframe(critiques[['Code_Variété', 'Écart_T', 'Action_Recommandée']], 
@@ -380,7 +416,7 @@ def page_accueil(data):
         else:
             st.success("✅ Tous les stocks sont OK")
     else:
-        st.info("Aucune alerte générée")
+        st.info("Aucune variété en stock ou en prévision")
 
 # =============================================================================
 # PAGE : DONNÉES
@@ -415,41 +451,46 @@ def page_donnees(data):
     with tab4:
         st.markdown("### Lots")
         if len(data['Lots']) > 0:
-            # Filtres
-            col1, col2, col3 = st.columns(3)
-            
-            with col1:
-                varietes = ['Toutes'] + list(data['Lots']['Code_Variété'].unique())
-                var_select = st.selectbox("Variété", varietes)
-            
-            with col2:
-                types = ['Tous'] + list(data['Lots']['Type_Lot'].unique())
-                type_select = st.selectbox("Type", types)
-            
-            with col3:
-                statuts = ['Tous'] + list(data['Lots']['Statut'].unique())
-                statut_select = st.selectbox("Statut", statuts)
-            
-            lots = data['Lots'].copy()
-            
-            if var_select != 'Toutes':
-                lots = lots[lots['Code_Variété'] == var_select]
-            if type_select != 'Tous':
-                lots = lots[lots['Type_Lot'] == type_select]
-            if statut_select != 'Tous':
-                lots = lots[lots['Statut'] == statut_select]
-            
-            st.dataframe(lots, use_container_width=True)
-            
-            # Stats
-            col1, col2 = st.columns(2)
-            with col1:
-                st.metric("Lots affichés", len(lots))
-            with col2:
-                st.metric("Tonnage total", f"{lots['Tonnage_Brut_Restant'].sum():.1f}T")
+            filtres_lots(data['Lots'])
         else:
             st.warning("Aucun lot")
 
+@fragment
+def filtres_lots(lots_tous):
+    """Filtres de l'onglet Lots : seule cette partie est relancée à chaque choix"""
+    # Filtres
+    col1, col2, col3 = st.columns(3)
+    
+    with col1:
+        varietes = ['Toutes'] + list(lots_tous['Code_Variété'].unique())
+        var_select = st.selectbox("Variété", varietes)
+    
+    with col2:
+        types = ['Tous'] + list(lots_tous['Type_Lot'].unique())
+        type_select = st.selectbox("Type", types)
+    
+    with col3:
+        statuts = ['Tous'] + list(lots_tous['Statut'].unique())
+        statut_select = st.selectbox("Statut", statuts)
+    
+    lots = lots_tous
+    
+    if var_select != 'Toutes':
+        lots = lots[lots['Code_Variété'] == var_select]
+    if type_select != 'Tous':
+        lots = lots[lots['Type_Lot'] == type_select]
+    if statut_select != 'Tous':
+        lots = lots[lots['Statut'] == statut_select]
+    
+    st.dataframe(lots, use_container_width=True)
+    
+    # Stats
+    col1, col2 = st.columns(2)
+    with col1:
+        st.metric("Lots affichés", len(lots))
+    with col2:
+        st.metric("Tonnage total", f"{lots['Tonnage_Brut_Restant'].sum():.1f}T")
+
 # =============================================================================
 # PAGE : PRÉVISIONS
 # =============================================================================
@@ -457,7 +498,7 @@ def page_donnees(data):
 def page_previsions(data, spreadsheet):
     st.markdown('<div class="main-header">📈 PRÉVISIONS & EXTRAPOLATION</div>', unsafe_allow_html=True)
     
-    tab1, tab2 = st.tabs(["📊 Prévisions actuelles", "🔮 Extrapoler S4-S5"])
+    tab1, tab2 = st.tabs(["📊 Prévisions actuelles", "🔮 Extrapoler"])
     
     with tab1:
         if len(data['Previsions']) > 0:
@@ -466,45 +507,65 @@ def page_previsions(data, spreadsheet):
             # Graphique
             fig = px.bar(data['Previsions'], x='Semaine_Num', y='Volume_Prévu_T',
                         color='Code_Produit', title='Prévisions par produit')
-            st.plotly_chart(fig, use_container_width=True)
+            afficher_graphique(fig)
         else:
             st.warning("Aucune prévision")
     
     with tab2:
-        st.info("📌 Calcule la moyenne S1-S3 pour générer S4-S5")
-        
-        if st.button("🔮 Calculer extrapolation", type="primary"):
-            with st.spinner("Calcul..."):
-                df_extrap = calculer_extrapolation(data)
-                
-                if len(df_extrap) > 0:
-                    st.success("✅ Extrapolations calculées")
-                    st.dataframe(df_extrap, use_container_width=True)
+        extrapolation_previsions(data, spreadsheet)
+
+@fragment
+def extrapolation_previsions(data, spreadsheet):
+    """Calcul et écriture des extrapolations (relancé seul à chaque réglage)"""
+    st.info("📌 Projette les prévisions saisies sur les semaines suivantes")
+    
+    col1, col2 = st.columns(2)
+    with col1:
+        methode = st.selectbox("Méthode", list(METHODES.keys()), format_func=METHODES.get)
+    with col2:
+        horizon = st.number_input("Horizon (semaines)", 1, 12, 2)
+    
+    if methode == 'lissage_exponentiel':
+        alpha = st.slider("Coefficient de lissage α", 0.05, 0.95, 0.5, 0.05)
+    else:
+        alpha = 0.5
+    
+    if st.button("🔮 Calculer extrapolation", type="primary"):
+        with st.spinner("Calcul..."):
+            # Conservé en session : le bouton d'écriture provoque un nouveau rerun
+            st.session_state['extrapolation'] = calculer_extrapolation(
+                data, methode=methode, horizon=int(horizon), alpha=alpha
+            )
+    
+    df_extrap = st.session_state.get('extrapolation')
+    
+    if df_extrap is not None:
+        if len(df_extrap) > 0:
+            st.success(f"✅ {len(df_extrap)} extrapolations calculées")
+            st.dataframe(df_extrap, use_container_width=True)
+    
+            if st.button("✅ Écrire dans Google Sheets"):
+                try:
+                    # Couples (semaine, produit) déjà dans Previsions écartés : un
+                    # second clic ou un nouveau calcul n'ajoute pas de doublons
+                    nouvelles = nouvelles_extrapolations(data, df_extrap)
+                    del st.session_state['extrapolation']
+                    if len(nouvelles) == 0:
+                        st.info("Extrapolations déjà présentes dans Previsions")
+                        return
                     
-                    if st.button("✅ Écrire dans Google Sheets"):
-                        try:
-                            worksheet = spreadsheet.worksheet('Previsions')
-                            
-                            # Ajouter les extrapolations
-                            for _, row in df_extrap.iterrows():
-                                nouvelle_ligne = [
-                                    int(row['Semaine_Num']),
-                                    '', # Date_Debut à compléter
-                                    row['Code_Produit'],
-                                    float(row['Volume_Prévu_T']),
-                                    'EXTRAPOLÉE',
-                                    'Prévisionnel',
-                                    '', '', '', ''
-                                ]
-                                worksheet.append_row(nouvelle_ligne)
-                            
-                            st.success("✅ Extrapolations écrites dans Google Sheets")
-                            st.cache_data.clear()
-                            st.rerun()
-                        except Exception as e:
-                            st.error(f"❌ Erreur : {e}")
-                else:
-                    st.error("Moins de 3 semaines de prévisions")
+                    # Toutes les lignes en une seule requête, envoyée en arrière-plan
+                    lignes = lignes_previsions_sheets(nouvelles)
+                    file_ecritures(spreadsheet).ajouter(
+                        spreadsheet, 'Previsions', lignes, f"{len(lignes)} extrapolations", session=id_session()
+                    )
+                    obtenir_cache(spreadsheet.id).ajouter_lignes_locales('Previsions', lignes)
+    
+                    st.rerun()
+                except Exception as e:
+                    st.error(f"❌ Erreur : {e}")
+        else:
+            st.error("Moins de 3 semaines de prévisions")
 
 # =============================================================================
 # PAGE : AFFECTATIONS
@@ -513,239 +574,433 @@ def page_previsions(data, spreadsheet):
 def page_affectations(data, spreadsheet):
     st.markdown('<div class="main-header">🎯 AFFECTATIONS LOTS → PRODUITS</div>', unsafe_allow_html=True)
     
-    tab1, tab2 = st.tabs(["➕ Créer", "📋 Voir"])
+    tab1, tab2, tab3 = st.tabs(["➕ Créer", "📋 Voir", "⚡ Allocation en masse"])
     
     with tab1:
-        st.markdown("### Nouvelle affectation")
-        
-        col1, col2 = st.columns(2)
-        
-        with col1:
-            produits = data['Produits'][data['Produits']['Actif'] == 'OUI']
-            produit = st.selectbox("Produit", produits['Code_Produit'].tolist())
-            
-            semaine_debut = st.number_input("Semaine début", 1, 53, 47)
-            
-            epuisement = st.checkbox("Jusqu'à épuisement")
-            if epuisement:
-                semaine_fin = "*"
-            else:
-                semaine_fin = st.number_input("Semaine fin", int(semaine_debut), 53, 50)
-        
-        with col2:
-            if produit:
-                var_req = produits[produits['Code_Produit'] == produit]['Code_Variété'].iloc[0]
-                st.info(f"🌱 Variété requise: {var_req}")
-                
-                lots_comp = data['Lots'][
-                    (data['Lots']['Code_Variété'] == var_req) &
-                    (data['Lots']['Tonnage_Brut_Restant'] > 0)
-                ]
-                
-                if len(lots_comp) > 0:
-                    lot = st.selectbox("Lot", lots_comp['Lot_ID'].tolist())
-                    
-                    if st.button("✅ Créer l'affectation", type="primary"):
-                        try:
-                            # Calculer les données
-                            lot_data = data['Lots'][data['Lots']['Lot_ID'] == lot].iloc[0]
-                            previsions = data['Previsions'].copy()
-                            
-                            if semaine_fin == "*":
-                                prev_periode = previsions[
-                                    (previsions['Code_Produit'] == produit) &
-                                    (previsions['Semaine_Num'] >= semaine_debut)
-                                ]
-                                semaine_fin_texte = "Épuisement"
-                            else:
-                                prev_periode = previsions[
-                                    (previsions['Code_Produit'] == produit) &
-                                    (previsions['Semaine_Num'] >= semaine_debut) &
-                                    (previsions['Semaine_Num'] <= int(semaine_fin))
-                                ]
-                                semaine_fin_texte = str(int(semaine_fin))
-                            
-                            tonnage_net = prev_periode['Volume_Prévu_T'].sum() if len(prev_periode) > 0 else 0
-                            taux_dechet = lot_data['Taux_Déchet_Estimé']
-                            
-                            if taux_dechet > 1:
-                                taux_dechet = taux_dechet / 100
-                            
-                            tonnage_brut = tonnage_net / (1 - taux_dechet) if tonnage_net > 0 else 0
-                            tonnage_dispo = lot_data['Tonnage_Brut_Restant']
-                            ecart = tonnage_dispo - tonnage_brut
-                            
-                            # Générer ID
-                            affectations = data['Affectations']
-                            if len(affectations) == 0:
-                                nouvel_id = 'AFF_001'
-                            else:
-                                dernier_id = affectations['ID_Affectation'].max()
-                                if pd.isna(dernier_id) or dernier_id == '':
-                                    nouvel_id = 'AFF_001'
-                                else:
-                                    numero = int(dernier_id.split('_')[1]) + 1
-                                    nouvel_id = f'AFF_{numero:03d}'
-                            
-                            # Écrire dans Google Sheets
-                            try:
-                                worksheet = spreadsheet.worksheet('Affectations')
-                                nouvelle_ligne = [
-                                    nouvel_id,
-                                    datetime.now().strftime('%Y-%m-%d %H:%M'),
-                                    produit,
-                                    int(semaine_debut),
-                                    semaine_fin_texte,
-                                    lot,
-                                    float(tonnage_dispo),
-                                    float(tonnage_brut),
-                                    float(ecart),
-                                    'Active',
-                                    'Streamlit',
-                                    ''
-                                ]
-                                worksheet.append_row(nouvelle_ligne, value_input_option='USER_ENTERED')
-                                
-                                st.success(f"✅ Affectation {nouvel_id} créée dans Google Sheets")
-                                st.cache_data.clear()
-                                st.rerun()
-                            
-                            except Exception as write_error:
-                                st.error(f"❌ Erreur écriture Google Sheets : {write_error}")
-                                st.info("💡 Essayez de recharger la page ou vérifiez les permissions du service account")
-                                # Afficher quand même les données calculées
-                                st.json({
-                                    'ID': nouvel_id,
-                                    'Produit': produit,
-                                    'Lot': lot,
-                                    'Tonnage_Brut': tonnage_brut,
-                                    'Tonnage_Dispo': tonnage_dispo,
-                                    'Écart': ecart
-                                })
-                            
-                        except Exception as e:
-                            st.error(f"❌ Erreur calcul : {e}")
-                else:
-                    st.warning("Aucun lot compatible")
+        creation_affectation(data, spreadsheet)
     
     with tab2:
         if len(data['Affectations']) > 0:
             st.dataframe(data['Affectations'], use_container_width=True)
         else:
             st.info("Aucune affectation")
+    
+    with tab3:
+        allocation_en_masse(data, spreadsheet)
+
+@fragment
+def creation_affectation(data, spreadsheet):
+    """Formulaire d'affectation d'un lot à un produit (relancé seul à chaque choix)"""
+    st.markdown("### Nouvelle affectation")
+    
+    col1, col2 = st.columns(2)
+    
+    with col1:
+        produits = data['Produits'][data['Produits']['Actif'] == 'OUI']
+        produit = st.selectbox("Produit", produits['Code_Produit'].tolist())
+    
+        semaine_debut = st.number_input("Semaine début", 1, 53, 47)
+    
+        epuisement = st.checkbox("Jusqu'à épuisement")
+        if epuisement:
+            semaine_fin = "*"
+        else:
+            semaine_fin = st.number_input("Semaine fin", int(semaine_debut), 53, 50)
+    
+    with col2:
+        if produit:
+            var_req = produits[produits['Code_Produit'] == produit]['Code_Variété'].iloc[0]
+            st.info(f"🌱 Variété requise: {var_req}")
+    
+            lots_comp = data['Lots'][
+                (data['Lots']['Code_Variété'] == var_req) &
+                (data['Lots']['Tonnage_Brut_Restant'] > 0)
+            ]
+    
+            if len(lots_comp) > 0:
+                lot = st.selectbox("Lot", lots_comp['Lot_ID'].tolist())
+    
+                if st.button("✅ Créer l'affectation", type="primary"):
+                    try:
+                        # Calculer les données
+                        lot_data = data['Lots'][data['Lots']['Lot_ID'] == lot].iloc[0]
+                        previsions = data['Previsions']
+    
+                        if semaine_fin == "*":
+                            prev_periode = previsions[
+                                (previsions['Code_Produit'] == produit) &
+                                (previsions['Semaine_Num'] >= semaine_debut)
+                            ]
+                            semaine_fin_texte = "Épuisement"
+                        else:
+                            prev_periode = previsions[
+                                (previsions['Code_Produit'] == produit) &
+                                (previsions['Semaine_Num'] >= semaine_debut) &
+                                (previsions['Semaine_Num'] <= int(semaine_fin))
+                            ]
+                            semaine_fin_texte = str(int(semaine_fin))
+    
+                        tonnage_net = prev_periode['Volume_Prévu_T'].sum() if len(prev_periode) > 0 else 0
+                        taux_dechet = lot_data['Taux_Déchet_Estimé']
+    
+                        if taux_dechet > 1:
+                            taux_dechet = taux_dechet / 100
+    
+                        tonnage_brut = tonnage_net / (1 - taux_dechet) if tonnage_net > 0 else 0
+                        tonnage_dispo = lot_data['Tonnage_Brut_Restant']
+                        ecart = tonnage_dispo - tonnage_brut
+    
+                        # Générer ID
+                        nouvel_id = f"AFF_{prochain_numero_affectation(data['Affectations']):03d}"
+    
+                        # Écrire dans Google Sheets (en arrière-plan)
+                        try:
+                            nouvelle_ligne = [
+                                nouvel_id,
+                                datetime.now().strftime('%Y-%m-%d %H:%M'),
+                                produit,
+                                int(semaine_debut),
+                                semaine_fin_texte,
+                                lot,
+                                float(tonnage_dispo),
+                                float(tonnage_brut),
+                                float(ecart),
+                                'Active',
+                                'Streamlit',
+                                ''
+                            ]
+                            file_ecritures(spreadsheet).ajouter(
+                                spreadsheet, 'Affectations', [nouvelle_ligne],
+                                f"Affectation {nouvel_id}", value_input_option='USER_ENTERED',
+                                session=id_session()
+                            )
+                            # Visible tout de suite : l'ID suivant tient compte de cette ligne
+                            obtenir_cache(spreadsheet.id).ajouter_lignes_locales('Affectations', [nouvelle_ligne])
+                            st.rerun()
+    
+                        except Exception as write_error:
+                            st.error(f"❌ Erreur écriture Google Sheets : {write_error}")
+                            st.info("💡 Essayez de recharger la page ou vérifiez les permissions du service account")
+                            # Afficher quand même les données calculées
+                            st.json({
+                                'ID': nouvel_id,
+                                'Produit': produit,
+                                'Lot': lot,
+                                'Tonnage_Brut': tonnage_brut,
+                                'Tonnage_Dispo': tonnage_dispo,
+                                'Écart': ecart
+                            })
+    
+                    except Exception as e:
+                        st.error(f"❌ Erreur calcul : {e}")
+            else:
+                st.warning("Aucun lot compatible")
+
+@fragment
+def allocation_en_masse(data, spreadsheet):
+    """Affectation de tous les produits actifs sur toutes les semaines prévues, en une passe"""
+    st.markdown("### Allocation des lots à tous les produits actifs")
+    
+    col1, col2 = st.columns(2)
+    
+    with col1:
+        semaine_debut = st.number_input("Semaine début", 1, 53, 47, key="masse_semaine_debut")
+        epuisement = st.checkbox("Jusqu'à épuisement (toutes les semaines prévues)", value=True,
+                                 key="masse_epuisement")
+        semaine_fin = None if epuisement else st.number_input(
+            "Semaine fin", int(semaine_debut), 53, 50, key="masse_semaine_fin")
+    
+    with col2:
+        objectif = st.radio("Ordre des lots", list(OBJECTIFS), format_func=OBJECTIFS.get)
+        exclure = st.checkbox("Ignorer les besoins déjà couverts par une affectation active", value=True)
+    
+    if st.button("⚡ Calculer l'allocation", type="primary"):
+        with mesurer('calcul', f"allocation des lots ({objectif})"):
+            st.session_state['allocation_masse'] = allouer_lots(
+                data, int(semaine_debut), None if semaine_fin is None else int(semaine_fin), objectif,
+                exclure_affectes=exclure, deduire_reserves=exclure)
+    
+    if 'allocation_masse' not in st.session_state:
+        return
+    
+    affectations, non_couverts, epuisement_varietes = st.session_state['allocation_masse']
+    
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        st.metric("Affectations", len(affectations))
+    with col2:
+        st.metric("Tonnage brut affecté", f"{affectations['Tonnage_Brut_Requis'].sum():.0f}T")
+    with col3:
+        st.metric("Besoins non couverts", len(non_couverts),
+                  f"{non_couverts['Manquant'].sum():.0f}T nettes", delta_color="inverse")
+    
+    st.markdown("#### Épuisement du stock par variété")
+    st.dataframe(epuisement_varietes, hide_index=True, use_container_width=True)
+    
+    st.markdown("#### Affectations proposées")
+    st.dataframe(affectations, hide_index=True, use_container_width=True)
+    
+    if len(non_couverts) > 0:
+        with st.expander(f"⚠️ {len(non_couverts)} besoins non couverts"):
+            st.dataframe(non_couverts, hide_index=True, use_container_width=True)
+    
+    if len(affectations) > 0 and st.button(f"✅ Écrire les {len(affectations)} affectations"):
+        lignes = lignes_affectations_sheets(affectations, prochain_numero_affectation(data['Affectations']),
+                                            commentaire=f"Allocation en masse ({objectif})")
+        # Un seul ajout pour toutes les lignes (en arrière-plan)
+        file_ecritures(spreadsheet).ajouter(
+            spreadsheet, 'Affectations', lignes,
+            f"{len(lignes)} affectations en masse", value_input_option='USER_ENTERED',
+            session=id_session()
+        )
+        obtenir_cache(spreadsheet.id).ajouter_lignes_locales('Affectations', lignes)
+        del st.session_state['allocation_masse']
+        st.rerun()
 
 # =============================================================================
 # PAGE : PLANNING PRODUCTION
 # =============================================================================
 
-def page_planning_production(data):
+def page_planning_production(data, spreadsheet):
     st.markdown('<div class="main-header">🏭 PLANNING PRODUCTION</div>', unsafe_allow_html=True)
     
     if len(data['Planning_Production']) > 0:
-        planning = data['Planning_Production'].copy()
+        planning_production_filtre(index_planning(spreadsheet, 'Planning_Production'))
+    else:
+        st.info("Aucun planning généré")
+        st.info("💡 Créez des affectations et exécutez le workflow Colab")
+    
+    ordonnancement_capacite(data)
+
+@fragment
+def planning_production_filtre(index):
+    """Filtres, statistiques et graphique : seule cette partie est relancée à chaque choix"""
+    # Filtres
+    col1, col2 = st.columns(2)
+    
+    with col1:
+        sem_select = st.selectbox("Semaine", ['Toutes'] + index.semaines)
+    
+    with col2:
+        ligne_select = st.selectbox("Ligne", ['Toutes'] + index.lignes)
+    
+    # Filtrer (groupes précalculés, voir index_planning)
+    planning = index.selection(None if sem_select == 'Toutes' else sem_select,
+                               None if ligne_select == 'Toutes' else ligne_select)
+    
+    st.dataframe(planning, use_container_width=True)
+    
+    # Stats
+    st.markdown("### Statistiques")
+    col1, col2, col3 = st.columns(3)
+    
+    with col1:
+        st.metric("OF total", len(planning))
+    with col2:
+        st.metric("Tonnage total", f"{planning['Tonnage_Planifié'].sum():.0f}T")
+    with col3:
+        st.metric("Lignes utilisées", planning['Ligne_Prod'].nunique())
+    
+    # Graphique
+    stats_ligne = planning.groupby('Ligne_Prod', observed=True)['Tonnage_Planifié'].sum().reset_index()
+    fig = px.bar(stats_ligne, x='Ligne_Prod', y='Tonnage_Planifié',
+                title='Charge par ligne')
+    afficher_graphique(fig)
+
+@fragment
+def ordonnancement_capacite(data):
+    """Ordonnancement des prévisions sur les lignes sous capacité (Capacité_T_h, équipes)"""
+    with st.expander("⚙️ Ordonnancement sous capacité"):
+        st.caption("OF découpés par équipe avec heures de début / fin ; "
+                   "le tonnage qui dépasse la capacité d'une ligne sur la semaine est signalé")
         
-        # Filtres
         col1, col2 = st.columns(2)
-        
         with col1:
-            semaines = ['Toutes'] + sorted(planning['Semaine_Num'].unique().tolist())
-            sem_select = st.selectbox("Semaine", semaines)
-        
+            annee = st.number_input("Année des semaines", 2020, 2100, datetime.now().year)
         with col2:
-            lignes = ['Toutes'] + list(planning['Ligne_Prod'].unique())
-            ligne_select = st.selectbox("Ligne", lignes)
+            heures = st.number_input("Heures par équipe", 1.0, 12.0,
+                                     float(parametre(data, 'Heures_Par_Équipe', HEURES_PAR_EQUIPE)))
         
-        # Filtrer
-        if sem_select != 'Toutes':
-            planning = planning[planning['Semaine_Num'] == sem_select]
-        if ligne_select != 'Toutes':
-            planning = planning[planning['Ligne_Prod'] == ligne_select]
+        if not st.button("⚙️ Ordonnancer", key="ordonnancer"):
+            return
         
-        st.dataframe(planning, use_container_width=True)
+        with mesurer('calcul', 'ordonnancement sous capacité'):
+            planning, charge = ordonnancer_production(data, annee=int(annee), heures_par_equipe=heures)
         
-        # Stats
-        st.markdown("### Statistiques")
-        col1, col2, col3 = st.columns(3)
+        if len(planning) == 0 and len(charge) == 0:
+            st.info("Aucune prévision à ordonnancer")
+            return
         
+        surcharges = charge[charge['Tonnage_Non_Planifié'] > 0]
+        col1, col2, col3 = st.columns(3)
         with col1:
-            st.metric("OF total", len(planning))
+            st.metric("OF", len(planning))
         with col2:
-            st.metric("Tonnage total", f"{planning['Tonnage_Planifié'].sum():.0f}T")
+            st.metric("Tonnage planifié", f"{planning['Tonnage_Planifié'].sum():.0f}T")
         with col3:
-            st.metric("Lignes utilisées", planning['Ligne_Prod'].nunique())
+            st.metric("Semaines-lignes surchargées", len(surcharges),
+                      f"{surcharges['Tonnage_Non_Planifié'].sum():.0f}T non planifiées", delta_color="inverse")
         
-        # Graphique
-        stats_ligne = planning.groupby('Ligne_Prod')['Tonnage_Planifié'].sum().reset_index()
-        fig = px.bar(stats_ligne, x='Ligne_Prod', y='Tonnage_Planifié',
-                    title='Charge par ligne')
-        st.plotly_chart(fig, use_container_width=True)
+        if len(surcharges) > 0:
+            st.warning("⚠️ Capacité dépassée")
+            st.dataframe(surcharges, hide_index=True, use_container_width=True)
+        
+        fig = px.bar(charge[charge['Ligne_Prod'] != SANS_LIGNE], x='Semaine_Num', y='Taux_Charge',
+                     color='Ligne_Prod', barmode='group', title='Taux de charge par ligne et semaine')
+        afficher_graphique(fig)
+        
+        st.dataframe(planning, hide_index=True, use_container_width=True)
+
+# =============================================================================
+# PAGE : SCÉNARIOS
+# =============================================================================
+
+def scenarios_depuis_tableau(tableau):
+    """Lignes du tableau de saisie -> scénarios (voir scenarios.CLES_SCENARIO)"""
+    liste = []
+    for _, ligne in tableau.iterrows():
+        nom = str(ligne['Nom']).strip() if pd.notna(ligne['Nom']) else ''
+        if not nom:
+            continue
+        scenario = {'nom': nom}
+        if pd.notna(ligne['Prévisions_%']) and ligne['Prévisions_%'] != 0:
+            scenario['facteur_previsions'] = 1 + ligne['Prévisions_%'] / 100
+        code_ligne = ligne['Ligne'] if pd.notna(ligne['Ligne']) else ''
+        if code_ligne and pd.notna(ligne['Nb_Équipes']):
+            scenario['equipes'] = {code_ligne: int(ligne['Nb_Équipes'])}
+        if code_ligne and pd.notna(ligne['Capacité_T_h']):
+            scenario['capacites'] = {code_ligne: float(ligne['Capacité_T_h'])}
+        lots = [l.strip() for l in str(ligne['Lots_Déclassés'] if pd.notna(ligne['Lots_Déclassés']) else '').split(',')
+                if l.strip()]
+        if lots:
+            scenario['lots_declasses'] = lots
+        liste.append(scenario)
+    return liste
+
+@fragment
+def page_scenarios(data):
+    st.markdown('<div class="main-header">🧪 SCÉNARIOS</div>', unsafe_allow_html=True)
+    st.caption("Chaque ligne est une hypothèse comparée à la situation actuelle (Référence) ; "
+               "rien n'est écrit dans le classeur")
+    
+    lignes = data['REF_Lignes']
+    codes_lignes = lignes.loc[lignes['Type'] == 'Production', 'Code_Ligne'].astype(str).tolist()
+    
+    tableau = st.data_editor(
+        pd.DataFrame({
+            'Nom': ['Équipe supplémentaire', 'Prévisions +15 %'],
+            'Prévisions_%': [0.0, 15.0],
+            'Ligne': [codes_lignes[0] if codes_lignes else None, None],
+            'Nb_Équipes': [3, None],
+            'Capacité_T_h': [np.nan, np.nan],
+            'Lots_Déclassés': ['', ''],
+        }),
+        num_rows="dynamic",
+        use_container_width=True,
+        key="tableau_scenarios",
+        column_config={
+            'Prévisions_%': st.column_config.NumberColumn("Prévisions (%)", min_value=-100.0, step=5.0),
+            'Ligne': st.column_config.SelectboxColumn("Ligne", options=codes_lignes),
+            'Nb_Équipes': st.column_config.NumberColumn("Nb équipes", min_value=0, max_value=3, step=1),
+            'Capacité_T_h': st.column_config.NumberColumn("Capacité (T/h)", min_value=0.0),
+            'Lots_Déclassés': st.column_config.TextColumn("Lots déclassés (Lot_ID, séparés par des virgules)"),
+        },
+    )
+    
+    horizon = st.number_input("Semaines extrapolées ajoutées aux prévisions", 0, 12, 0)
+    
+    if st.button("🧪 Comparer", type="primary"):
+        try:
+            with mesurer('calcul', 'scénarios'):
+                st.session_state['scenarios'] = evaluer_scenarios(
+                    data, scenarios_depuis_tableau(tableau), horizon=int(horizon))
+        except ValueError as e:
+            st.error(f"❌ {e}")
+    
+    resultats = st.session_state.get('scenarios')
+    if resultats is None:
+        return
+    indicateurs, charge_lignes, ecarts = resultats
+    
+    st.markdown("### Indicateurs")
+    st.dataframe(indicateurs, use_container_width=True)
+    
+    if len(charge_lignes) > 0:
+        charge = charge_lignes.rename_axis('Ligne').reset_index().melt(
+            id_vars='Ligne', var_name='Scénario', value_name='Charge_Max')
+        fig = px.bar(charge, x='Ligne', y='Charge_Max', color='Scénario', barmode='group',
+                     title='Charge maximale par ligne (tonnage planifié / capacité de la semaine)')
+        fig.add_hline(y=1, line_dash='dash', line_color='red')
+        afficher_graphique(fig)
+    
+    st.markdown("### Variétés en manque (écart stock - besoin, T)")
+    if len(ecarts) > 0:
+        st.dataframe(ecarts, use_container_width=True)
     else:
-        st.info("Aucun planning généré")
-        st.info("💡 Créez des affectations et exécutez le workflow Colab")
+        st.success("✅ Aucun manque dans les scénarios")
 
 # =============================================================================
 # PAGE : PLANNING LAVAGE
 # =============================================================================
 
-def page_planning_lavage(data):
+def page_planning_lavage(data, spreadsheet):
     st.markdown('<div class="main-header">🧼 PLANNING LAVAGE</div>', unsafe_allow_html=True)
     
     if len(data['Planning_Lavage']) > 0:
-        planning = data['Planning_Lavage'].copy()
-        
-        # Filtres
-        col1, col2 = st.columns(2)
-        
-        with col1:
-            semaines = ['Toutes'] + sorted(planning['Semaine_Num'].unique().tolist())
-            sem_select = st.selectbox("Semaine", semaines)
-        
-        with col2:
-            lignes = ['Toutes'] + list(planning['Ligne_Lavage'].unique())
-            ligne_select = st.selectbox("Ligne", lignes)
-        
-        # Filtrer
-        if sem_select != 'Toutes':
-            planning = planning[planning['Semaine_Num'] == sem_select]
-        if ligne_select != 'Toutes':
-            planning = planning[planning['Ligne_Lavage'] == ligne_select]
-        
-        st.dataframe(planning, use_container_width=True)
-        
-        # Stats
-        st.markdown("### Statistiques")
-        col1, col2, col3 = st.columns(3)
-        
-        with col1:
-            st.metric("Opérations", len(planning))
-        with col2:
-            st.metric("Tonnage brut", f"{planning['Tonnage_Brut'].sum():.0f}T")
-        with col3:
-            st.metric("Lignes utilisées", planning['Ligne_Lavage'].nunique())
-        
-        # Graphique
-        stats_ligne = planning.groupby('Ligne_Lavage')['Tonnage_Brut'].sum().reset_index()
-        fig = px.bar(stats_ligne, x='Ligne_Lavage', y='Tonnage_Brut',
-                    title='Tonnage par ligne de lavage')
-        st.plotly_chart(fig, use_container_width=True)
+        planning_lavage_filtre(index_planning(spreadsheet, 'Planning_Lavage'))
     else:
         st.info("Aucun planning lavage généré")
         st.info("💡 Créez des affectations et exécutez le workflow Colab")
 
+@fragment
+def planning_lavage_filtre(index):
+    """Filtres, statistiques et graphique : seule cette partie est relancée à chaque choix"""
+    # Filtres
+    col1, col2 = st.columns(2)
+    
+    with col1:
+        sem_select = st.selectbox("Semaine", ['Toutes'] + index.semaines)
+    
+    with col2:
+        ligne_select = st.selectbox("Ligne", ['Toutes'] + index.lignes)
+    
+    # Filtrer (groupes précalculés, voir index_planning)
+    planning = index.selection(None if sem_select == 'Toutes' else sem_select,
+                               None if ligne_select == 'Toutes' else ligne_select)
+    
+    st.dataframe(planning, use_container_width=True)
+    
+    # Stats
+    st.markdown("### Statistiques")
+    col1, col2, col3 = st.columns(3)
+    
+    with col1:
+        st.metric("Opérations", len(planning))
+    with col2:
+        st.metric("Tonnage brut", f"{planning['Tonnage_Brut'].sum():.0f}T")
+    with col3:
+        st.metric("Lignes utilisées", planning['Ligne_Lavage'].nunique())
+    
+    # Graphique
+    stats_ligne = planning.groupby('Ligne_Lavage', observed=True)['Tonnage_Brut'].sum().reset_index()
+    fig = px.bar(stats_ligne, x='Ligne_Lavage', y='Tonnage_Brut',
+                title='Tonnage par ligne de lavage')
+    afficher_graphique(fig)
+
 # =============================================================================
 # PAGE : ALERTES STOCKS
 # =============================================================================
 
-def page_alertes_stocks(data):
+def page_alertes_stocks(data, spreadsheet):
     st.markdown('<div class="main-header">⚠️ ALERTES STOCKS</div>', unsafe_allow_html=True)
     
-    if len(data['Alerte_Stocks']) > 0:
-        alertes = data['Alerte_Stocks'].copy()
-        
+    alertes = alertes_stocks(data, spreadsheet)
+    
+    if len(alertes) > 0:
         # Compter par statut
-        nb_manque = len(alertes[alertes['Statut'].str.contains('MANQUE', na=False)])
-        nb_limite = len(alertes[alertes['Statut'].str.contains('LIMITE', na=False)])
-        nb_ok = len(alertes[alertes['Statut'].str.contains('OK', na=False)])
+        nb_manque = int((alertes['Statut'] == MANQUE).sum())
+        nb_limite = int((alertes['Statut'] == LIMITE).sum())
+        nb_ok = int((alertes['Statut'] == OK).sum())
         
         # KPIs
         col1, col2, col3 = st.columns(3)
@@ -756,60 +1011,96 @@ def page_alertes_stocks(data):
         with col3:
             st.metric("✅ OK", nb_ok)
         
-        st.markdown("---")
+        recalculees = obtenir_calcul_alertes(spreadsheet.id).varietes_recalculees
+        st.caption("Besoin brut = prévisions / (1 - taux de déchet de la variété), "
+                   "face au Tonnage_Brut_Restant des lots · "
+                   f"{len(recalculees)} variété(s) recalculée(s) à cet affichage")
         
-        # Filtres
-        filtre_statut = st.multiselect(
-            "Filtrer par statut",
-            options=['❌ MANQUE', '⚠️ LIMITE', '✅ OK'],
-            default=['❌ MANQUE', '⚠️ LIMITE']
-        )
-        
-        if filtre_statut:
-            alertes_filtrees = alertes[alertes['Statut'].isin(filtre_statut)]
-        else:
-            alertes_filtrees = alertes
-        
-        st.dataframe(alertes_filtrees, use_container_width=True)
-        
-        # Graphique
-        fig = px.bar(alertes_filtrees, x='Code_Variété', y='Écart_T',
-                    color='Statut', title='Écarts de stock par variété')
-        st.plotly_chart(fig, use_container_width=True)
+        st.markdown("---")
         
+        alertes_filtrees(alertes)
     else:
-        st.info("Aucune alerte générée")
-        st.info("💡 Exécutez le workflow Colab pour générer les alertes")
+        st.info("Aucune variété en stock ou en prévision")
+
+@fragment
+def alertes_filtrees(alertes):
+    """Filtre par statut, tableau et graphique (relancés seuls à chaque choix)"""
+    # Filtres
+    filtre_statut = st.multiselect(
+        "Filtrer par statut",
+        options=STATUTS,
+        default=[MANQUE, LIMITE]
+    )
+    
+    if filtre_statut:
+        selection = alertes[alertes['Statut'].isin(filtre_statut)]
+    else:
+        selection = alertes
+    
+    st.dataframe(selection, use_container_width=True)
+    
+    # Graphique
+    fig = px.bar(selection, x='Code_Variété', y='Écart_T',
+                color='Statut', title='Écarts de stock par variété')
+    afficher_graphique(fig)
 
 # =============================================================================
 # PAGE : EXPORT
 # PAGE : EXPORT
 # =============================================================================
 
-def page_export(data):
+@fragment
+def page_export(data, spreadsheet):
     st.markdown('<div class="main-header">💾 EXPORT DONNÉES</div>', unsafe_allow_html=True)
     
     st.markdown("### Télécharger les données")
     
-    # Export Excel
-    if st.button("📥 Télécharger Excel complet", type="primary"):
-        output = BytesIO()
-        
-        with pd.ExcelWriter(output, engine='xlsxwriter') as writer:
-            for nom, df in data.items():
-                if len(df) > 0 and nom != 'Calendrier':
-                    df.to_excel(writer, sheet_name=nom, index=False)
-        
-        output.seek(0)
+    col1, col2 = st.columns(2)
+    
+    with col1:
+        exportables = onglets_exportables(data)
+        onglets = st.multiselect("Onglets", exportables, default=exportables)
+        format_export = st.radio("Format", formats_disponibles(), horizontal=True,
+                                 format_func=lambda f: FORMATS[f][0])
+    
+    with col2:
+        filtre = st.radio("Filtre", ["Aucun", "Dates", "Semaines"], horizontal=True)
+        periode = semaines = None
+        if filtre == "Dates":
+            aujourd_hui = datetime.now().date()
+            choix = st.date_input("Période", value=(aujourd_hui, aujourd_hui + timedelta(days=6)),
+                                  key="periode_export")
+            if len(choix) != 2:
+                st.info("Choisissez une date de début et une date de fin")
+                return
+            periode = tuple(choix)
+        elif filtre == "Semaines":
+            semaine_debut = st.number_input("Semaine début", 1, 53, datetime.now().isocalendar()[1])
+            semaine_fin = st.number_input("Semaine fin", int(semaine_debut), 53, int(semaine_debut))
+            semaines = (int(semaine_debut), int(semaine_fin))
+        st.caption("Onglets sans date / semaine exportés en entier")
+    
+    if not onglets:
+        st.info("Sélectionnez au moins un onglet")
+        return
+    
+    libelle, mime, extension = FORMATS[format_export]
+    if st.button(f"📥 Préparer l'export {libelle}", type="primary"):
+        # Fichier gardé en cache tant que les onglets choisis n'ont pas changé
+        cache = obtenir_cache(spreadsheet.id)
+        versions = {o: cache.version(o) for o in onglets}
+        with mesurer('export', f"{libelle} ({len(onglets)} onglets)"):
+            contenu = exporter(data, format_export, onglets, periode, semaines, versions,
+                               classeur=spreadsheet.id)
         
         st.download_button(
             label="📥 Télécharger",
-            data=output,
-            file_name=f'Planning_Export_{datetime.now().strftime("%Y%m%d")}.xlsx',
-            mime='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+            data=contenu,
+            file_name=f'Planning_Export_{datetime.now().strftime("%Y%m%d")}.{extension}',
+            mime=mime
         )
         
-        st.success("✅ Fichier prêt")
+        st.success(f"✅ Fichier prêt ({len(contenu) / 1024:.0f} Ko)")
 
 # =============================================================================
 # MAIN
@@ -825,147 +1116,130 @@ def generer_pdf_of_simple(liste_of):
     if not PDF_AVAILABLE:
         st.error("Module PDF non disponible")
         return None
-    
-    buffer = BytesIO()
-    doc = SimpleDocTemplate(buffer, pagesize=A4, topMargin=2*cm, bottomMargin=2*cm,
-                           leftMargin=2*cm, rightMargin=2*cm)
-    
-    story = []
-    styles = getSampleStyleSheet()
-    
-    titre_style = ParagraphStyle('Titre', parent=styles['Heading1'], 
-                                 fontSize=20, textColor=colors.HexColor('#6B7F3B'),
-                                 alignment=TA_CENTER, spaceAfter=20)
-    
-    for idx, of in enumerate(liste_of):
-        if idx > 0:
-            story.append(PageBreak())
-        
-        story.append(Paragraph("🥔 CULTURE POM", titre_style))
-        story.append(Paragraph(f"ORDRE DE FABRICATION N° {of.get('OF_ID', 'N/A')}", titre_style))
-        story.append(Spacer(1, 0.5*cm))
-        
-        info_data = [
-            ['Ligne', of.get('Ligne_Prod', 'N/A')],
-            ['Produit', of.get('Code_Produit', 'N/A')],
-            ['Tonnage', f"{of.get('Tonnage_Planifié', 0):.2f} T"],
-            ['Heure', f"{of.get('Heure_Début', '')} - {of.get('Heure_Fin', '')}"],
-            ['Équipe', of.get('Équipe', 'N/A')],
-        ]
-        
-        info_table = Table(info_data, colWidths=[5*cm, 12*cm])
-        info_table.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (0, -1), colors.HexColor('#F5F5F0')),
-            ('GRID', (0, 0), (-1, -1), 1, colors.grey),
-            ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
-            ('FONTSIZE', (0, 0), (-1, -1), 11),
-            ('LEFTPADDING', (0, 0), (-1, -1), 10),
-            ('TOPPADDING', (0, 0), (-1, -1), 8),
-            ('BOTTOMPADDING', (0, 0), (-1, -1), 8),
-        ]))
-        
-        story.append(info_table)
-        story.append(Spacer(1, 1*cm))
-        
-        realisation_data = [
-            ['Tonnage réalisé', '_______ T'],
-            ['Heure début', '___:___'],
-            ['Heure fin', '___:___'],
-            ['Opérateur', '_______________________'],
-            ['Signature', '_______________________'],
-        ]
-        
-        realisation_table = Table(realisation_data, colWidths=[5*cm, 12*cm])
-        realisation_table.setStyle(TableStyle([
-            ('GRID', (0, 0), (-1, -1), 0.5, colors.lightgrey),
-            ('FONTSIZE', (0, 0), (-1, -1), 11),
-            ('LEFTPADDING', (0, 0), (-1, -1), 10),
-        ]))
-        
-        story.append(realisation_table)
-        
-        story.append(Spacer(1, 1*cm))
-        footer_style = ParagraphStyle('Footer', parent=styles['Normal'], 
-                                     fontSize=8, textColor=colors.grey, alignment=TA_CENTER)
-        story.append(Paragraph("🇫🇷 3Force Consulting × Culture Pom © 2025", footer_style))
-    
-    doc.build(story)
-    buffer.seek(0)
-    return buffer
+    with mesurer('pdf', f"{len(liste_of)} OF"):
+        return generer_pdf_of(liste_of)
 
 def generer_pdf_ol_simple(liste_ol):
     if not PDF_AVAILABLE:
         st.error("Module PDF non disponible")
         return None
+    with mesurer('pdf', f"{len(liste_ol)} OL"):
+        return generer_pdf_ol(liste_ol)
+
+@fragment
+def impression_masse(index, type_ordre):
+    """Impression de tous les ordres d'une période (rendu parallèle, fichier temporaire)"""
+    if not PDF_AVAILABLE:
+        return
     
-    buffer = BytesIO()
-    doc = SimpleDocTemplate(buffer, pagesize=A4, topMargin=2*cm, bottomMargin=2*cm,
-                           leftMargin=2*cm, rightMargin=2*cm)
-    
-    story = []
-    styles = getSampleStyleSheet()
-    
-    titre_style = ParagraphStyle('Titre', parent=styles['Heading1'], 
-                                 fontSize=20, textColor=colors.HexColor('#6B7F3B'),
-                                 alignment=TA_CENTER, spaceAfter=20)
-    
-    for idx, ol in enumerate(liste_ol):
-        if idx > 0:
-            story.append(PageBreak())
-        
-        story.append(Paragraph("🥔 CULTURE POM", titre_style))
-        story.append(Paragraph(f"ORDRE DE LAVAGE N° {ol.get('ID_Lavage', 'N/A')}", titre_style))
-        story.append(Spacer(1, 0.5*cm))
-        
-        info_data = [
-            ['Ligne lavage', ol.get('Ligne_Lavage', 'N/A')],
-            ['Lot ID', ol.get('Lot_ID', 'N/A')],
-            ['Variété', ol.get('Code_Variété', 'N/A')],
-            ['Tonnage brut', f"{ol.get('Tonnage_Brut', 0):.2f} T"],
-            ['Heure', f"{ol.get('Heure_Début', '')} - {ol.get('Heure_Fin', '')}"],
-        ]
-        
-        info_table = Table(info_data, colWidths=[5*cm, 12*cm])
-        info_table.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (0, -1), colors.HexColor('#F5F5F0')),
-            ('GRID', (0, 0), (-1, -1), 1, colors.grey),
-            ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
-            ('FONTSIZE', (0, 0), (-1, -1), 11),
-            ('LEFTPADDING', (0, 0), (-1, -1), 10),
-            ('TOPPADDING', (0, 0), (-1, -1), 8),
-            ('BOTTOMPADDING', (0, 0), (-1, -1), 8),
-        ]))
-        
-        story.append(info_table)
-        story.append(Spacer(1, 1*cm))
-        
-        resultats_data = [
-            ['Tonnage net obtenu', '_______ T'],
-            ['Taux déchet réel', '_______ %'],
-            ['  • Purs', '_______ %'],
-            ['  • Grenailles', '_______ %'],
-            ['  • Terre', '_______ %'],
-            ['Opérateur', '_______________________'],
-            ['Signature', '_______________________'],
-        ]
-        
-        resultats_table = Table(resultats_data, colWidths=[5*cm, 12*cm])
-        resultats_table.setStyle(TableStyle([
-            ('GRID', (0, 0), (-1, -1), 0.5, colors.lightgrey),
-            ('FONTSIZE', (0, 0), (-1, -1), 11),
-            ('LEFTPADDING', (0, 0), (-1, -1), 10),
-        ]))
+    with st.expander(f"🖨️ Impression en masse des {type_ordre}"):
+        col1, col2 = st.columns(2)
         
-        story.append(resultats_table)
+        with col1:
+            aujourd_hui = datetime.now().date()
+            periode = st.date_input("Période", value=(aujourd_hui, aujourd_hui + timedelta(days=6)),
+                                    key=f"periode_{type_ordre}")
         
-        story.append(Spacer(1, 1*cm))
-        footer_style = ParagraphStyle('Footer', parent=styles['Normal'], 
-                                     fontSize=8, textColor=colors.grey, alignment=TA_CENTER)
-        story.append(Paragraph("🇫🇷 3Force Consulting × Culture Pom © 2025", footer_style))
+        with col2:
+            lignes = st.multiselect("Lignes (toutes si vide)",
+                                    index.lignes,
+                                    key=f"lignes_{type_ordre}")
+        
+        if len(periode) != 2:
+            st.info("Choisissez une date de début et une date de fin")
+            return
+        
+        if st.button(f"📄 Générer le PDF des {type_ordre}", key=f"masse_{type_ordre}"):
+            ordres = index.periode(periode[0], periode[1], lignes).to_dict('records')
+            if not ordres:
+                st.info("Aucun ordre sur cette période")
+                return
+            
+            # Fichier précédent de la session : supprimé avant d'en produire un autre
+            precedent = st.session_state.pop(f"pdf_masse_{type_ordre}", None)
+            if precedent and os.path.exists(precedent):
+                os.remove(precedent)
+            
+            with st.spinner(f"Génération de {len(ordres)} pages..."), \
+                    mesurer('pdf', f"masse {len(ordres)} {type_ordre}"):
+                chemin = generer_pdf_masse(type_ordre, ordres)
+            st.session_state[f"pdf_masse_{type_ordre}"] = chemin
+        
+        chemin = st.session_state.get(f"pdf_masse_{type_ordre}")
+        if chemin and os.path.exists(chemin):
+            with open(chemin, 'rb') as f:
+                st.download_button(
+                    label="📥 Télécharger le PDF",
+                    data=f,
+                    file_name=f"{type_ordre}_{periode[0].strftime('%Y%m%d')}_{periode[1].strftime('%Y%m%d')}.pdf",
+                    mime="application/pdf",
+                    key=f"telecharger_masse_{type_ordre}"
+                )
+
+# =============================================================================
+# CHANGEMENT DE STATUT OF / OL
+# =============================================================================
+
+STATUTS_OF = ["Planifié", "En cours", "Terminé", "Annulé"]
+STATUTS_OL = ["Planifié", "En cours", "Terminé"]
+
+def appliquer_statuts(spreadsheet, onglet, colonne_id, statuts, libelle):
+    """Applique {id: statut} en une écriture : affichage immédiat, écriture en arrière-plan"""
+    cache = obtenir_cache(spreadsheet.id)
+    
+    # Positions connues depuis le chargement : pas de relecture de la feuille
+    file_ecritures(spreadsheet).mettre_a_jour(
+        spreadsheet, onglet, {i: {'Statut': statut} for i, statut in statuts.items()},
+        f"{len(statuts)} {libelle}", index=cache.index_lignes(onglet), session=id_session()
+    )
+    for statut in set(statuts.values()):
+        cache.modifier_lignes(onglet, colonne_id, [i for i, s in statuts.items() if s == statut],
+                              {'Statut': statut})
+    st.rerun()
+
+def changer_statut_ordres(spreadsheet, onglet, colonne_id, ordres, statut, libelle):
+    """Applique un même statut à une sélection d'OF/OL"""
+    appliquer_statuts(spreadsheet, onglet, colonne_id, {o[colonne_id]: statut for o in ordres}, libelle)
+
+def grille_ordres(ordres, onglet, colonne_id, colonnes, statuts, cle, spreadsheet):
+    """Ordres du jour dans une seule grille éditable (colonne Sélection + Statut modifiable)
+    
+    Un seul widget quel que soit le nombre d'ordres, rendu par une grille
+    virtualisée (seules les lignes visibles sont dessinées). Retourne
+    (ordres sélectionnés en dicts, {id: nouveau statut} des statuts modifiés).
+    """
+    selection_totale = st.checkbox("☑ Sélectionner tout", key=f"select_all_{cle}")
+    
+    tableau = pd.DataFrame({'Sélection': selection_totale}, index=ordres.index)
+    config = {'Sélection': st.column_config.CheckboxColumn("☑", width="small")}
+    for colonne in colonnes:
+        if pd.api.types.is_numeric_dtype(ordres[colonne]):
+            tableau[colonne] = ordres[colonne]
+            config[colonne] = st.column_config.NumberColumn(colonne, format="%.2f T")
+        else:
+            tableau[colonne] = ordres[colonne].astype(str)
+    statut = ordres['Statut'].astype(str) if 'Statut' in ordres.columns else pd.Series('', index=ordres.index)
+    tableau['Statut'] = statut.replace({'': 'Planifié', 'nan': 'Planifié'})
+    config['Statut'] = st.column_config.SelectboxColumn("Statut", options=statuts, required=True)
+    
+    # Clé liée aux ordres affichés et à la version de l'onglet : autre jour
+    # ou nouvelle écriture = grille vierge (les éditions sont repérées par position)
+    ordres_affiches = hash(tuple(ordres[colonne_id].astype(str)))
+    version = obtenir_cache(spreadsheet.id).version(onglet)
+    edite = st.data_editor(
+        tableau,
+        key=f"grille_{cle}_{ordres_affiches}_{selection_totale}_{version}",
+        hide_index=True,
+        use_container_width=True,
+        height=min(38 + 35 * len(tableau), 460),
+        disabled=colonnes,
+        column_config=config,
+    )
     
-    doc.build(story)
-    buffer.seek(0)
-    return buffer
+    selectionnes = ordres[edite['Sélection'].to_numpy()].to_dict('records')
+    modifie = (edite['Statut'] != tableau['Statut']).to_numpy()
+    modifications = dict(zip(ordres.loc[modifie, colonne_id], edite.loc[modifie, 'Statut']))
+    return selectionnes, modifications
 
 # =============================================================================
 # PAGE : ORDRES DE FABRICATION
@@ -981,7 +1255,7 @@ def page_ordres_fabrication(data, spreadsheet):
     
     with col2:
         if st.button("🔍 Charger les OF", type="primary"):
-            st.cache_data.clear()
+            obtenir_cache(spreadsheet.id).invalider('Planning_Production')
             st.rerun()
     
     if len(data['Planning_Production']) == 0:
@@ -989,102 +1263,49 @@ def page_ordres_fabrication(data, spreadsheet):
         st.info("💡 Créez des affectations et exécutez le workflow Colab")
         return
     
-    planning = data['Planning_Production'].copy()
-    planning['Date'] = pd.to_datetime(planning['Date'], errors='coerce')
+    index = index_planning(spreadsheet, 'Planning_Production')
+    
+    impression_masse(index, 'OF')
     
-    of_jour = planning[planning['Date'].dt.date == date_selectionnee]
+    of_jour = index.jour(date_selectionnee)
     
     if len(of_jour) == 0:
         st.info(f"Aucun OF pour le {date_selectionnee.strftime('%d/%m/%Y')}")
         return
     
+    ordres_fabrication_du_jour(of_jour, date_selectionnee, spreadsheet)
+
+@fragment
+def ordres_fabrication_du_jour(of_jour, date_selectionnee, spreadsheet):
+    """Grille des OF du jour et actions sur la sélection (relancées seules à chaque clic)"""
     st.markdown(f"### {len(of_jour)} OF pour le {date_selectionnee.strftime('%A %d %B %Y')}")
     
-    col1, col2 = st.columns([3, 1])
+    st.markdown(f"**Total : {of_jour['Tonnage_Planifié'].sum():.1f}T**")
     
-    with col1:
-        selection_totale = st.checkbox("☑ Sélectionner tout", key="select_all_of")
-    
-    with col2:
-        st.markdown(f"**Total : {of_jour['Tonnage_Planifié'].sum():.1f}T**")
-    
-    of_selectionnes = []
+    of_selectionnes, modifications = grille_ordres(
+        of_jour, 'Planning_Production', 'OF_ID',
+        ['OF_ID', 'Heure_Début', 'Ligne_Prod', 'Code_Produit', 'Tonnage_Planifié'],
+        STATUTS_OF, 'of', spreadsheet
+    )
     
-    for idx, row in of_jour.iterrows():
-        col1, col2, col3, col4, col5, col6, col7 = st.columns([0.5, 2, 1.5, 2, 3, 1.5, 1.5])
-        
-        with col1:
-            selected = st.checkbox("", value=selection_totale, key=f"of_{row['OF_ID']}")
-        
-        with col2:
-            st.text(row['OF_ID'])
-        
-        with col3:
-            st.text(f"{row['Heure_Début']}")
-        
-        with col4:
-            st.text(row['Ligne_Prod'])
-        
-        with col5:
-            st.text(row['Code_Produit'])
-        
-        with col6:
-            st.text(f"{row['Tonnage_Planifié']:.2f}T")
-        
-        with col7:
-            statut_color = {"Planifié": "🔵", "En cours": "🟢", "Terminé": "✅", "Annulé": "❌"}
-            statut = row.get('Statut', 'Planifié')
-            st.text(f"{statut_color.get(statut, '⚪')} {statut}")
-        
-        if selected:
-            of_selectionnes.append(row.to_dict())
+    if modifications and st.button(f"💾 Enregistrer {len(modifications)} changement(s) de statut",
+                                   type="primary", key="of_statuts"):
+        appliquer_statuts(spreadsheet, 'Planning_Production', 'OF_ID', modifications, "statuts d'OF modifiés")
     
     if len(of_selectionnes) > 0:
         st.markdown("---")
         col1, col2, col3, col4 = st.columns(4)
-        
+    
         with col1:
             if st.button("▶️ Passer en cours", use_container_width=True):
-                try:
-                    worksheet = spreadsheet.worksheet('Planning_Production')
-                    all_data = worksheet.get_all_values()
-                    headers = all_data[0]
-                    
-                    statut_idx = headers.index('Statut')
-                    of_id_idx = headers.index('OF_ID')
-                    
-                    for of in of_selectionnes:
-                        for row_idx, row_data in enumerate(all_data[1:], start=2):
-                            if row_data[of_id_idx] == of['OF_ID']:
-                                worksheet.update_cell(row_idx, statut_idx + 1, 'En cours')
-                    
-                    st.success(f"✅ {len(of_selectionnes)} OF passés en cours")
-                    st.cache_data.clear()
-                    st.rerun()
-                except Exception as e:
-                    st.error(f"Erreur : {e}")
-        
+                changer_statut_ordres(spreadsheet, 'Planning_Production', 'OF_ID',
+                                      of_selectionnes, 'En cours', "OF passés en cours")
+    
         with col2:
             if st.button("✅ Marquer terminé", use_container_width=True):
-                try:
-                    worksheet = spreadsheet.worksheet('Planning_Production')
-                    all_data = worksheet.get_all_values()
-                    headers = all_data[0]
-                    
-                    statut_idx = headers.index('Statut')
-                    of_id_idx = headers.index('OF_ID')
-                    
-                    for of in of_selectionnes:
-                        for row_idx, row_data in enumerate(all_data[1:], start=2):
-                            if row_data[of_id_idx] == of['OF_ID']:
-                                worksheet.update_cell(row_idx, statut_idx + 1, 'Terminé')
-                    
-                    st.success(f"✅ {len(of_selectionnes)} OF terminés")
-                    st.cache_data.clear()
-                    st.rerun()
-                except Exception as e:
-                    st.error(f"Erreur : {e}")
-        
+                changer_statut_ordres(spreadsheet, 'Planning_Production', 'OF_ID',
+                                      of_selectionnes, 'Terminé', "OF terminés")
+    
         with col3:
             if PDF_AVAILABLE and st.button("🖨️ Imprimer PDF", use_container_width=True):
                 try:
@@ -1101,7 +1322,7 @@ def page_ordres_fabrication(data, spreadsheet):
                     st.error(f"Erreur génération PDF : {e}")
             elif not PDF_AVAILABLE:
                 st.warning("Module PDF non disponible")
-        
+    
         with col4:
             st.markdown(f"**{len(of_selectionnes)} OF sélectionnés**")
             st.markdown(f"**{sum(of['Tonnage_Planifié'] for of in of_selectionnes):.1f}T**")
@@ -1120,7 +1341,17 @@ def page_ordres_lavage(data, spreadsheet):
     
     with col2:
         if st.button("🔍 Charger les OL", type="primary"):
-            st.cache_data.clear()
+            obtenir_cache(spreadsheet.id).invalider('Planning_Lavage')
+            st.rerun()
+    
+    # Saisies dont l'écriture n'a pas pu être confirmée (voir le journal local) :
+    # celles retrouvées dans Lots_Lavés sont confirmées, les autres à vérifier
+    incertaines = resoudre_incertaines(data['Lots_Lavés'])
+    if incertaines:
+        st.warning("⚠️ Saisies de lavage à vérifier dans le classeur : " +
+                   ", ".join(f"{e['stock_lave_id']} (OL {e['ol']})" for e in incertaines))
+        if st.button("✔️ Vérifiées dans le classeur", key="acquitter_incertaines"):
+            acquitter_incertaines([e['stock_lave_id'] for e in incertaines])
             st.rerun()
     
     if len(data['Planning_Lavage']) == 0:
@@ -1128,88 +1359,57 @@ def page_ordres_lavage(data, spreadsheet):
         st.info("💡 Créez des affectations et exécutez le workflow Colab")
         return
     
-    planning = data['Planning_Lavage'].copy()
-    planning['Date'] = pd.to_datetime(planning['Date'], errors='coerce')
+    index = index_planning(spreadsheet, 'Planning_Lavage')
+    
+    impression_masse(index, 'OL')
     
-    ol_jour = planning[planning['Date'].dt.date == date_selectionnee]
+    ol_jour = index.jour(date_selectionnee)
     
     if len(ol_jour) == 0:
         st.info(f"Aucun OL pour le {date_selectionnee.strftime('%d/%m/%Y')}")
         return
     
+    ordres_lavage_du_jour(ol_jour, date_selectionnee, data, spreadsheet)
+
+@fragment
+def ordres_lavage_du_jour(ol_jour, date_selectionnee, data, spreadsheet):
+    """Grille des OL du jour, actions et saisie des résultats (relancées seules à chaque clic)"""
     st.markdown(f"### {len(ol_jour)} OL pour le {date_selectionnee.strftime('%A %d %B %Y')}")
     
-    col1, col2 = st.columns([3, 1])
-    
-    with col1:
-        selection_totale = st.checkbox("☑ Sélectionner tout", key="select_all_ol")
+    st.markdown(f"**Total : {ol_jour['Tonnage_Brut'].sum():.1f}T**")
     
-    with col2:
-        st.markdown(f"**Total : {ol_jour['Tonnage_Brut'].sum():.1f}T**")
+    ol_selectionnes, modifications = grille_ordres(
+        ol_jour, 'Planning_Lavage', 'ID_Lavage',
+        ['ID_Lavage', 'Heure_Début', 'Ligne_Lavage', 'Lot_ID', 'Code_Variété', 'Tonnage_Brut'],
+        STATUTS_OL, 'ol', spreadsheet
+    )
     
-    ol_selectionnes = []
+    # Un OL se termine par la saisie de ses résultats (stock lavé, lot décrémenté)
+    termines = [i for i, statut in modifications.items() if statut == 'Terminé']
+    if termines:
+        st.warning(f"⚠️ {', '.join(map(str, termines))} : utilisez « Saisir résultats » pour terminer un OL")
+        modifications = {i: s for i, s in modifications.items() if s != 'Terminé'}
     
-    for idx, row in ol_jour.iterrows():
-        col1, col2, col3, col4, col5, col6, col7 = st.columns([0.5, 2, 1.5, 2, 3, 1.5, 1.5])
-        
-        with col1:
-            selected = st.checkbox("", value=selection_totale, key=f"ol_{row['ID_Lavage']}")
-        
-        with col2:
-            st.text(row['ID_Lavage'])
-        
-        with col3:
-            st.text(f"{row['Heure_Début']}")
-        
-        with col4:
-            st.text(row['Ligne_Lavage'])
-        
-        with col5:
-            st.text(f"{row['Lot_ID']} ({row['Code_Variété']})")
-        
-        with col6:
-            st.text(f"{row['Tonnage_Brut']:.2f}T")
-        
-        with col7:
-            statut_color = {"Planifié": "🔵", "En cours": "🟢", "Terminé": "✅"}
-            statut = row.get('Statut', 'Planifié')
-            st.text(f"{statut_color.get(statut, '⚪')} {statut}")
-        
-        if selected:
-            ol_selectionnes.append(row.to_dict())
+    if modifications and st.button(f"💾 Enregistrer {len(modifications)} changement(s) de statut",
+                                   type="primary", key="ol_statuts"):
+        appliquer_statuts(spreadsheet, 'Planning_Lavage', 'ID_Lavage', modifications, "statuts d'OL modifiés")
     
     if len(ol_selectionnes) > 0:
         st.markdown("---")
         col1, col2, col3, col4 = st.columns(4)
-        
+    
         with col1:
             if st.button("▶️ Passer en cours", use_container_width=True, key="ol_encours"):
-                try:
-                    worksheet = spreadsheet.worksheet('Planning_Lavage')
-                    all_data = worksheet.get_all_values()
-                    headers = all_data[0]
-                    
-                    statut_idx = headers.index('Statut')
-                    id_idx = headers.index('ID_Lavage')
-                    
-                    for ol in ol_selectionnes:
-                        for row_idx, row_data in enumerate(all_data[1:], start=2):
-                            if row_data[id_idx] == ol['ID_Lavage']:
-                                worksheet.update_cell(row_idx, statut_idx + 1, 'En cours')
-                    
-                    st.success(f"✅ {len(ol_selectionnes)} OL passés en cours")
-                    st.cache_data.clear()
-                    st.rerun()
-                except Exception as e:
-                    st.error(f"Erreur : {e}")
-        
+                changer_statut_ordres(spreadsheet, 'Planning_Lavage', 'ID_Lavage',
+                                      ol_selectionnes, 'En cours', "OL passés en cours")
+    
         with col2:
             # Formulaire de saisie des résultats
             if st.button("✅ Saisir résultats", use_container_width=True, key="ol_termine"):
                 # Stocker dans session_state pour afficher le formulaire
                 st.session_state['show_form_ol'] = True
                 st.session_state['ol_to_complete'] = ol_selectionnes
-        
+    
         with col3:
             if PDF_AVAILABLE and st.button("🖨️ Imprimer PDF", use_container_width=True, key="ol_pdf"):
                 try:
@@ -1224,7 +1424,7 @@ def page_ordres_lavage(data, spreadsheet):
                         )
                 except Exception as e:
                     st.error(f"Erreur génération PDF : {e}")
-        
+    
         with col4:
             st.markdown(f"**{len(ol_selectionnes)} OL sélectionnés**")
             st.markdown(f"**{sum(ol['Tonnage_Brut'] for ol in ol_selectionnes):.1f}T**")
@@ -1233,17 +1433,17 @@ def page_ordres_lavage(data, spreadsheet):
     if 'show_form_ol' in st.session_state and st.session_state['show_form_ol']:
         st.markdown("---")
         st.markdown("### 📝 SAISIE DES RÉSULTATS DE LAVAGE")
-        
+    
         ol_to_complete = st.session_state.get('ol_to_complete', [])
-        
+    
         if len(ol_to_complete) == 1:
             ol = ol_to_complete[0]
-            
+    
             with st.form("form_resultats_lavage"):
                 st.markdown(f"**OL : {ol['ID_Lavage']} - Lot : {ol['Lot_ID']}**")
-                
+    
                 col1, col2 = st.columns(2)
-                
+    
                 with col1:
                     st.markdown("#### Tonnages")
                     tonnage_brut_saisi = st.number_input(
@@ -1258,34 +1458,34 @@ def page_ordres_lavage(data, spreadsheet):
                         min_value=0.0,
                         step=0.1
                     )
-                    
+    
                     if tonnage_brut_saisi > 0:
                         taux_dechet_calcule = ((tonnage_brut_saisi - tonnage_net) / tonnage_brut_saisi) * 100
                         st.info(f"📊 Taux déchet calculé : {taux_dechet_calcule:.2f}%")
-                
+    
                 with col2:
                     st.markdown("#### Détail des déchets (%)")
                     taux_purs = st.number_input("Purs (%)", value=18.0, min_value=0.0, max_value=100.0, step=0.1)
                     taux_grenailles = st.number_input("Grenailles (%)", value=3.0, min_value=0.0, max_value=100.0, step=0.1)
                     taux_terre = st.number_input("Terre (%)", value=1.0, min_value=0.0, max_value=100.0, step=0.1)
-                    
+    
                     total_dechets = taux_purs + taux_grenailles + taux_terre
                     if abs(total_dechets - taux_dechet_calcule) > 0.5:
                         st.warning(f"⚠️ Total déchets saisis ({total_dechets:.1f}%) ≠ calculé ({taux_dechet_calcule:.1f}%)")
-                
+    
                 st.markdown("#### Stockage")
                 zone_stockage = st.text_input("Zone de stockage", value="Z1")
-                
+    
                 col1, col2 = st.columns(2)
                 with col1:
                     submit = st.form_submit_button("✅ Valider et créer stock lavé", use_container_width=True)
                 with col2:
                     cancel = st.form_submit_button("❌ Annuler", use_container_width=True)
-                
+    
                 if cancel:
                     st.session_state['show_form_ol'] = False
-                    st.rerun()
-                
+                    st.rerun(scope="fragment")
+    
                 if submit:
                     try:
                         # 1. Générer ID pour le stock lavé
@@ -1299,9 +1499,8 @@ def page_ordres_lavage(data, spreadsheet):
                             else:
                                 numero = int(dernier_id.split('_')[1]) + 1
                                 nouvel_id_stock = f'SL_{numero:03d}'
-                        
-                        # 2. Créer ligne dans Lots_Lavés
-                        worksheet_laves = spreadsheet.worksheet('Lots_Lavés')
+    
+                        # 2. Ligne du stock lavé
                         nouvelle_ligne_stock = [
                             nouvel_id_stock,
                             ol['Lot_ID'],
@@ -1320,45 +1519,29 @@ def page_ordres_lavage(data, spreadsheet):
                             'Disponible',
                             datetime.now().strftime('%Y-%m-%d %H:%M')
                         ]
-                        worksheet_laves.append_row(nouvelle_ligne_stock, value_input_option='USER_ENTERED')
-                        
-                        # 3. Mettre à jour le lot d'origine (décrémenter le tonnage)
-                        worksheet_lots = spreadsheet.worksheet('Lots')
-                        all_lots = worksheet_lots.get_all_values()
-                        headers_lots = all_lots[0]
-                        
-                        lot_id_idx = headers_lots.index('Lot_ID')
-                        tonnage_idx = headers_lots.index('Tonnage_Brut_Restant')
-                        
-                        for row_idx, row_data in enumerate(all_lots[1:], start=2):
-                            if row_data[lot_id_idx] == ol['Lot_ID']:
-                                ancien_tonnage = float(row_data[tonnage_idx])
-                                nouveau_tonnage = ancien_tonnage - tonnage_brut_saisi
-                                worksheet_lots.update_cell(row_idx, tonnage_idx + 1, nouveau_tonnage)
-                                break
-                        
-                        # 4. Changer le statut de l'OL à "Terminé"
-                        worksheet_planning = spreadsheet.worksheet('Planning_Lavage')
-                        all_planning = worksheet_planning.get_all_values()
-                        headers_planning = all_planning[0]
-                        
-                        id_lavage_idx = headers_planning.index('ID_Lavage')
-                        statut_idx = headers_planning.index('Statut')
-                        
-                        for row_idx, row_data in enumerate(all_planning[1:], start=2):
-                            if row_data[id_lavage_idx] == ol['ID_Lavage']:
-                                worksheet_planning.update_cell(row_idx, statut_idx + 1, 'Terminé')
-                                break
-                        
+    
+                        # 3. Stock lavé + décrément du lot + OL terminé : une seule écriture
+                        cache = obtenir_cache(spreadsheet.id)
+                        plan = enregistrer_resultat_lavage(
+                            spreadsheet, ol, nouvelle_ligne_stock, float(tonnage_brut_saisi),
+                            index_laves=cache.index_lignes('Lots_Lavés'),
+                            index_lots=cache.index_lignes('Lots'),
+                            index_planning=cache.index_lignes('Planning_Lavage')
+                        )
+    
                         st.success(f"✅ Stock lavé {nouvel_id_stock} créé avec succès !")
                         st.success(f"✅ Lot {ol['Lot_ID']} mis à jour")
                         st.success(f"✅ OL {ol['ID_Lavage']} terminé")
-                        
+    
                         # Nettoyer le state
                         st.session_state['show_form_ol'] = False
-                        st.cache_data.clear()
+                        cache.modifier_lignes('Lots', 'Lot_ID', [ol['Lot_ID']],
+                                              {'Tonnage_Brut_Restant': plan['nouveau_tonnage']})
+                        cache.modifier_lignes('Planning_Lavage', 'ID_Lavage', [ol['ID_Lavage']],
+                                              {'Statut': 'Terminé'})
+                        cache.invalider('Lots_Lavés')
                         st.rerun()
-                        
+    
                     except Exception as e:
                         st.error(f"❌ Erreur : {e}")
                         import traceback
@@ -1367,58 +1550,96 @@ def page_ordres_lavage(data, spreadsheet):
             st.warning("⚠️ Sélectionnez un seul OL pour saisir les résultats")
             if st.button("Fermer"):
                 st.session_state['show_form_ol'] = False
-                st.rerun()
+                st.rerun(scope="fragment")
 
-def main():
-    menu = sidebar_navigation()
-    
+def afficher_page(menu):
+    """Connexion, chargement puis page choisie"""
     # URL Google Sheets
     sheet_url = st.sidebar.text_input(
         "URL Google Sheets",
-        value="https://docs.google.com/spreadsheets/d/1OEwROl08gdVLBiTpnEhs-IZ7ZenDtW1ODNzOL4QkwBk/edit?usp=sharing"
+        value=URL_CLASSEUR
     )
     
-    if st.sidebar.button("🔄 Recharger"):
-        st.cache_data.clear()
-        st.rerun()
+    # Relecture complète forcée (sinon seuls les onglets modifiés sont relus)
+    forcer_rechargement = st.sidebar.button("🔄 Recharger")
     
-    # Connexion
-    gc = connect_to_sheets()
+    # Connexion différée : l'id tiré de l'URL suffit pour servir le snapshot
+    connexion = connect_to_sheets()
     
-    if gc is None:
+    if connexion is None:
         st.error("Impossible de se connecter")
         return
     
-    data, spreadsheet = charger_donnees(gc, sheet_url)
+    try:
+        spreadsheet = ClasseurDiffere(connexion, sheet_url)
+    except NoValidUrlKeyFound:
+        st.error("URL Google Sheets invalide")
+        return
+    
+    with mesurer('chargement', 'charger_donnees'):
+        data, erreurs = charger_donnees(spreadsheet, forcer=forcer_rechargement)
     
     if data is None:
         st.error("Impossible de charger les données")
         st.info("Vérifiez l'URL et le partage")
         return
     
+    cache = obtenir_cache(spreadsheet.id)
+    if cache.source == 'snapshot':
+        if cache.erreur_rafraichissement:
+            st.sidebar.warning(f"📦 Snapshot local du {cache.date_snapshot} : Google Sheets "
+                               f"injoignable ({cache.erreur_rafraichissement}), nouvel essai en arrière-plan")
+        else:
+            st.sidebar.info(f"📦 Snapshot local du {cache.date_snapshot} "
+                            "(actualisation en arrière-plan)")
+    
+    with st.sidebar:
+        afficher_etat_ecritures(spreadsheet)
+    
+    if erreurs:
+        st.sidebar.warning("⚠️ Onglets non chargés :\n" +
+                           "\n".join(f"- {o} : {msg}" for o, msg in erreurs.items()))
+    
     # Router
-    if menu == "🏠 Accueil":
-        page_accueil(data)
-    elif menu == "📊 Données":
-        page_donnees(data)
-    elif menu == "📈 Prévisions":
-        page_previsions(data, spreadsheet)
-    elif menu == "🎯 Affectations":
-        page_affectations(data, spreadsheet)
-    elif menu == "🧼 Planning Lavage":
-        page_planning_lavage(data)
-    elif menu == "🧼 Ordres de Lavage":
-        page_ordres_lavage(data, spreadsheet)
-    elif menu == "🏭 Planning Production":
-        page_planning_production(data)
-    elif menu == "📋 Ordres de Fabrication":
-        page_ordres_fabrication(data, spreadsheet)
-    elif menu == "⚠️ Alertes Stocks":
-        page_alertes_stocks(data)
-    elif menu == "💾 Export":
-        page_export(data)
-    else:
-        st.info("🚧 Page en développement")
+    with mesurer('page', menu):
+        if menu == "🏠 Accueil":
+            page_accueil(data, spreadsheet)
+        elif menu == "📊 Données":
+            page_donnees(data)
+        elif menu == "📈 Prévisions":
+            page_previsions(data, spreadsheet)
+        elif menu == "🎯 Affectations":
+            page_affectations(data, spreadsheet)
+        elif menu == "🧼 Planning Lavage":
+            page_planning_lavage(data, spreadsheet)
+        elif menu == "🧼 Ordres de Lavage":
+            page_ordres_lavage(data, spreadsheet)
+        elif menu == "🏭 Planning Production":
+            page_planning_production(data, spreadsheet)
+        elif menu == "🧪 Scénarios":
+            page_scenarios(data)
+        elif menu == "📋 Ordres de Fabrication":
+            page_ordres_fabrication(data, spreadsheet)
+        elif menu == "⚠️ Alertes Stocks":
+            page_alertes_stocks(data, spreadsheet)
+        elif menu == "💾 Export":
+            page_export(data, spreadsheet)
+        else:
+            st.info("🚧 Page en développement")
+
+def main():
+    menu = sidebar_navigation()
+    
+    # Mesures de l'exécution (journal + panneau de debug optionnel)
+    releve = demarrer_releve(menu, session=id_session())
+    try:
+        afficher_page(menu)
+    finally:
+        terminer_releve(releve)
+    
+    st.sidebar.markdown("---")
+    if st.sidebar.checkbox("🐞 Mesures de performance", key="debug_mesures"):
+        afficher_mesures(releve)
 
 if __name__ == "__main__":
     main()
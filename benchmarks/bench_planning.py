@@ -0,0 +1,123 @@
+"""
+BENCHMARK - GÉNÉRATION DU PLANNING PRODUCTION
+Vérifie que la version vectorisée donne exactement le même planning que
+l'ancienne boucle, puis compare les temps à 1×, 10× et 100× la taille actuelle.
+
+    python benchmarks/bench_planning.py
+"""
+
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from moteur_planning import generer_planning_production
+
+# Taille actuelle du classeur : ~30 produits, 6 semaines, 4 lignes de production
+NB_PRODUITS = 30
+NB_SEMAINES = 6
+NB_LIGNES = 4
+
+def generer_planning_production_boucle(data):
+    """Ancienne implémentation (référence pour l'équivalence)"""
+    previsions = data['Previsions'].copy()
+    produits = data['Produits'].copy()
+    lignes = data['REF_Lignes'][data['REF_Lignes']['Type'] == 'Production'].copy()
+
+    planning = []
+    of_id = 1
+
+    for semaine in sorted(previsions['Semaine_Num'].unique()):
+        prev_sem = previsions[previsions['Semaine_Num'] == semaine]
+
+        for _, prev in prev_sem.iterrows():
+            produit = produits[produits['Code_Produit'] == prev['Code_Produit']]
+            if len(produit) == 0:
+                continue
+
+            ligne_aff = produit['Ligne_Affectée'].iloc[0]
+            if pd.isna(ligne_aff) or ligne_aff == '':
+                continue
+
+            ligne = lignes[lignes['Code_Ligne'] == ligne_aff]
+            if len(ligne) == 0:
+                continue
+
+            nb_equipes = ligne['Nb_Équipes'].iloc[0]
+
+            volume_jour = prev['Volume_Prévu_T'] / 5
+            volume_equipe = volume_jour / nb_equipes
+
+            for jour_idx in range(5):
+                for equipe in range(1, nb_equipes + 1):
+                    planning.append({
+                        'OF_ID': f'OF_{of_id:03d}',
+                        'Semaine': int(semaine),
+                        'Jour': jour_idx + 1,
+                        'Équipe': f'Équipe_{equipe}' if nb_equipes > 1 else 'Unique',
+                        'Ligne': ligne_aff,
+                        'Produit': prev['Code_Produit'],
+                        'Tonnage': round(volume_equipe, 2)
+                    })
+                    of_id += 1
+
+    return pd.DataFrame(planning)
+
+def donnees_synthetiques(facteur, graine=0):
+    """Jeu de données au format du classeur, `facteur` × la taille actuelle"""
+    rng = np.random.default_rng(graine)
+    nb_produits = NB_PRODUITS * facteur
+    nb_lignes = NB_LIGNES * max(1, facteur // 10)
+    nb_semaines = min(NB_SEMAINES * facteur, 52)
+
+    lignes = pd.DataFrame({
+        'Code_Ligne': [f'L{i}' for i in range(1, nb_lignes + 1)] + ['LAV1'],
+        'Type': ['Production'] * nb_lignes + ['Lavage'],
+        'Capacité_T_h': rng.integers(5, 15, nb_lignes + 1),
+        'Nb_Équipes': rng.integers(1, 4, nb_lignes + 1),
+    })
+
+    codes = [f'P{i:04d}' for i in range(nb_produits)]
+    affectation = rng.choice(lignes['Code_Ligne'].tolist() + [''], nb_produits)
+    produits = pd.DataFrame({'Code_Produit': codes, 'Ligne_Affectée': affectation, 'Actif': 'OUI'})
+
+    semaines = np.repeat(np.arange(1, nb_semaines + 1), nb_produits)
+    previsions = pd.DataFrame({
+        'Semaine_Num': semaines,
+        'Code_Produit': np.tile(codes, nb_semaines),
+        'Volume_Prévu_T': rng.uniform(1, 80, len(semaines)).round(1),
+        'Type_Prévision': 'SAISIE',
+    }).sample(frac=1, random_state=graine).reset_index(drop=True)
+
+    return {'Previsions': previsions, 'Produits': produits, 'REF_Lignes': lignes}
+
+def chronometrer(fonction, data, repetitions=3):
+    meilleur = float('inf')
+    for _ in range(repetitions):
+        debut = time.perf_counter()
+        resultat = fonction(data)
+        meilleur = min(meilleur, time.perf_counter() - debut)
+    return meilleur, resultat
+
+def main():
+    print(f"{'Taille':>8} {'Prévisions':>11} {'OF':>9} {'Boucle (s)':>11} {'Vectorisé (s)':>14} {'Gain':>7}")
+    for facteur in (1, 10, 100):
+        data = donnees_synthetiques(facteur)
+        repetitions = 1 if facteur == 100 else 3
+
+        t_boucle, attendu = chronometrer(generer_planning_production_boucle, data, repetitions)
+        t_vect, obtenu = chronometrer(generer_planning_production, data, repetitions)
+
+        pd.testing.assert_frame_equal(obtenu, attendu)
+
+        print(f"{facteur:>7}× {len(data['Previsions']):>11} {len(obtenu):>9} "
+              f"{t_boucle:>11.3f} {t_vect:>14.4f} {t_boucle / t_vect:>6.0f}×")
+
+    print("✅ Plannings identiques à l'implémentation de référence")
+
+if __name__ == "__main__":
+    main()
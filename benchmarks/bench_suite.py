@@ -0,0 +1,183 @@
+"""
+BENCHMARK - SUITE COMPLÈTE SUR CLASSEUR LOCAL
+Chronomètre les traitements de l'application sur des classeurs synthétiques
+de taille croissante, sans Google Sheets (voir sheets_local), et compte les
+appels d'API que chaque étape aurait faits.
+
+    python benchmarks/bench_suite.py [--tailles 1 10 100] [--latence 0.2] [--sortie fichier.json]
+
+Les résultats sont écrits en JSON (une entrée par taille et par étape) pour
+comparer deux versions : benchmarks/resultats/bench_<date>.json par défaut.
+"""
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from datetime import datetime
+
+import pandas as pd
+
+RACINE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RACINE)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from classeur_synthetique import PREMIERE_SEMAINE, classeur_synthetique
+from affectations_lots import allouer_lots
+from alertes_stocks import calculer_alertes
+from scenarios import evaluer_scenarios
+from documents_pdf import PDF_AVAILABLE, cache_pages, generer_pdf_masse, generer_pdf_of, generer_pdf_ol
+from export_donnees import PARQUET_DISPONIBLE, exporter, exporter_excel
+from index_planning import IndexPlanning
+from moteur_planning import generer_planning_production, ordonnancer_production
+from previsions import METHODES, calculer_extrapolation
+from sheets_io import maj_statuts_ordres
+from sheets_local import ClasseurLocal
+from sync_donnees import CacheClasseur
+
+TAILLES = (1, 10, 100)
+NB_ORDRES_STATUT = 50
+NB_PAGES_PDF = 50
+REPERTOIRE_RESULTATS = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'resultats')
+
+def mesurer(classeur, fonction, repetitions=3):
+    """Meilleur temps sur `repetitions` exécutions et appels d'API de la dernière"""
+    meilleur = float('inf')
+    for _ in range(repetitions):
+        avant = classeur.nb_appels_api()
+        debut = time.perf_counter()
+        resultat = fonction()
+        meilleur = min(meilleur, time.perf_counter() - debut)
+        appels = classeur.nb_appels_api() - avant
+    return meilleur, appels, resultat
+
+def etapes(classeur, data):
+    """(nom, fonction, nb lignes traitées) pour chaque traitement mesuré"""
+    planning_of = data['Planning_Production']
+    planning_ol = data['Planning_Lavage']
+    ids_of = planning_of['OF_ID'].head(NB_ORDRES_STATUT).tolist()
+    ids_ol = planning_ol['ID_Lavage'].head(NB_ORDRES_STATUT).tolist()
+    liste_of = planning_of.head(NB_PAGES_PDF).to_dict('records')
+    liste_ol = planning_ol.head(NB_PAGES_PDF).to_dict('records')
+    semaine = planning_of['Semaine_Num'].min()
+    semaine_of = planning_of[planning_of['Semaine_Num'] == semaine].to_dict('records')
+    index_of = IndexPlanning(planning_of, 'Ligne_Prod')
+    jour = index_of.jours[0]
+
+    # Cache dont les index de lignes servent aux changements de statut
+    cache = CacheClasseur(chemin_snapshot=None)
+    cache.donnees(classeur)
+
+    def chargement_froid():
+        return CacheClasseur(chemin_snapshot=None).donnees(classeur)
+
+    def chargement_chaud():
+        cache_chaud = CacheClasseur(chemin_snapshot=None, intervalle=0)
+        cache_chaud.donnees(classeur)
+        return lambda: cache_chaud.donnees(classeur)
+
+    def chargement_un_onglet():
+        cache_partiel = CacheClasseur(chemin_snapshot=None)
+        cache_partiel.donnees(classeur)
+
+        def relire():
+            cache_partiel.invalider('Planning_Production')
+            return cache_partiel.donnees(classeur)
+        return relire
+
+    def statuts(onglet, colonne, ids, index):
+        return lambda: maj_statuts_ordres(classeur, onglet, colonne, ids, 'En cours', index=index)
+
+    liste = [
+        ('charger_donnees (froid)', chargement_froid, sum(len(df) for df in data.values())),
+        ('charger_donnees (chaud, classeur inchangé)', chargement_chaud(), 0),
+        ('charger_donnees (1 onglet invalidé)', chargement_un_onglet(), len(planning_of)),
+        ('generer_planning_production', lambda: generer_planning_production(data), len(data['Previsions'])),
+        ('ordonnancer_production', lambda: ordonnancer_production(data, annee=2025), len(data['Previsions'])),
+        ('allouer_lots (fifo)', lambda: allouer_lots(data, PREMIERE_SEMAINE), len(data['Previsions'])),
+        ('index planning OF (construction)', lambda: IndexPlanning(planning_of, 'Ligne_Prod'), len(planning_of)),
+        ('OF du jour (index)', lambda: index_of.jour(jour), len(planning_of)),
+        ('OF semaine + ligne (index)', lambda: index_of.selection(semaine, index_of.lignes[0]), len(planning_of)),
+        ('calculer_alertes', lambda: calculer_alertes(data), len(data['Lots'])),
+        ('evaluer_scenarios (référence + 2)', lambda: evaluer_scenarios(
+            data, [{'nom': '+15 %', 'facteur_previsions': 1.15}, {'nom': '3 équipes', 'equipes': {'L2': 3}}]),
+         len(data['Previsions'])),
+    ]
+    for methode in METHODES:
+        liste.append((f'calculer_extrapolation ({methode})',
+                      lambda m=methode: calculer_extrapolation(data, methode=m), len(data['Previsions'])))
+    liste += [
+        ('statut OF', statuts('Planning_Production', 'OF_ID', ids_of,
+                              cache.index_lignes('Planning_Production')), len(ids_of)),
+        ('statut OL', statuts('Planning_Lavage', 'ID_Lavage', ids_ol,
+                              cache.index_lignes('Planning_Lavage')), len(ids_ol)),
+        ('export Excel', lambda: exporter_excel(data), sum(len(df) for df in data.values())),
+        ('export CSV (zip)', lambda: exporter(data, 'csv'), sum(len(df) for df in data.values())),
+    ]
+    if PARQUET_DISPONIBLE:
+        liste.append(('export Parquet (zip)', lambda: exporter(data, 'parquet'), sum(len(df) for df in data.values())))
+    if PDF_AVAILABLE:
+        def sans_cache(generer, ordres):
+            cache_pages.vider()
+            return generer(ordres)
+
+        liste += [
+            ('PDF OF', lambda: sans_cache(generer_pdf_of, liste_of), len(liste_of)),
+            ('PDF OL', lambda: sans_cache(generer_pdf_ol, liste_ol), len(liste_ol)),
+            ('PDF OF (pages en cache)', lambda: generer_pdf_of(liste_of), len(liste_of)),
+            ('PDF OF en masse (semaine)', lambda: os.remove(generer_pdf_masse('OF', semaine_of)), len(semaine_of)),
+        ]
+    return liste
+
+def version_code():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=RACINE,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except Exception:
+        return None
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--tailles', type=int, nargs='+', default=list(TAILLES))
+    parser.add_argument('--latence', type=float, default=0.0,
+                        help="secondes ajoutées à chaque appel d'API simulé")
+    parser.add_argument('--repetitions', type=int, default=3)
+    parser.add_argument('--sortie', help="fichier JSON des résultats")
+    args = parser.parse_args()
+
+    resultats = []
+    print(f"{'Taille':>7} {'Étape':<45} {'Lignes':>9} {'Temps (s)':>10} {'Appels API':>11}")
+
+    for facteur in args.tailles:
+        data = classeur_synthetique(facteur)
+        classeur = ClasseurLocal.depuis_dataframes(data, latence=args.latence)
+        # Données telles que l'application les reçoit (types issus de la feuille)
+        data, _ = CacheClasseur(chemin_snapshot=None).donnees(classeur)
+
+        for nom, fonction, lignes in etapes(classeur, data):
+            repetitions = 1 if facteur >= 100 else args.repetitions
+            secondes, appels, _ = mesurer(classeur, fonction, repetitions)
+            resultats.append({'taille': facteur, 'etape': nom, 'lignes': lignes,
+                              'secondes': round(secondes, 6), 'appels_api': appels})
+            print(f"{facteur:>6}× {nom:<45} {lignes:>9} {secondes:>10.4f} {appels:>11}")
+
+    sortie = args.sortie or os.path.join(
+        REPERTOIRE_RESULTATS, f"bench_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+    os.makedirs(os.path.dirname(sortie) or '.', exist_ok=True)
+    with open(sortie, 'w', encoding='utf-8') as f:
+        json.dump({
+            'date': datetime.now().isoformat(timespec='seconds'),
+            'commit': version_code(),
+            'python': platform.python_version(),
+            'pandas': pd.__version__,
+            'machine': platform.machine(),
+            'latence': args.latence,
+            'resultats': resultats,
+        }, f, ensure_ascii=False, indent=2)
+    print(f"✅ Résultats : {sortie}")
+
+if __name__ == "__main__":
+    main()
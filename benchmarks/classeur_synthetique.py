@@ -0,0 +1,213 @@
+"""
+CLASSEUR SYNTHÉTIQUE - LES 11 ONGLETS AU FORMAT DE PRODUCTION
+`facteur` × la taille actuelle (≈ 30 produits, 6 semaines, 600 OF)
+"""
+
+from datetime import date, timedelta
+
+import numpy as np
+import pandas as pd
+
+NB_PRODUITS = 30
+NB_SEMAINES = 6
+NB_LIGNES = 4
+NB_VARIETES = 8
+NB_LOTS = 40
+NB_OF = 600
+NB_OL = 120
+
+# Lundi de la première semaine planifiée
+PREMIER_LUNDI = date(2025, 11, 17)
+PREMIERE_SEMAINE = 47
+
+STATUTS_ORDRES = ['Planifié', 'Planifié', 'Planifié', 'En cours', 'Terminé']
+
+def _dates(rng, nb, nb_semaines):
+    """Dates ouvrées réparties sur les semaines planifiées"""
+    semaines = rng.integers(0, nb_semaines, nb)
+    jours = rng.integers(0, 5, nb)
+    lundis = np.array([PREMIER_LUNDI + timedelta(weeks=int(s)) for s in range(nb_semaines)])
+    dates = [lundis[s] + timedelta(days=int(j)) for s, j in zip(semaines, jours)]
+    return semaines + PREMIERE_SEMAINE, [d.strftime('%Y-%m-%d') for d in dates]
+
+def _heures(rng, nb):
+    debut = rng.choice([5, 6, 13, 14, 21], nb)
+    duree = rng.integers(2, 8, nb)
+    return [f'{h:02d}:00' for h in debut], [f'{(h + d) % 24:02d}:00' for h, d in zip(debut, duree)]
+
+def classeur_synthetique(facteur=1, graine=0):
+    """{onglet: DataFrame} avec les colonnes lues et écrites par l'application"""
+    rng = np.random.default_rng(graine)
+    nb_produits = NB_PRODUITS * facteur
+    nb_lignes = NB_LIGNES * max(1, facteur // 10)
+    nb_semaines = min(NB_SEMAINES * facteur, 52)
+    nb_lots = NB_LOTS * facteur
+    nb_of = NB_OF * facteur
+    nb_ol = NB_OL * facteur
+
+    varietes = pd.DataFrame({
+        'Code_Variété': [f'VAR{i:02d}' for i in range(NB_VARIETES)],
+        'Nom_Variété': [f'Variété {i}' for i in range(NB_VARIETES)],
+        'Taux_Déchet_Moyen': rng.uniform(0.15, 0.3, NB_VARIETES).round(3),
+    })
+    codes_varietes = varietes['Code_Variété'].to_numpy()
+
+    codes_lignes = [f'L{i}' for i in range(1, nb_lignes + 1)]
+    lignes = pd.DataFrame({
+        'Code_Ligne': codes_lignes + ['LAV1', 'LAV2'],
+        'Nom_Ligne': [f'Ligne {c}' for c in codes_lignes] + ['Laveuse 1', 'Laveuse 2'],
+        'Type': ['Production'] * nb_lignes + ['Lavage'] * 2,
+        'Capacité_T_h': rng.integers(5, 15, nb_lignes + 2),
+        'Nb_Équipes': rng.integers(1, 4, nb_lignes + 2),
+    })
+
+    codes_produits = [f'P{i:04d}' for i in range(nb_produits)]
+    produits = pd.DataFrame({
+        'Code_Produit': codes_produits,
+        'Libellé': [f'Produit {i}' for i in range(nb_produits)],
+        'Code_Variété': rng.choice(codes_varietes, nb_produits),
+        'Ligne_Affectée': rng.choice(codes_lignes, nb_produits),
+        'Actif': rng.choice(['OUI', 'OUI', 'OUI', 'NON'], nb_produits),
+    })
+
+    tonnage_lots = rng.uniform(20, 200, nb_lots).round(1)
+    lots = pd.DataFrame({
+        'Lot_ID': [f'LOT_{i:05d}' for i in range(1, nb_lots + 1)],
+        'Code_Variété': rng.choice(codes_varietes, nb_lots),
+        'Producteur': rng.choice(['Dupont', 'Martin', 'Bernard', 'Petit'], nb_lots),
+        'Date_Réception': '2025-10-01',
+        'Tonnage_Brut': tonnage_lots,
+        'Tonnage_Brut_Restant': (tonnage_lots * rng.uniform(0, 1, nb_lots)).round(1),
+        'Taux_Déchet_Estimé': rng.uniform(0.15, 0.3, nb_lots).round(3),
+        'Type_Lot': rng.choice(['Brut', 'Lavé'], nb_lots),
+        'Statut': rng.choice(['Stock_Brut', 'Stock_Brut', 'Épuisé'], nb_lots),
+    })
+
+    semaines = np.repeat(np.arange(PREMIERE_SEMAINE, PREMIERE_SEMAINE + nb_semaines), nb_produits)
+    previsions = pd.DataFrame({
+        'Semaine_Num': semaines,
+        'Date_Début': '',
+        'Code_Produit': np.tile(codes_produits, nb_semaines),
+        'Volume_Prévu_T': rng.uniform(1, 80, len(semaines)).round(1),
+        'Type_Prévision': 'SAISIE',
+        'Statut': 'Ferme',
+        'Commentaire': '',
+        'Saisi_Par': 'ADV',
+        'Date_Saisie': '2025-11-01',
+        'Modifié_Le': '',
+    })
+
+    nb_aff = max(nb_produits // 2, 1)
+    affectations = pd.DataFrame({
+        'ID_Affectation': [f'AFF_{i:03d}' for i in range(1, nb_aff + 1)],
+        'Date_Création': '2025-11-01 08:00',
+        'Code_Produit': rng.choice(codes_produits, nb_aff),
+        'Semaine_Début': PREMIERE_SEMAINE,
+        'Semaine_Fin': rng.choice(['48', '50', 'Épuisement'], nb_aff),
+        'Lot_ID': rng.choice(lots['Lot_ID'], nb_aff),
+        'Tonnage_Dispo': rng.uniform(20, 150, nb_aff).round(1),
+        'Tonnage_Brut_Requis': rng.uniform(10, 150, nb_aff).round(1),
+        'Écart_T': rng.uniform(-30, 60, nb_aff).round(1),
+        'Statut_Affectation': rng.choice(['Active', 'Active', 'Clôturée'], nb_aff),
+        'Source': 'Streamlit',
+        'Commentaire': '',
+    })
+
+    sem_ol, dates_ol = _dates(rng, nb_ol, nb_semaines)
+    debut_ol, fin_ol = _heures(rng, nb_ol)
+    lots_ol = rng.integers(0, nb_lots, nb_ol)
+    planning_lavage = pd.DataFrame({
+        'ID_Lavage': [f'OL_{i:05d}' for i in range(1, nb_ol + 1)],
+        'Semaine_Num': sem_ol,
+        'Date': dates_ol,
+        'Heure_Début': debut_ol,
+        'Heure_Fin': fin_ol,
+        'Ligne_Lavage': rng.choice(['LAV1', 'LAV2'], nb_ol),
+        'Lot_ID': lots['Lot_ID'].to_numpy()[lots_ol],
+        'Code_Variété': lots['Code_Variété'].to_numpy()[lots_ol],
+        'Tonnage_Brut': rng.uniform(5, 40, nb_ol).round(1),
+        'Statut': rng.choice(STATUTS_ORDRES, nb_ol),
+    })
+
+    sem_of, dates_of = _dates(rng, nb_of, nb_semaines)
+    debut_of, fin_of = _heures(rng, nb_of)
+    produits_of = rng.integers(0, nb_produits, nb_of)
+    planning_production = pd.DataFrame({
+        'OF_ID': [f'OF_{i:05d}' for i in range(1, nb_of + 1)],
+        'Semaine_Num': sem_of,
+        'Date': dates_of,
+        'Heure_Début': debut_of,
+        'Heure_Fin': fin_of,
+        'Ligne_Prod': produits['Ligne_Affectée'].to_numpy()[produits_of],
+        'Code_Produit': produits['Code_Produit'].to_numpy()[produits_of],
+        'Équipe': rng.choice(['Unique', 'Équipe_1', 'Équipe_2'], nb_of),
+        'Tonnage_Planifié': rng.uniform(1, 12, nb_of).round(2),
+        'Statut': rng.choice(STATUTS_ORDRES, nb_of),
+    })
+
+    nb_laves = max(nb_ol // 4, 1)
+    brut_laves = rng.uniform(5, 40, nb_laves).round(1)
+    net_laves = (brut_laves * 0.78).round(1)
+    lots_laves = pd.DataFrame({
+        'Stock_Lavé_ID': [f'SL_{i:03d}' for i in range(1, nb_laves + 1)],
+        'Lot_ID': planning_lavage['Lot_ID'].to_numpy()[:nb_laves],
+        'ID_Lavage': planning_lavage['ID_Lavage'].to_numpy()[:nb_laves],
+        'Date_Lavage': planning_lavage['Date'].to_numpy()[:nb_laves],
+        'Ligne_Lavage': planning_lavage['Ligne_Lavage'].to_numpy()[:nb_laves],
+        'Code_Variété': planning_lavage['Code_Variété'].to_numpy()[:nb_laves],
+        'Tonnage_Brut': brut_laves,
+        'Tonnage_Net': net_laves,
+        'Taux_Déchet': 0.22,
+        'Taux_Purs': 0.18,
+        'Taux_Grenailles': 0.03,
+        'Taux_Terre': 0.01,
+        'Zone_Stockage': rng.choice(['Z1', 'Z2', 'Z3'], nb_laves),
+        'Tonnage_Net_Restant': net_laves,
+        'Statut': 'Disponible',
+        'Date_Création': '2025-11-17 10:00',
+    })
+
+    besoin = rng.uniform(50, 500, NB_VARIETES).round(1)
+    stock = rng.uniform(50, 500, NB_VARIETES).round(1)
+    ecart = (stock - besoin).round(1)
+    alertes = pd.DataFrame({
+        'Code_Variété': codes_varietes,
+        'Besoin_T': besoin,
+        'Stock_T': stock,
+        'Écart_T': ecart,
+        'Statut': np.where(ecart < 0, '❌ MANQUE', np.where(ecart < 50, '⚠️ LIMITE', '✅ OK')),
+        'Action_Recommandée': np.where(ecart < 0, 'Approvisionner', ''),
+    })
+
+    parametres = pd.DataFrame({
+        'Paramètre': ['Heures_Par_Équipe', 'Jours_Par_Semaine', 'Seuil_Alerte_T'],
+        'Valeur': [8, 5, 50],
+    })
+
+    return {
+        'REF_Variétés': varietes,
+        'REF_Lignes': lignes,
+        'Produits': produits,
+        'Lots': lots,
+        'Lots_Lavés': lots_laves,
+        'Previsions': previsions,
+        'Affectations': affectations,
+        'Planning_Lavage': planning_lavage,
+        'Planning_Production': planning_production,
+        'Alerte_Stocks': alertes,
+        'Parametres': parametres,
+    }
+
+if __name__ == "__main__":
+    # python benchmarks/classeur_synthetique.py [facteur] [chemin.xlsx]
+    # Fichier utilisable avec PLANNING_CLASSEUR_LOCAL=<chemin> streamlit run app.py
+    import os
+    import sys
+
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    from sheets_local import ClasseurLocal
+
+    facteur = int(sys.argv[1]) if len(sys.argv) > 1 else 1
+    chemin = sys.argv[2] if len(sys.argv) > 2 else f'classeur_synthetique_x{facteur}.xlsx'
+    ClasseurLocal.depuis_dataframes(classeur_synthetique(facteur)).enregistrer(chemin)
+    print(f"✅ {chemin}")
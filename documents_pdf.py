@@ -0,0 +1,348 @@
+"""
+GÉNÉRATION DES PDF OF / OL
+Module sans dépendance Streamlit (utilisable depuis app.py et depuis un script)
+"""
+
+import hashlib
+import json
+import multiprocessing
+import os
+import shutil
+import tempfile
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+
+# Tentative d'import du module PDF
+try:
+    from reportlab.lib.pagesizes import A4
+    from reportlab.lib.units import cm
+    from reportlab.lib import colors
+    from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer, PageBreak
+    from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+    from reportlab.lib.enums import TA_CENTER
+    PDF_AVAILABLE = True
+except Exception as e:
+    PDF_AVAILABLE = False
+    print(f"PDF module not available: {e}")
+
+# Fusion des lots rendus en parallèle (sinon rendu en un seul processus)
+try:
+    from pypdf import PdfReader, PdfWriter
+    FUSION_DISPONIBLE = True
+except Exception:
+    FUSION_DISPONIBLE = False
+
+# Impression en masse : pages par lot et processus de rendu
+TAILLE_LOT_PDF = 25
+PROCESSUS_PDF = int(os.environ.get('PLANNING_PROCESSUS_PDF', 0)) or min(4, os.cpu_count() or 1)
+
+# Cache des pages d'ordre rendues (Mo), éviction LRU au-delà
+TAILLE_CACHE_PAGES_MO = int(os.environ.get('PLANNING_CACHE_PAGES_MO', 32))
+
+_styles = None
+_verrou_pool = threading.Lock()
+_pool = None
+
+# =============================================================================
+# STYLES ET PAGES
+# =============================================================================
+
+def styles_pdf():
+    """Styles compilés une seule fois par processus"""
+    global _styles
+    if _styles is None:
+        styles = getSampleStyleSheet()
+        _styles = {
+            'titre': ParagraphStyle('Titre', parent=styles['Heading1'],
+                                    fontSize=20, textColor=colors.HexColor('#6B7F3B'),
+                                    alignment=TA_CENTER, spaceAfter=20),
+            'pied': ParagraphStyle('Footer', parent=styles['Normal'],
+                                   fontSize=8, textColor=colors.grey, alignment=TA_CENTER),
+            'infos': TableStyle([
+                ('BACKGROUND', (0, 0), (0, -1), colors.HexColor('#F5F5F0')),
+                ('GRID', (0, 0), (-1, -1), 1, colors.grey),
+                ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
+                ('FONTSIZE', (0, 0), (-1, -1), 11),
+                ('LEFTPADDING', (0, 0), (-1, -1), 10),
+                ('TOPPADDING', (0, 0), (-1, -1), 8),
+                ('BOTTOMPADDING', (0, 0), (-1, -1), 8),
+            ]),
+            'saisie': TableStyle([
+                ('GRID', (0, 0), (-1, -1), 0.5, colors.lightgrey),
+                ('FONTSIZE', (0, 0), (-1, -1), 11),
+                ('LEFTPADDING', (0, 0), (-1, -1), 10),
+            ]),
+        }
+    return _styles
+
+def _page(titre, infos, saisie, styles):
+    """Flowables d'une page d'ordre : en-tête, informations, cases à remplir, pied"""
+    info_table = Table(infos, colWidths=[5*cm, 12*cm])
+    info_table.setStyle(styles['infos'])
+    saisie_table = Table(saisie, colWidths=[5*cm, 12*cm])
+    saisie_table.setStyle(styles['saisie'])
+
+    return [
+        Paragraph("🥔 CULTURE POM", styles['titre']),
+        Paragraph(titre, styles['titre']),
+        Spacer(1, 0.5*cm),
+        info_table,
+        Spacer(1, 1*cm),
+        saisie_table,
+        Spacer(1, 1*cm),
+        Paragraph("🇫🇷 3Force Consulting × Culture Pom © 2025", styles['pied']),
+    ]
+
+def contenu_of(of):
+    """(titre, informations, cases à remplir) de la page d'un OF"""
+    return (
+        f"ORDRE DE FABRICATION N° {of.get('OF_ID', 'N/A')}",
+        [
+            ['Ligne', of.get('Ligne_Prod', 'N/A')],
+            ['Produit', of.get('Code_Produit', 'N/A')],
+            ['Tonnage', f"{of.get('Tonnage_Planifié', 0):.2f} T"],
+            ['Heure', f"{of.get('Heure_Début', '')} - {of.get('Heure_Fin', '')}"],
+            ['Équipe', of.get('Équipe', 'N/A')],
+        ],
+        [
+            ['Tonnage réalisé', '_______ T'],
+            ['Heure début', '___:___'],
+            ['Heure fin', '___:___'],
+            ['Opérateur', '_______________________'],
+            ['Signature', '_______________________'],
+        ],
+    )
+
+def contenu_ol(ol):
+    """(titre, informations, cases à remplir) de la page d'un OL"""
+    return (
+        f"ORDRE DE LAVAGE N° {ol.get('ID_Lavage', 'N/A')}",
+        [
+            ['Ligne lavage', ol.get('Ligne_Lavage', 'N/A')],
+            ['Lot ID', ol.get('Lot_ID', 'N/A')],
+            ['Variété', ol.get('Code_Variété', 'N/A')],
+            ['Tonnage brut', f"{ol.get('Tonnage_Brut', 0):.2f} T"],
+            ['Heure', f"{ol.get('Heure_Début', '')} - {ol.get('Heure_Fin', '')}"],
+        ],
+        [
+            ['Tonnage net obtenu', '_______ T'],
+            ['Taux déchet réel', '_______ %'],
+            ['  • Purs', '_______ %'],
+            ['  • Grenailles', '_______ %'],
+            ['  • Terre', '_______ %'],
+            ['Opérateur', '_______________________'],
+            ['Signature', '_______________________'],
+        ],
+    )
+
+def page_of(of, styles):
+    return _page(*contenu_of(of), styles)
+
+def page_ol(ol, styles):
+    return _page(*contenu_ol(ol), styles)
+
+PAGES = {'OF': page_of, 'OL': page_ol}
+CONTENUS = {'OF': contenu_of, 'OL': contenu_ol}
+
+def construire_pdf(type_ordre, ordres, sortie):
+    """Écrit le PDF (une page par ordre) dans `sortie` : chemin ou fichier ouvert"""
+    doc = SimpleDocTemplate(sortie, pagesize=A4, topMargin=2*cm, bottomMargin=2*cm,
+                            leftMargin=2*cm, rightMargin=2*cm)
+    styles = styles_pdf()
+    page = PAGES[type_ordre]
+
+    story = []
+    for idx, ordre in enumerate(ordres):
+        if idx > 0:
+            story.append(PageBreak())
+        story.extend(page(ordre, styles))
+
+    doc.build(story)
+
+# =============================================================================
+# CACHE DES PAGES RENDUES
+# =============================================================================
+
+def empreinte_page(type_ordre, ordre):
+    """Empreinte du contenu imprimé d'une page : deux ordres identiques à l'impression partagent leur page"""
+    contenu = json.dumps([type_ordre, CONTENUS[type_ordre](ordre)], default=str, ensure_ascii=False)
+    return hashlib.sha256(contenu.encode('utf-8')).hexdigest()
+
+class CachePages:
+    """Pages PDF d'une page chacune, indexées par empreinte, bornées en octets (LRU)"""
+
+    def __init__(self, taille_max):
+        self.taille_max = taille_max
+        self.taille = 0
+        self.succes = 0
+        self.echecs = 0
+        self._pages = OrderedDict()
+        self._verrou = threading.Lock()
+
+    def lire(self, cle):
+        with self._verrou:
+            page = self._pages.get(cle)
+            if page is None:
+                self.echecs += 1
+                return None
+            self._pages.move_to_end(cle)
+            self.succes += 1
+            return page
+
+    def ecrire(self, cle, page):
+        if len(page) > self.taille_max:
+            return
+        with self._verrou:
+            ancienne = self._pages.pop(cle, None)
+            if ancienne is not None:
+                self.taille -= len(ancienne)
+            self._pages[cle] = page
+            self.taille += len(page)
+            while self.taille > self.taille_max:
+                _, evincee = self._pages.popitem(last=False)
+                self.taille -= len(evincee)
+
+    def vider(self):
+        with self._verrou:
+            self._pages.clear()
+            self.taille = 0
+
+    def statistiques(self):
+        with self._verrou:
+            return {'pages': len(self._pages), 'octets': self.taille,
+                    'succes': self.succes, 'echecs': self.echecs}
+
+cache_pages = CachePages(TAILLE_CACHE_PAGES_MO * 1024 * 1024)
+
+def _rendre_pages(type_ordre, ordres):
+    """PDF (d'une page en principe) de chaque ordre : un seul rendu ReportLab, puis découpage page à page"""
+    buffer = BytesIO()
+    construire_pdf(type_ordre, ordres, buffer)
+    if len(ordres) == 1:
+        return [buffer.getvalue()]
+
+    buffer.seek(0)
+    lecteur = PdfReader(buffer)
+    if len(lecteur.pages) != len(ordres):
+        # Un ordre déborde sur plusieurs pages : rendu ordre par ordre
+        return [_rendre_pages(type_ordre, [ordre])[0] for ordre in ordres]
+
+    pages = []
+    for page in lecteur.pages:
+        ecriture = PdfWriter()
+        ecriture.add_page(page)
+        sortie = BytesIO()
+        ecriture.write(sortie)
+        pages.append(sortie.getvalue())
+    return pages
+
+def generer_pdf(type_ordre, ordres, cache=None):
+    """PDF des ordres (une page par ordre), renvoyé dans un BytesIO
+
+    Chaque page est reprise du cache si son contenu n'a pas changé depuis la
+    dernière impression ; seules les pages nouvelles ou modifiées sont rendues
+    (en un seul document), puis toutes sont assemblées dans l'ordre demandé.
+    Sans pypdf : rendu complet à chaque fois.
+    """
+    buffer = BytesIO()
+    if not FUSION_DISPONIBLE or not ordres:
+        construire_pdf(type_ordre, ordres, buffer)
+        buffer.seek(0)
+        return buffer
+
+    cache = cache or cache_pages
+    cles = [empreinte_page(type_ordre, ordre) for ordre in ordres]
+    pages = {}
+    for cle in dict.fromkeys(cles):
+        page = cache.lire(cle)
+        if page is not None:
+            pages[cle] = page
+
+    a_rendre = {cle: ordre for cle, ordre in zip(cles, ordres) if cle not in pages}
+    if a_rendre:
+        for cle, page in zip(a_rendre, _rendre_pages(type_ordre, list(a_rendre.values()))):
+            pages[cle] = page
+            cache.ecrire(cle, page)
+
+    assemblage = PdfWriter()
+    for cle in cles:
+        assemblage.append(BytesIO(pages[cle]))
+    assemblage.write(buffer)
+    assemblage.close()
+    buffer.seek(0)
+    return buffer
+
+def generer_pdf_of(liste_of):
+    """PDF des OF (une page par ordre), renvoyé dans un BytesIO"""
+    return generer_pdf('OF', liste_of)
+
+def generer_pdf_ol(liste_ol):
+    """PDF des OL (une page par ordre), renvoyé dans un BytesIO"""
+    return generer_pdf('OL', liste_ol)
+
+# =============================================================================
+# IMPRESSION EN MASSE (PLAGE DE DATES, RENDU PARALLÈLE)
+# =============================================================================
+
+def _rendre_lot(type_ordre, ordres, chemin):
+    """Exécuté dans un processus de rendu"""
+    construire_pdf(type_ordre, ordres, chemin)
+    return chemin
+
+def _obtenir_pool():
+    """Pool de rendu partagé, démarré au premier usage ('spawn' : sûr avec les threads du serveur)"""
+    global _pool
+    with _verrou_pool:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=PROCESSUS_PDF,
+                                        mp_context=multiprocessing.get_context('spawn'))
+        return _pool
+
+def _abandonner_pool():
+    global _pool
+    with _verrou_pool:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+def generer_pdf_masse(type_ordre, ordres, processus=None):
+    """PDF de tous les ordres écrit dans un fichier temporaire dont le chemin est renvoyé
+
+    Les ordres sont découpés en lots de TAILLE_LOT_PDF pages rendus en
+    parallèle, puis fusionnés page à page dans le fichier final. Sans pypdf,
+    avec un seul processus ou peu de pages : rendu direct dans le fichier.
+    L'appelant supprime le fichier une fois envoyé.
+    """
+    descripteur, chemin = tempfile.mkstemp(prefix=f'{type_ordre}_', suffix='.pdf')
+    os.close(descripteur)
+
+    processus = processus or PROCESSUS_PDF
+    if not FUSION_DISPONIBLE or processus < 2 or len(ordres) <= TAILLE_LOT_PDF:
+        construire_pdf(type_ordre, ordres, chemin)
+        return chemin
+
+    repertoire = tempfile.mkdtemp(prefix='pdf_lots_')
+    try:
+        lots = [ordres[i:i + TAILLE_LOT_PDF] for i in range(0, len(ordres), TAILLE_LOT_PDF)]
+        chemins = [os.path.join(repertoire, f'{i:05d}.pdf') for i in range(len(lots))]
+        try:
+            pool = _obtenir_pool()
+            list(pool.map(_rendre_lot, [type_ordre] * len(lots), lots, chemins))
+        except Exception as e:
+            # Pool indisponible (processus tué, limites du conteneur) : rendu direct
+            print(f"Rendu parallèle impossible, rendu séquentiel : {e}")
+            _abandonner_pool()
+            construire_pdf(type_ordre, ordres, chemin)
+            return chemin
+
+        fusion = PdfWriter()
+        for chemin_lot in chemins:
+            fusion.append(chemin_lot)
+        with open(chemin, 'wb') as f:
+            fusion.write(f)
+        fusion.close()
+        return chemin
+    finally:
+        shutil.rmtree(repertoire, ignore_errors=True)
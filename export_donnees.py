@@ -0,0 +1,206 @@
+"""
+EXPORT DES DONNÉES
+Classeur Excel, archive CSV ou Parquet des onglets choisis (sans dépendance Streamlit)
+"""
+
+import io
+import tempfile
+import threading
+import zipfile
+from collections import OrderedDict
+from io import BytesIO
+
+import pandas as pd
+import xlsxwriter
+
+from schema_donnees import colonne_dates
+
+# Parquet (pyarrow) : format proposé seulement s'il est installé
+try:
+    import pyarrow  # noqa: F401
+    PARQUET_DISPONIBLE = True
+except Exception:
+    PARQUET_DISPONIBLE = False
+
+# Lignes converties / écrites à la fois : borne la mémoire quel que soit l'onglet
+TAILLE_TRANCHE = 5000
+# Fichier d'export gardé en mémoire jusqu'à cette taille, puis sur disque
+TAILLE_MAX_MEMOIRE = 8 * 1024 * 1024
+# Exports terminés conservés sur disque (un par combinaison onglets / filtres / versions)
+EXPORTS_EN_CACHE = 8
+
+ONGLETS_EXCLUS = ('Calendrier',)
+# Colonnes utilisées pour filtrer un onglet par dates ou par semaines
+COLONNES_DATE = ('Date', 'Date_Lavage')
+COLONNE_SEMAINE = 'Semaine_Num'
+
+FORMATS = {
+    'xlsx': ('Excel', 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet', 'xlsx'),
+    'csv': ('CSV (zip)', 'application/zip', 'csv.zip'),
+    'parquet': ('Parquet (zip)', 'application/zip', 'parquet.zip'),
+}
+
+def formats_disponibles():
+    return [f for f in FORMATS if f != 'parquet' or PARQUET_DISPONIBLE]
+
+def onglets_exportables(data):
+    return [nom for nom, df in data.items() if len(df) > 0 and nom not in ONGLETS_EXCLUS]
+
+# =============================================================================
+# FILTRES
+# =============================================================================
+
+def filtrer_onglet(df, periode=None, semaines=None):
+    """Lignes de l'onglet dans la période (dates incluses) et/ou les semaines (bornes incluses)
+
+    Un onglet sans colonne de date (ou de semaine) est exporté en entier
+    pour ce filtre : tables de référence, paramètres.
+    """
+    masque = pd.Series(True, index=df.index)
+
+    if periode is not None:
+        colonne = next((c for c in COLONNES_DATE if c in df.columns), None)
+        if colonne is not None:
+            dates = colonne_dates(df, colonne).dt.date
+            masque &= (dates >= periode[0]) & (dates <= periode[1])
+
+    if semaines is not None and COLONNE_SEMAINE in df.columns:
+        numeros = pd.to_numeric(df[COLONNE_SEMAINE], errors='coerce')
+        masque &= (numeros >= semaines[0]) & (numeros <= semaines[1])
+
+    return df if masque.all() else df[masque]
+
+# =============================================================================
+# ÉCRITURE PAR TRANCHES
+# =============================================================================
+
+def _tranches(df):
+    """Tranches de lignes en objets Python (NaN/NaT -> None, ce qu'xlsxwriter laisse vide)"""
+    for debut in range(0, len(df), TAILLE_TRANCHE):
+        tranche = df.iloc[debut:debut + TAILLE_TRANCHE].astype(object)
+        yield tranche.where(tranche.notna(), None).itertuples(index=False, name=None)
+
+def _ecrire_xlsx(onglets, sortie):
+    """Mode constant_memory : chaque ligne est écrite sur disque dès la suivante commencée"""
+    classeur = xlsxwriter.Workbook(sortie, {'constant_memory': True, 'strings_to_formulas': False,
+                                            'strings_to_urls': False, 'default_date_format': 'yyyy-mm-dd'})
+    entete = classeur.add_format({'bold': True})
+    for nom, df in onglets.items():
+        feuille = classeur.add_worksheet(nom[:31])
+        feuille.write_row(0, 0, [str(c) for c in df.columns], entete)
+        ligne = 1
+        for tranche in _tranches(df):
+            for valeurs in tranche:
+                feuille.write_row(ligne, 0, valeurs)
+                ligne += 1
+    classeur.close()
+
+def _ecrire_csv(onglets, sortie):
+    with zipfile.ZipFile(sortie, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+        for nom, df in onglets.items():
+            with archive.open(f'{nom}.csv', 'w') as brut, \
+                    io.TextIOWrapper(brut, encoding='utf-8-sig', newline='') as texte:
+                for debut in range(0, max(len(df), 1), TAILLE_TRANCHE):
+                    df.iloc[debut:debut + TAILLE_TRANCHE].to_csv(texte, index=False, header=debut == 0)
+
+def _ecrire_parquet(onglets, sortie):
+    # Parquet est déjà compressé : stocké tel quel dans l'archive
+    with zipfile.ZipFile(sortie, 'w', compression=zipfile.ZIP_STORED) as archive:
+        for nom, df in onglets.items():
+            # Colonnes texte des feuilles parfois mêlées de nombres : typées en chaînes
+            mixtes = {c: 'string' for c in df.columns if df[c].dtype == object}
+            with archive.open(f'{nom}.parquet', 'w') as brut:
+                df.astype(mixtes).to_parquet(brut, index=False)
+
+ECRITURES = {'xlsx': _ecrire_xlsx, 'csv': _ecrire_csv, 'parquet': _ecrire_parquet}
+
+# =============================================================================
+# EXPORTS EN CACHE
+# =============================================================================
+
+class CacheExports:
+    """Fichiers d'export terminés, par clé (classeur, format, onglets, filtres, versions), LRU
+
+    Les fichiers gardés sont basculés sur disque : le cache n'occupe pas de
+    mémoire, seul le contenu relu à chaque téléchargement y passe.
+    """
+
+    def __init__(self, taille_max=EXPORTS_EN_CACHE):
+        self.taille_max = taille_max
+        self._fichiers = OrderedDict()
+        self._verrou = threading.Lock()
+
+    def lire(self, cle):
+        """Contenu du fichier en cache (None s'il n'y est pas)"""
+        with self._verrou:
+            fichier = self._fichiers.get(cle)
+            if fichier is None:
+                return None
+            self._fichiers.move_to_end(cle)
+            fichier.seek(0)
+            return fichier.read()
+
+    def ecrire(self, cle, fichier):
+        fichier.rollover()
+        with self._verrou:
+            ancien = self._fichiers.pop(cle, None)
+            if ancien is not None:
+                ancien.close()
+            self._fichiers[cle] = fichier
+            while len(self._fichiers) > self.taille_max:
+                _, evince = self._fichiers.popitem(last=False)
+                evince.close()
+
+    def vider(self):
+        with self._verrou:
+            for fichier in self._fichiers.values():
+                fichier.close()
+            self._fichiers.clear()
+
+cache_exports = CacheExports()
+
+def exporter(data, format_export='xlsx', onglets=None, periode=None, semaines=None, versions=None,
+             classeur=None):
+    """Contenu (bytes) de l'export des onglets choisis, filtrés par période et/ou semaines
+
+    Le fichier est écrit par tranches dans un fichier temporaire « spooled »
+    (en mémoire jusqu'à TAILLE_MAX_MEMOIRE, sur disque au-delà) : seule la
+    génération est bornée. Le résultat, lui, est entièrement en mémoire :
+    st.download_button lit de toute façon le fichier entier (même passé en
+    objet fichier) et le garde en mémoire le temps du téléchargement. Si
+    `versions` ({onglet: version}, voir sync_donnees) et `classeur` (id du
+    classeur, les versions sont propres à chaque classeur) sont fournis, le
+    fichier terminé est gardé en cache sur disque : un nouveau téléchargement
+    des mêmes données ne le régénère pas.
+    """
+    if format_export not in formats_disponibles():
+        raise ValueError(f"Format d'export indisponible : {format_export}")
+
+    onglets = [o for o in (onglets or onglets_exportables(data)) if o in data]
+    cle = None
+    if versions is not None and classeur is not None:
+        cle = (classeur, format_export, tuple(onglets), periode, semaines,
+               tuple(versions.get(o, 0) for o in onglets))
+        contenu = cache_exports.lire(cle)
+        if contenu is not None:
+            return contenu
+
+    selection = {o: filtrer_onglet(data[o], periode, semaines) for o in onglets}
+    fichier = tempfile.SpooledTemporaryFile(max_size=TAILLE_MAX_MEMOIRE)
+    try:
+        ECRITURES[format_export](selection, fichier)
+        fichier.seek(0)
+        contenu = fichier.read()
+    except Exception:
+        fichier.close()
+        raise
+
+    if cle is None:
+        fichier.close()
+    else:
+        cache_exports.ecrire(cle, fichier)
+    return contenu
+
+def exporter_excel(data):
+    """Tous les onglets non vides dans un classeur .xlsx, renvoyé dans un BytesIO"""
+    return BytesIO(exporter(data, 'xlsx'))
@@ -0,0 +1,313 @@
+"""
+FILE D'ÉCRITURES GOOGLE SHEETS EN ARRIÈRE-PLAN
+Écritures regroupées par onglet, débit limité (quota Sheets) et reprises automatiques
+(sans dépendance Streamlit)
+"""
+
+import itertools
+import random
+import threading
+import time
+from collections import OrderedDict, deque
+
+import gspread
+import requests
+
+from sheets_io import CLES_ONGLETS, ajouter_lignes, construire_index, lignes_en_fin, maj_cellules
+
+# Quota Sheets : 60 requêtes d'écriture par minute et par utilisateur
+DEBIT_PAR_MINUTE = 60
+RAFALE = 10
+TENTATIVES_MAX = 6
+DELAI_INITIAL = 1.0
+DELAI_MAX = 32.0
+# Attente avant traitement pour regrouper les clics rapprochés
+DELAI_REGROUPEMENT = 0.5
+# États d'écritures terminées gardés pour le suivi (les plus anciens sont oubliés)
+HISTORIQUE_MAX = 200
+
+CODES_REPRISE = {429, 500, 502, 503, 504}
+# Codes rendus avant tout traitement : la requête n'a certainement pas été appliquée
+CODES_NON_APPLIQUE = {429}
+
+_verrou_registre = threading.Lock()
+_files = {}
+
+class SeauJetons:
+    """Limiteur de débit : `capacite` requêtes d'affilée, puis `debit` par seconde"""
+
+    def __init__(self, debit, capacite):
+        self.debit = debit
+        self.capacite = capacite
+        self.jetons = float(capacite)
+        self.dernier = time.monotonic()
+        self._verrou = threading.Lock()
+
+    def prendre(self):
+        """Bloque jusqu'à disposer d'un jeton"""
+        while True:
+            with self._verrou:
+                maintenant = time.monotonic()
+                self.jetons = min(self.capacite, self.jetons + (maintenant - self.dernier) * self.debit)
+                self.dernier = maintenant
+                if self.jetons >= 1:
+                    self.jetons -= 1
+                    return
+                attente = (1 - self.jetons) / self.debit
+            time.sleep(attente)
+
+def est_erreur_temporaire(erreur):
+    """Quota dépassé, erreur serveur ou réseau : l'écriture peut être retentée"""
+    if isinstance(erreur, gspread.exceptions.APIError):
+        return erreur.code in CODES_REPRISE
+    return isinstance(erreur, (requests.ConnectionError, requests.Timeout))
+
+class EcritureIncertaine(Exception):
+    """Écriture non idempotente peut-être appliquée : ni reprise, ni échec certain"""
+
+def est_erreur_ambigue(erreur):
+    """Erreur temporaire survenue après l'envoi possible de la requête (déjà appliquée ?)"""
+    if isinstance(erreur, gspread.exceptions.APIError):
+        return erreur.code not in CODES_NON_APPLIQUE
+    return not isinstance(erreur, requests.ConnectTimeout)
+
+def executer_avec_reprises(fonction, seau=None, tentatives=TENTATIVES_MAX, deja_applique=None):
+    """Exécute `fonction()` sous limite de débit, avec reprise exponentielle si erreur temporaire
+
+    Pour une écriture non idempotente (ajout), `deja_applique()` est appelé
+    après une erreur ambiguë (délai de lecture, erreur 5xx...) : vrai, on
+    s'arrête là ; faux, on reprend ; s'il échoue lui-même, EcritureIncertaine.
+    """
+    delai = DELAI_INITIAL
+    for tentative in range(1, tentatives + 1):
+        if seau is not None:
+            seau.prendre()
+        try:
+            return fonction()
+        except Exception as e:
+            if not est_erreur_temporaire(e):
+                raise
+            if deja_applique is not None and est_erreur_ambigue(e):
+                try:
+                    if deja_applique():
+                        return None
+                except Exception as verification:
+                    raise EcritureIncertaine(
+                        f"{e} — peut-être appliquée (vérification impossible : {verification}) ; "
+                        "contrôlez l'onglet avant de recommencer") from e
+            if tentative == tentatives:
+                raise
+            time.sleep(delai + random.uniform(0, delai / 2))
+            delai = min(delai * 2, DELAI_MAX)
+
+def ajouter_sans_doublon(spreadsheet, onglet, lignes, value_input_option='RAW', seau=None, encadrer=None):
+    """ajouter_lignes avec reprises : après une erreur ambiguë, la fin de l'onglet est
+    relue et l'ajout n'est renvoyé que s'il n'y figure pas
+
+    `encadrer(fonction)`, optionnel, enveloppe chaque tentative d'ajout.
+    """
+    ajout = lambda: ajouter_lignes(spreadsheet, onglet, lignes, value_input_option=value_input_option)
+    if encadrer is not None:
+        ajout = encadrer(ajout)
+    return executer_avec_reprises(ajout, seau, deja_applique=lambda: lignes_en_fin(spreadsheet, onglet, lignes))
+
+class FileEcritures:
+    """Écritures différées d'un classeur, traitées par un thread dédié
+
+    Chaque écriture reçoit un identifiant et passe par les états
+    'en_attente' → 'valide', 'echec' ou 'incertain' (ajout peut-être appliqué
+    malgré une erreur réseau, voir executer_avec_reprises). Les écritures en attente sur un
+    même onglet sont fusionnées : une seule requête par onglet et par lot.
+    Chaque état porte la session qui l'a soumis (`session`) : une session ne
+    suit que ses propres écritures et peut acquitter ses échecs ; seuls les
+    HISTORIQUE_MAX derniers états terminés sont conservés.
+    `cache` (CacheClasseur, optionnel) est invalidé pour l'onglet après
+    un ajout ou un échec, afin de revenir à l'état réel du classeur ; le
+    marqueur Drive relevé juste avant et juste après la requête d'écriture
+    qui réussit lui est transmis (adopter_marqueur) pour que nos propres
+    écritures ne déclenchent pas la relecture de tout le classeur.
+    """
+
+    def __init__(self, cache=None, debit_par_minute=DEBIT_PAR_MINUTE, rafale=RAFALE):
+        self.cache = cache
+        self.seau = SeauJetons(debit_par_minute / 60, rafale)
+        self.etats = OrderedDict()
+        self._compteur = itertools.count(1)
+        self._attente = deque()
+        self._condition = threading.Condition()
+        self._thread = threading.Thread(target=self._boucle, daemon=True)
+        self._thread.start()
+
+    # -- Soumission ----------------------------------------------------------
+
+    def _soumettre(self, operation):
+        with self._condition:
+            operation['id'] = next(self._compteur)
+            self.etats[operation['id']] = {
+                'id': operation['id'], 'libelle': operation['libelle'], 'onglet': operation['onglet'],
+                'session': operation['session'], 'etat': 'en_attente', 'message': '', 'soumis': time.time()
+            }
+            self._attente.append(operation)
+            self._condition.notify()
+            return operation['id']
+
+    def mettre_a_jour(self, spreadsheet, onglet, modifications, libelle, index=None, session=None):
+        """Met en file {clé: {colonne: valeur}} pour l'onglet (voir sheets_io.maj_cellules)"""
+        return self._soumettre({'type': 'maj', 'spreadsheet': spreadsheet, 'onglet': onglet,
+                                'modifications': modifications, 'index': index, 'libelle': libelle,
+                                'session': session})
+
+    def ajouter(self, spreadsheet, onglet, lignes, libelle, value_input_option='RAW', session=None):
+        """Met en file un ajout de lignes en fin d'onglet"""
+        return self._soumettre({'type': 'ajout', 'spreadsheet': spreadsheet, 'onglet': onglet,
+                                'lignes': lignes, 'option': value_input_option, 'libelle': libelle,
+                                'session': session})
+
+    # -- Suivi ---------------------------------------------------------------
+
+    def etat(self, session=None):
+        """Compteurs par état et dernières erreurs (de la seule `session` si elle est donnée)"""
+        with self._condition:
+            etats = [e for e in self.etats.values() if session is None or e['session'] == session]
+        return {
+            'en_attente': sum(e['etat'] == 'en_attente' for e in etats),
+            'valide': sum(e['etat'] == 'valide' for e in etats),
+            'echec': sum(e['etat'] == 'echec' for e in etats),
+            'incertain': sum(e['etat'] == 'incertain' for e in etats),
+            'echecs': [e for e in etats if e['etat'] in ('echec', 'incertain')][-10:],
+            'avertissements': [e for e in etats if e['etat'] == 'valide' and e['message']][-10:],
+        }
+
+    def acquitter(self, session=None, ids=None):
+        """Oublie les écritures terminées de la session (ou les seuls `ids`) : elles ne s'affichent plus"""
+        with self._condition:
+            for id_ecriture, e in list(self.etats.items()):
+                if e['etat'] != 'en_attente' and (session is None or e['session'] == session) \
+                        and (ids is None or id_ecriture in ids):
+                    del self.etats[id_ecriture]
+
+    def _elaguer(self):
+        """Garde au plus HISTORIQUE_MAX états terminés (les plus anciens partent en premier)"""
+        termines = [i for i, e in self.etats.items() if e['etat'] != 'en_attente']
+        for id_ecriture in termines[:max(0, len(termines) - HISTORIQUE_MAX)]:
+            del self.etats[id_ecriture]
+
+    def attendre(self, timeout=None):
+        """Attend que toutes les écritures soumises soient traitées"""
+        limite = None if timeout is None else time.monotonic() + timeout
+        with self._condition:
+            while any(e['etat'] == 'en_attente' for e in self.etats.values()):
+                restant = None if limite is None else limite - time.monotonic()
+                if restant is not None and restant <= 0:
+                    return False
+                self._condition.wait(restant)
+        return True
+
+    # -- Traitement ----------------------------------------------------------
+
+    def _boucle(self):
+        while True:
+            with self._condition:
+                while not self._attente:
+                    self._condition.wait()
+            time.sleep(DELAI_REGROUPEMENT)
+            with self._condition:
+                lot = list(self._attente)
+                self._attente.clear()
+
+            for groupe in self._regrouper(lot):
+                self._traiter(groupe)
+
+    @staticmethod
+    def _regrouper(lot):
+        """Fusionne les opérations par (type, onglet) en respectant l'ordre d'arrivée"""
+        groupes = {}
+        for operation in lot:
+            cle = (operation['type'], operation['onglet'], operation.get('option'))
+            groupes.setdefault(cle, []).append(operation)
+        return list(groupes.values())
+
+    def _marqueur(self, spreadsheet):
+        if self.cache is None:
+            return None
+        try:
+            return spreadsheet.get_lastUpdateTime()
+        except Exception:
+            return None
+
+    def _encadrer(self, spreadsheet, fonction, releve):
+        """`fonction` entre deux relevés du marqueur Drive, sans autre requête entre eux
+
+        `releve` reçoit [avant, après] de la tentative qui réussit ; il reste
+        vide si elle échoue (reprise, ajout constaté par `deja_applique`...).
+        """
+        def tentative():
+            releve.clear()
+            avant = self._marqueur(spreadsheet)
+            resultat = fonction()
+            releve.extend([avant, self._marqueur(spreadsheet)])
+            return resultat
+        return tentative
+
+    def _traiter(self, operations):
+        premiere = operations[0]
+        spreadsheet = operations[-1]['spreadsheet']
+        onglet = premiere['onglet']
+        releve = []
+
+        try:
+            if premiere['type'] == 'maj':
+                modifications = {}
+                for operation in operations:
+                    for cle, valeurs in operation['modifications'].items():
+                        modifications.setdefault(cle, {}).update(valeurs)
+                index = next((o['index'] for o in reversed(operations) if o['index'] is not None), None)
+
+                def ecrire():
+                    idx = index or construire_index(spreadsheet, onglet, CLES_ONGLETS[onglet])
+                    return maj_cellules(spreadsheet, idx, modifications)
+
+                resultats = executer_avec_reprises(self._encadrer(spreadsheet, ecrire, releve), self.seau)
+                introuvables = {str(c) for c, r in resultats.items() if r != 'OK'}
+                messages = {
+                    o['id']: "Introuvables : " + ", ".join(sorted(introuvables & {str(c) for c in o['modifications']}))
+                    for o in operations if introuvables & {str(c) for c in o['modifications']}
+                }
+            else:
+                lignes = [ligne for o in operations for ligne in o['lignes']]
+                ajouter_sans_doublon(spreadsheet, onglet, lignes, premiere['option'], self.seau,
+                                     encadrer=lambda ajout: self._encadrer(spreadsheet, ajout, releve))
+                messages = {}
+                if self.cache is not None:
+                    self.cache.invalider(onglet)
+
+            # Marqueur adopté seulement si la requête qui a réussi est encadrée par
+            # deux relevés (une reprise ou une modification externe fait échouer
+            # la comparaison avec le marqueur connu : vérification complète)
+            if len(releve) == 2 and None not in releve:
+                self.cache.adopter_marqueur(*releve)
+            self._terminer(operations, 'valide', messages)
+
+        except EcritureIncertaine as e:
+            if self.cache is not None:
+                self.cache.invalider(onglet)
+            self._terminer(operations, 'incertain', {o['id']: str(e) for o in operations})
+
+        except Exception as e:
+            if self.cache is not None:
+                self.cache.invalider(onglet)
+            self._terminer(operations, 'echec', {o['id']: str(e) for o in operations})
+
+    def _terminer(self, operations, etat, messages):
+        with self._condition:
+            for operation in operations:
+                self.etats[operation['id']].update(etat=etat, message=messages.get(operation['id'], ''))
+            self._elaguer()
+            self._condition.notify_all()
+
+def obtenir_file(spreadsheet_id, cache=None):
+    """File d'écritures unique par classeur pour tout le processus"""
+    with _verrou_registre:
+        if spreadsheet_id not in _files:
+            _files[spreadsheet_id] = FileEcritures(cache=cache)
+        return _files[spreadsheet_id]
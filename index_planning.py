@@ -0,0 +1,115 @@
+"""
+INDEX DES PLANNINGS
+Positions des ordres par jour, semaine et ligne, calculées une fois par
+version d'onglet (sans dépendance Streamlit)
+
+Chaque recherche (jour, semaine, ligne, période) est une lecture de
+dictionnaire ou un découpage de tableau, suivie d'un seul `iloc` : plus de
+conversion de dates ni de masque sur tout l'onglet à chaque affichage.
+"""
+
+import copy
+
+import numpy as np
+import pandas as pd
+
+from schema_donnees import colonne_dates
+
+# Colonne de ligne de chaque onglet de planning
+COLONNES_LIGNE = {
+    'Planning_Production': 'Ligne_Prod',
+    'Planning_Lavage': 'Ligne_Lavage',
+}
+
+def _colonne(planning, colonne):
+    """Colonne de l'onglet, ou colonne vide si elle est absente (aucun groupe)"""
+    if colonne in planning.columns:
+        return planning[colonne]
+    return pd.Series(np.nan, index=planning.index, dtype=object)
+
+def _groupes(*cles):
+    """{clé: positions (croissantes)} des lignes dont aucune clé n'est vide"""
+    cles = [c.reset_index(drop=True) for c in cles]
+    cadre = pd.DataFrame({i: c for i, c in enumerate(cles)})
+    return cadre.groupby(list(cadre.columns), observed=True, sort=False).indices
+
+class IndexPlanning:
+    """Index d'un onglet de planning (Planning_Production ou Planning_Lavage)
+
+    L'onglet n'est jamais copié : chaque recherche retourne `planning.iloc`
+    des positions précalculées, dans l'ordre de la feuille. Les dates sont
+    des datetime.date (comme st.date_input), les semaines des entiers.
+    """
+
+    def __init__(self, planning, colonne_ligne):
+        self.planning = planning
+        self.colonne_ligne = colonne_ligne
+
+        jours = colonne_dates(planning).dt.normalize() if 'Date' in planning.columns \
+            else pd.Series(pd.NaT, index=planning.index)
+        semaines = _colonne(planning, 'Semaine_Num')
+        lignes = _colonne(planning, colonne_ligne)
+
+        self.par_jour = _groupes(jours)
+        self.par_jour_ligne = _groupes(jours, lignes)
+        self.par_semaine = _groupes(semaines)
+        self.par_semaine_ligne = _groupes(semaines, lignes)
+        self.par_ligne = _groupes(lignes)
+
+        self.jours = sorted(t.date() for t in self.par_jour)
+        self.semaines = sorted(s.item() if hasattr(s, 'item') else s for s in self.par_semaine)
+        self.lignes = sorted(self.par_ligne)
+
+        # Ordre d'impression (jour, ligne, heure) : une période est une tranche
+        # contiguë de `ordre`, bornée par searchsorted sur les jours triés
+        tri = pd.DataFrame({'_jour': jours.reset_index(drop=True), '_ligne': lignes.reset_index(drop=True)})
+        if 'Heure_Début' in planning.columns:
+            tri['_heure'] = planning['Heure_Début'].reset_index(drop=True)
+        tri = tri[tri['_jour'].notna()].sort_values(list(tri.columns), kind='stable')
+        self.ordre = tri.index.to_numpy()
+        self.jours_ordre = tri['_jour'].to_numpy()
+
+    def colonnes_cles(self):
+        """Colonnes dont dépendent les positions : les autres peuvent changer sans réindexer"""
+        return {'Date', 'Semaine_Num', 'Heure_Début', self.colonne_ligne}
+
+    def avec_planning(self, planning):
+        """Même index sur une copie modifiée de l'onglet (mêmes lignes, mêmes colonnes clés)"""
+        index = copy.copy(self)
+        index.planning = planning
+        return index
+
+    def __len__(self):
+        return len(self.planning)
+
+    def _extraire(self, positions):
+        if positions is None:
+            return self.planning.iloc[:0]
+        return self.planning.iloc[positions]
+
+    def jour(self, date, ligne=None):
+        """Ordres d'un jour (d'une ligne si `ligne`)"""
+        jour = pd.Timestamp(date)
+        if ligne is None:
+            return self._extraire(self.par_jour.get(jour))
+        return self._extraire(self.par_jour_ligne.get((jour, ligne)))
+
+    def selection(self, semaine=None, ligne=None):
+        """Ordres d'une semaine et / ou d'une ligne (None : sans filtre)"""
+        if semaine is None and ligne is None:
+            return self.planning
+        if ligne is None:
+            return self._extraire(self.par_semaine.get(semaine))
+        if semaine is None:
+            return self._extraire(self.par_ligne.get(ligne))
+        return self._extraire(self.par_semaine_ligne.get((semaine, ligne)))
+
+    def periode(self, debut, fin, lignes=None):
+        """Ordres de `debut` à `fin` inclus, triés par jour, ligne et heure (impression en masse)"""
+        debut, fin = np.datetime64(pd.Timestamp(debut)), np.datetime64(pd.Timestamp(fin))
+        premier = np.searchsorted(self.jours_ordre, debut, side='left')
+        dernier = np.searchsorted(self.jours_ordre, fin, side='right')
+        selection = self.planning.iloc[self.ordre[premier:dernier]]
+        if lignes:
+            selection = selection[selection[self.colonne_ligne].isin(lignes)]
+        return selection
@@ -0,0 +1,164 @@
+"""
+MESURES DE PERFORMANCE
+Temps par page, par étape et par appel externe, journal JSON-lines
+(sans dépendance Streamlit)
+"""
+
+import json
+import os
+import re
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime
+
+# Journal des mesures (une ligne JSON par exécution de page) ; vide = désactivé
+JOURNAL_MESURES = os.environ.get('PLANNING_JOURNAL_MESURES', os.path.join('journal', 'mesures.jsonl'))
+
+# Exécutions conservées par page pour les statistiques du processus
+HISTORIQUE_PAR_PAGE = 200
+
+_releve_courant = ContextVar('releve_courant', default=None)
+_verrou = threading.Lock()
+_historique = defaultdict(lambda: deque(maxlen=HISTORIQUE_PAR_PAGE))
+
+class Releve:
+    """Mesures d'une exécution du script (une page affichée pour une session)"""
+
+    def __init__(self, page, session=None):
+        self.page = page
+        self.session = session
+        self.debut = time.perf_counter()
+        self.horodatage = datetime.now().isoformat(timespec='seconds')
+        self.etapes = []
+        self.appels = []
+        self.total = None
+        self._profondeur = 0
+
+    def temps_appels(self):
+        return sum(a['secondes'] for a in self.appels)
+
+    def appels_par_type(self):
+        """{appel: {'nombre', 'secondes', 'octets_envoyes', 'octets_recus'}}"""
+        resume = {}
+        for a in self.appels:
+            r = resume.setdefault(a['appel'], {'nombre': 0, 'secondes': 0.0,
+                                               'octets_envoyes': 0, 'octets_recus': 0})
+            r['nombre'] += 1
+            r['secondes'] += a['secondes']
+            r['octets_envoyes'] += a['octets_envoyes']
+            r['octets_recus'] += a['octets_recus']
+        return resume
+
+    def vers_dict(self):
+        return {
+            'horodatage': self.horodatage,
+            'session': self.session,
+            'page': self.page,
+            'total_s': round(self.total if self.total is not None else time.perf_counter() - self.debut, 4),
+            'appels_s': round(self.temps_appels(), 4),
+            'etapes': self.etapes,
+            'appels': self.appels_par_type(),
+        }
+
+def demarrer_releve(page, session=None):
+    """Ouvre le relevé de l'exécution courante (thread / contexte courant)"""
+    releve = Releve(page, session)
+    _releve_courant.set(releve)
+    return releve
+
+def releve_courant():
+    return _releve_courant.get()
+
+def terminer_releve(releve, journal=None):
+    """Clôt le relevé, l'ajoute aux statistiques et au journal"""
+    releve.total = time.perf_counter() - releve.debut
+    _releve_courant.set(None)
+    with _verrou:
+        _historique[releve.page].append(releve.total)
+    ecrire_journal(releve.vers_dict(), journal)
+    return releve
+
+@contextmanager
+def mesurer(categorie, nom):
+    """Chronomètre un bloc : `with mesurer('page', 'Accueil'):`"""
+    releve = _releve_courant.get()
+    if releve is None:
+        yield
+        return
+
+    etape = {'categorie': categorie, 'nom': nom, 'niveau': releve._profondeur, 'secondes': None}
+    releve.etapes.append(etape)
+    releve._profondeur += 1
+    debut = time.perf_counter()
+    try:
+        yield
+    finally:
+        releve._profondeur -= 1
+        etape['secondes'] = round(time.perf_counter() - debut, 4)
+
+def enregistrer_appel(appel, secondes, octets_envoyes=0, octets_recus=0, statut=None):
+    """Note un appel externe dans le relevé courant
+
+    Les appels faits hors d'une exécution de page (threads d'écriture ou
+    de rafraîchissement) sont journalisés seuls, page 'arrière-plan'.
+    """
+    entree = {'appel': appel, 'secondes': round(secondes, 4), 'octets_envoyes': octets_envoyes,
+              'octets_recus': octets_recus, 'statut': statut}
+    releve = _releve_courant.get()
+    if releve is not None:
+        releve.appels.append(entree)
+    else:
+        ecrire_journal(dict(entree, page='arrière-plan', horodatage=datetime.now().isoformat(timespec='seconds')))
+
+def nom_appel(methode, url):
+    """'POST …/values:batchUpdate' → 'values:batchUpdate'"""
+    chemin = url.split('?')[0]
+    if 'googleapis.com/drive' in chemin:
+        return f'drive.{methode.lower()}'
+    action = re.search(r'/values(?:/[^/:]+)?(:\w+)?$', chemin)
+    if action:
+        return 'values' + (action.group(1) or f':{methode.lower()}')
+    fin = re.search(r'/spreadsheets/[^/]+(:\w+)?$', chemin)
+    if fin:
+        return 'spreadsheets' + (fin.group(1) or f':{methode.lower()}')
+    return f'{methode} {chemin.rsplit("/", 1)[-1]}'
+
+def reponse_http(reponse, *args, **kwargs):
+    """Hook `requests` : une entrée par requête HTTP du client gspread"""
+    requete = reponse.request
+    corps = requete.body or b''
+    enregistrer_appel(
+        nom_appel(requete.method, requete.url),
+        reponse.elapsed.total_seconds(),
+        octets_envoyes=len(corps),
+        octets_recus=len(reponse.content or b''),
+        statut=reponse.status_code,
+    )
+
+def ecrire_journal(entree, chemin=None):
+    chemin = JOURNAL_MESURES if chemin is None else chemin
+    if not chemin:
+        return
+    try:
+        os.makedirs(os.path.dirname(chemin) or '.', exist_ok=True)
+        with _verrou, open(chemin, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(entree, ensure_ascii=False, default=str) + '\n')
+    except OSError as e:
+        print(f"Journal des mesures indisponible : {e}")
+
+def statistiques_pages():
+    """{page: {'executions', 'moyenne_s', 'p95_s', 'max_s'}} pour ce processus"""
+    with _verrou:
+        historique = {page: sorted(durees) for page, durees in _historique.items()}
+    return {
+        page: {
+            'executions': len(d),
+            'moyenne_s': round(sum(d) / len(d), 4),
+            'p95_s': round(d[min(len(d) - 1, int(0.95 * len(d)))], 4),
+            'max_s': round(d[-1], 4),
+        }
+        for page, d in historique.items() if d
+    }
@@ -0,0 +1,396 @@
+"""
+MOTEUR DE PLANIFICATION PRODUCTION
+Calculs sur DataFrames, sans dépendance Streamlit (utilisable depuis un script)
+"""
+
+import heapq
+from datetime import date, datetime
+
+import numpy as np
+import pandas as pd
+
+JOURS_PAR_SEMAINE = 5
+
+COLONNES_PLANNING = ['OF_ID', 'Semaine', 'Jour', 'Équipe', 'Ligne', 'Produit', 'Tonnage']
+
+def generer_planning_production(data):
+    """Génère le planning production (un OF par jour et par équipe)
+
+    Version vectorisée : jointures prévisions → produits → lignes, puis
+    `np.repeat` pour éclater chaque prévision en 5 jours × Nb_Équipes OF.
+    Même résultat (ordre et numérotation des OF compris) que l'ancienne
+    boucle semaine → prévision → jour → équipe.
+    """
+    previsions = data['Previsions']
+    produits = data['Produits']
+    lignes = data['REF_Lignes'][data['REF_Lignes']['Type'] == 'Production']
+
+    if len(previsions) == 0:
+        return pd.DataFrame()
+
+    prev = previsions[['Semaine_Num', 'Code_Produit', 'Volume_Prévu_T']].copy()
+    prev['_ordre'] = np.arange(len(prev))
+
+    # Seule la première fiche produit / ligne compte (comme `.iloc[0]`)
+    fiches_produit = produits.drop_duplicates('Code_Produit')[['Code_Produit', 'Ligne_Affectée']]
+    fiches_ligne = lignes.drop_duplicates('Code_Ligne')[['Code_Ligne', 'Nb_Équipes']]
+
+    jointure = prev.merge(fiches_produit, on='Code_Produit', how='inner')
+    jointure = jointure[jointure['Ligne_Affectée'].notna() & (jointure['Ligne_Affectée'] != '')]
+    jointure = jointure.merge(fiches_ligne, left_on='Ligne_Affectée', right_on='Code_Ligne', how='inner')
+    jointure = jointure[jointure['Nb_Équipes'] > 0]
+
+    if len(jointure) == 0:
+        return pd.DataFrame()
+
+    # Semaines croissantes, ordre de saisie conservé dans chaque semaine
+    jointure = jointure.sort_values(['Semaine_Num', '_ordre'], kind='stable')
+
+    nb_equipes = jointure['Nb_Équipes'].to_numpy().astype(int)
+    nb_of = nb_equipes * JOURS_PAR_SEMAINE
+    source = np.repeat(np.arange(len(jointure)), nb_of)
+    rang = np.arange(nb_of.sum()) - np.repeat(np.cumsum(nb_of) - nb_of, nb_of)
+    equipes_of = nb_equipes[source]
+
+    volume_equipe = jointure['Volume_Prévu_T'].to_numpy(dtype=float) / JOURS_PAR_SEMAINE / nb_equipes
+
+    # Libellés d'équipe : 'Unique' si une seule équipe, sinon 'Équipe_<n>'
+    libelles = np.array(['Unique'] + [f'Équipe_{n}' for n in range(1, nb_equipes.max() + 1)], dtype=object)
+    num_equipe = np.where(equipes_of > 1, rang % equipes_of + 1, 0)
+
+    return pd.DataFrame({
+        'OF_ID': [f'OF_{i:03d}' for i in range(1, len(source) + 1)],
+        'Semaine': jointure['Semaine_Num'].to_numpy().astype(int)[source],
+        'Jour': rang // equipes_of + 1,
+        'Équipe': libelles[num_equipe],
+        'Ligne': jointure['Ligne_Affectée'].to_numpy()[source],
+        'Produit': jointure['Code_Produit'].to_numpy()[source],
+        'Tonnage': np.round(volume_equipe, 2)[source],
+    }, columns=COLONNES_PLANNING)
+
+# =============================================================================
+# ORDONNANCEMENT SOUS CAPACITÉ
+# =============================================================================
+
+HEURES_PAR_EQUIPE = 8
+# Début de la première équipe ; les suivantes s'enchaînent (5h, 13h, 21h en 3×8)
+HEURE_PREMIERE_EQUIPE = 5
+SANS_LIGNE = '(aucune)'
+
+COLONNES_ORDONNANCEMENT = ['OF_ID', 'Semaine_Num', 'Date', 'Heure_Début', 'Heure_Fin', 'Ligne_Prod',
+                           'Code_Produit', 'Équipe', 'Tonnage_Planifié', 'Statut']
+STATUT_PLANIFIE = 'Planifié'
+# Un OF est identifié d'un calcul à l'autre par son créneau et son produit
+CLES_OF = ['Semaine_Num', 'Date', 'Heure_Début', 'Ligne_Prod', 'Code_Produit', 'Équipe']
+COLONNES_CHARGE = ['Ligne_Prod', 'Semaine_Num', 'Heures_Dispo', 'Heures_Demandées', 'Taux_Charge',
+                   'Tonnage_Demandé', 'Tonnage_Non_Planifié']
+
+def parametre(data, nom, defaut):
+    """Valeur numérique de l'onglet Parametres (Paramètre / Valeur), sinon `defaut`"""
+    parametres = data.get('Parametres')
+    if parametres is None or 'Paramètre' not in parametres.columns or 'Valeur' not in parametres.columns:
+        return defaut
+    valeurs = pd.to_numeric(parametres.loc[parametres['Paramètre'] == nom, 'Valeur'], errors='coerce').dropna()
+    return float(valeurs.iloc[0]) if len(valeurs) else defaut
+
+def _lignes_production(data):
+    """Lignes de production utilisables : Code_Ligne, Capacité_T_h > 0, Nb_Équipes > 0"""
+    lignes = data['REF_Lignes']
+    lignes = lignes[lignes['Type'] == 'Production'].drop_duplicates('Code_Ligne')
+    lignes = pd.DataFrame({
+        'Code_Ligne': lignes['Code_Ligne'].astype(str).to_numpy(),
+        'Capacité_T_h': pd.to_numeric(lignes['Capacité_T_h'], errors='coerce').to_numpy(dtype=float),
+        'Nb_Équipes': pd.to_numeric(lignes['Nb_Équipes'], errors='coerce').fillna(0).to_numpy().astype(int),
+    })
+    return lignes[(lignes['Capacité_T_h'] > 0) & (lignes['Nb_Équipes'] > 0)].reset_index(drop=True)
+
+def _repartir_polyvalents(poly, lignes, fin_fixes, horizon):
+    """Produits sans ligne affectée : placés semaine par semaine sur la ligne libérée la première
+
+    File de priorité (tas) des lignes par heure de fin de charge ; les OF les
+    plus longs passent d'abord (LPT), ce qui équilibre la charge des lignes.
+    """
+    capacites = lignes['Capacité_T_h'].to_numpy()
+    choix_ligne = np.empty(len(poly), dtype=int)
+    debuts = np.empty(len(poly))
+
+    volumes = poly['Volume_Prévu_T'].to_numpy(dtype=float)
+    for semaine, positions in poly.groupby('Semaine_Num', sort=True).indices.items():
+        tas = [(fin_fixes.get((i, semaine), 0.0) / horizon[i], i) for i in range(len(lignes))]
+        heapq.heapify(tas)
+        for position in positions[np.argsort(-volumes[positions], kind='stable')]:
+            _, i = heapq.heappop(tas)
+            debut = fin_fixes.get((i, semaine), 0.0)
+            fin = debut + volumes[position] / capacites[i]
+            fin_fixes[(i, semaine)] = fin
+            choix_ligne[position] = i
+            debuts[position] = debut
+            heapq.heappush(tas, (fin / horizon[i], i))
+
+    return choix_ligne, debuts
+
+def ordonnancer_production(data, annee=None, heures_par_equipe=None):
+    """Ordonnance les prévisions sur les lignes de production sous capacité
+
+    Chaque prévision (semaine, produit, volume) devient une durée de
+    production Volume / Capacité_T_h sur la ligne affectée au produit. Les
+    durées s'enchaînent sur l'axe des heures d'équipe de la semaine
+    (JOURS_PAR_SEMAINE × Nb_Équipes × Heures_Par_Équipe), puis sont découpées
+    en un OF par équipe traversée, avec heures de début et de fin. Les produits
+    sans ligne affectée sont répartis sur les lignes les moins chargées. Ce qui
+    dépasse la capacité de la semaine n'est pas planifié et est signalé.
+
+    `annee` (année ISO des numéros de semaine, année en cours par défaut) sert
+    à dater les OF ; semaine inexistante : Date vide. Retourne (planning, charge) : planning au format de
+    l'onglet Planning_Production, charge par ligne et semaine (une semaine est
+    surchargée si Tonnage_Non_Planifié > 0 ; ligne SANS_LIGNE = produits dont
+    la ligne n'existe pas ou n'a pas de capacité).
+    """
+    annee = annee or datetime.now().year
+    heures = heures_par_equipe or parametre(data, 'Heures_Par_Équipe', HEURES_PAR_EQUIPE)
+    lignes = _lignes_production(data)
+    previsions = data['Previsions']
+
+    prev = pd.DataFrame({
+        'Semaine_Num': pd.to_numeric(previsions['Semaine_Num'], errors='coerce'),
+        'Code_Produit': previsions['Code_Produit'].astype(str).to_numpy(),
+        'Volume_Prévu_T': pd.to_numeric(previsions['Volume_Prévu_T'], errors='coerce'),
+    })
+    prev = prev[prev['Semaine_Num'].notna() & (prev['Volume_Prévu_T'] > 0)]
+    prev['Semaine_Num'] = prev['Semaine_Num'].astype(int)
+    prev['_ordre'] = np.arange(len(prev))
+
+    fiches = data['Produits'].drop_duplicates('Code_Produit')
+    affectees = dict(zip(fiches['Code_Produit'].astype(str), fiches['Ligne_Affectée'].astype(str)))
+    prev['Ligne'] = prev['Code_Produit'].map(affectees).fillna('').replace('nan', '')
+
+    rang_ligne = {code: i for i, code in enumerate(lignes['Code_Ligne'])}
+    prev['_ligne'] = prev['Ligne'].map(rang_ligne)
+    polyvalent = prev['Ligne'] == ''
+    sans_capacite = prev[~polyvalent & prev['_ligne'].isna()]
+    fixes = prev[~polyvalent & prev['_ligne'].notna()].copy()
+    poly = prev[polyvalent].copy() if len(lignes) else prev.iloc[:0].copy()
+    if not len(lignes):
+        sans_capacite = pd.concat([sans_capacite, prev[polyvalent]])
+
+    capacites = lignes['Capacité_T_h'].to_numpy()
+    horizon = JOURS_PAR_SEMAINE * lignes['Nb_Équipes'].to_numpy() * heures
+
+    # Lignes affectées : charges cumulées dans l'ordre de saisie
+    fixes['_ligne'] = fixes['_ligne'].astype(int)
+    fixes = fixes.sort_values(['Semaine_Num', '_ordre'], kind='stable')
+    fixes['_duree'] = fixes['Volume_Prévu_T'].to_numpy() / capacites[fixes['_ligne'].to_numpy()]
+    fixes['_fin'] = fixes.groupby(['_ligne', 'Semaine_Num'])['_duree'].cumsum()
+    fixes['_debut'] = fixes['_fin'] - fixes['_duree']
+    fin_fixes = fixes.groupby(['_ligne', 'Semaine_Num'])['_fin'].max().to_dict()
+
+    if len(poly):
+        poly = poly.reset_index(drop=True)
+        poly['_ligne'], poly['_debut'] = _repartir_polyvalents(poly, lignes, fin_fixes, horizon)
+        poly['_duree'] = poly['Volume_Prévu_T'].to_numpy() / capacites[poly['_ligne'].to_numpy()]
+        poly['_fin'] = poly['_debut'] + poly['_duree']
+
+    travaux = pd.concat([fixes, poly], ignore_index=True)
+    planning = _decouper_en_of(travaux, lignes, horizon, heures, annee)
+    charge = _charge(travaux, sans_capacite, lignes, horizon)
+    return planning, charge
+
+def _decouper_en_of(travaux, lignes, horizon, heures, annee):
+    """Un OF par équipe traversée par chaque durée de production (partie dans la capacité)"""
+    if len(travaux) == 0:
+        return pd.DataFrame(columns=COLONNES_ORDONNANCEMENT)
+
+    i_ligne = travaux['_ligne'].to_numpy().astype(int)
+    debut = travaux['_debut'].to_numpy()
+    fin = np.minimum(travaux['_fin'].to_numpy(), horizon[i_ligne])
+    dans_capacite = fin > debut + 1e-9
+    i_ligne, debut, fin = i_ligne[dans_capacite], debut[dans_capacite], fin[dans_capacite]
+    source = np.flatnonzero(dans_capacite)
+
+    premier = np.floor(debut / heures).astype(int)
+    dernier = np.ceil(fin / heures - 1e-9).astype(int) - 1
+    nb = dernier - premier + 1
+    repet = np.repeat(np.arange(len(source)), nb)
+    creneau = premier[repet] + np.arange(nb.sum()) - np.repeat(np.cumsum(nb) - nb, nb)
+
+    debut_of = np.maximum(debut[repet], creneau * heures)
+    fin_of = np.minimum(fin[repet], (creneau + 1) * heures)
+    equipes = lignes['Nb_Équipes'].to_numpy()[i_ligne[repet]]
+    jour = creneau // equipes + 1
+    num_equipe = creneau % equipes
+
+    def horloge(t):
+        minutes = np.round((HEURE_PREMIERE_EQUIPE * 60 + num_equipe * heures * 60
+                            + (t - creneau * heures) * 60)).astype(int) % (24 * 60)
+        return [f'{m // 60:02d}:{m % 60:02d}' for m in minutes]
+
+    semaines = travaux['Semaine_Num'].to_numpy()[source][repet]
+    planning = pd.DataFrame({
+        'Semaine_Num': semaines,
+        'Jour': jour,
+        'Ligne_Prod': lignes['Code_Ligne'].to_numpy()[i_ligne[repet]],
+        'Code_Produit': travaux['Code_Produit'].to_numpy()[source][repet],
+        '_equipe': num_equipe,
+        '_debut': debut_of,
+        'Heure_Début': horloge(debut_of),
+        'Heure_Fin': horloge(fin_of),
+        'Équipe': np.where(equipes > 1, [f'Équipe_{n + 1}' for n in num_equipe], 'Unique'),
+        'Tonnage_Planifié': np.round((fin_of - debut_of) * lignes['Capacité_T_h'].to_numpy()[i_ligne[repet]], 2),
+        'Statut': 'Planifié',
+    })
+    planning = planning.sort_values(['Semaine_Num', 'Ligne_Prod', 'Jour', '_equipe', '_debut'],
+                                    kind='stable').reset_index(drop=True)
+
+    planning['Date'] = _dates_iso(planning['Semaine_Num'], planning['Jour'], annee)
+    planning['OF_ID'] = [f'OF_{i:03d}' for i in range(1, len(planning) + 1)]
+    return planning[COLONNES_ORDONNANCEMENT]
+
+def _dates_iso(semaines, jours, annee):
+    """Date ISO de chaque (semaine, jour) ; semaine inexistante : NaT
+
+    Une saison à cheval sur deux années (semaines 40..52 puis 1..) date les
+    petites semaines l'année suivante.
+    """
+    a_cheval = len(semaines) and semaines.max() - semaines.min() > 26
+    dates = {}
+    for semaine, jour_semaine in set(zip(semaines, jours)):
+        annee_semaine = annee + 1 if a_cheval and semaine < 27 else annee
+        try:
+            dates[(semaine, jour_semaine)] = date.fromisocalendar(annee_semaine, int(semaine), int(jour_semaine))
+        except ValueError:
+            dates[(semaine, jour_semaine)] = None
+    return pd.to_datetime([dates[c] for c in zip(semaines, jours)])
+
+def planning_vers_onglet(planning, annee=None, heures_par_equipe=HEURES_PAR_EQUIPE):
+    """Planning de generer_planning_production au format de l'onglet Planning_Production
+
+    Chaque OF occupe son équipe entière : la première commence à
+    HEURE_PREMIERE_EQUIPE, les suivantes s'enchaînent toutes les
+    `heures_par_equipe` heures.
+    """
+    if len(planning) == 0:
+        return pd.DataFrame(columns=COLONNES_ORDONNANCEMENT)
+
+    annee = annee or datetime.now().year
+    num_equipe = planning['Équipe'].str.extract(r'(\d+)$')[0].astype(float).fillna(1).to_numpy().astype(int) - 1
+    debut = (HEURE_PREMIERE_EQUIPE * 60 + num_equipe * heures_par_equipe * 60) % (24 * 60)
+    fin = (debut + heures_par_equipe * 60) % (24 * 60)
+
+    def horloge(minutes):
+        return [f'{int(m) // 60:02d}:{int(m) % 60:02d}' for m in minutes]
+
+    return pd.DataFrame({
+        'OF_ID': planning['OF_ID'].to_numpy(),
+        'Semaine_Num': planning['Semaine'].to_numpy(),
+        'Date': _dates_iso(planning['Semaine'], planning['Jour'], annee),
+        'Heure_Début': horloge(debut),
+        'Heure_Fin': horloge(fin),
+        'Ligne_Prod': planning['Ligne'].to_numpy(),
+        'Code_Produit': planning['Produit'].to_numpy(),
+        'Équipe': planning['Équipe'].to_numpy(),
+        'Tonnage_Planifié': planning['Tonnage'].to_numpy(),
+        'Statut': 'Planifié',
+    }, columns=COLONNES_ORDONNANCEMENT)
+
+def of_engages(planning):
+    """Masque des OF dont l'atelier a changé le statut (autre que 'Planifié' ou vide)"""
+    if 'Statut' not in planning.columns:
+        return pd.Series(False, index=planning.index)
+    statut = planning['Statut'].astype(str).str.strip()
+    return ~statut.isin([STATUT_PLANIFIE, '', 'nan', 'None'])
+
+def _cles_of(planning):
+    """Clé texte de chaque OF (dates en AAAA-MM-JJ, semaines entières)"""
+    colonnes = []
+    for colonne in CLES_OF:
+        if colonne not in planning.columns:
+            colonnes.append(pd.Series('', index=planning.index))
+        elif colonne == 'Date':
+            colonnes.append(pd.to_datetime(planning[colonne], errors='coerce').dt.strftime('%Y-%m-%d').fillna(''))
+        elif colonne == 'Semaine_Num':
+            colonnes.append(pd.to_numeric(planning[colonne], errors='coerce').map(
+                lambda s: '' if pd.isna(s) else str(int(s))))
+        else:
+            colonnes.append(planning[colonne].astype(str).str.strip())
+    return pd.Series(list(zip(*colonnes)), index=planning.index, dtype=object)
+
+def fusionner_planning(existant, nouveau):
+    """Nouveau planning fusionné avec l'onglet Planning_Production actuel
+
+    - un OF recalculé sur le même créneau (CLES_OF) qu'un OF existant en
+      reprend l'OF_ID et le statut ; s'il est engagé ('En cours', 'Terminé'...),
+      la ligne existante est gardée telle quelle ;
+    - les OF engagés absents du nouveau calcul sont conservés ;
+    - les OF encore 'Planifié' absents du nouveau calcul disparaissent ;
+    - les autres OF reçoivent un OF_ID qui ne reprend aucun identifiant existant.
+    """
+    if existant is None or len(existant) == 0 or 'OF_ID' not in existant.columns:
+        return nouveau
+    existant = existant.reindex(columns=nouveau.columns)
+    existant['Date'] = pd.to_datetime(existant['Date'], errors='coerce')
+    engages = of_engages(existant).to_numpy()
+
+    par_cle = pd.Series(np.arange(len(existant)), index=_cles_of(existant).to_numpy())
+    par_cle = par_cle[~par_cle.index.duplicated()]
+    retrouve = _cles_of(nouveau).map(par_cle)
+    trouves = retrouve.notna().to_numpy()
+    anciens = retrouve[trouves].astype(int).to_numpy()
+
+    resultat = nouveau.copy()
+    resultat['Statut'] = resultat['Statut'].astype(object)
+    resultat.loc[trouves, 'OF_ID'] = existant['OF_ID'].iloc[anciens].to_numpy()
+    resultat.loc[trouves, 'Statut'] = existant['Statut'].iloc[anciens].astype(object).to_numpy()
+    resultat['_nouveau'] = ~trouves
+
+    # OF engagés : la ligne de l'onglet remplace le recalcul, et reste s'il n'est plus calculé
+    recalcule_engage = np.zeros(len(resultat), dtype=bool)
+    recalcule_engage[np.flatnonzero(trouves)] = engages[anciens]
+    resultat = pd.concat([resultat[~recalcule_engage], existant[engages].assign(_nouveau=False)],
+                         ignore_index=True)
+
+    # Identifiants des nouveaux OF, après le plus grand numéro existant
+    nouveaux = resultat.pop('_nouveau').to_numpy(dtype=bool)
+    numeros = pd.to_numeric(existant['OF_ID'].astype(str).str.extract(r'(\d+)$')[0], errors='coerce')
+    premier = int(numeros.max()) + 1 if numeros.notna().any() else 1
+    resultat.loc[nouveaux, 'OF_ID'] = [f'OF_{i:03d}' for i in range(premier, premier + int(nouveaux.sum()))]
+
+    tri = pd.DataFrame({'semaine': pd.to_numeric(resultat['Semaine_Num'], errors='coerce'),
+                        'date': pd.to_datetime(resultat['Date'], errors='coerce'),
+                        'ligne': resultat['Ligne_Prod'].astype(str),
+                        'heure': resultat['Heure_Début'].astype(str)})
+    ordre = tri.sort_values(['semaine', 'date', 'ligne', 'heure'], kind='stable').index
+    return resultat.loc[ordre].reset_index(drop=True)
+
+def _charge(travaux, sans_capacite, lignes, horizon):
+    """Heures demandées / disponibles et tonnage non planifié par ligne et semaine"""
+    lignes_charge = []
+    if len(travaux):
+        i_ligne = travaux['_ligne'].to_numpy().astype(int)
+        capacites = lignes['Capacité_T_h'].to_numpy()[i_ligne]
+        depassement = np.clip(travaux['_fin'].to_numpy() - np.maximum(travaux['_debut'].to_numpy(),
+                                                                       horizon[i_ligne]), 0, None)
+        par_travail = pd.DataFrame({
+            'Ligne_Prod': lignes['Code_Ligne'].to_numpy()[i_ligne],
+            'Semaine_Num': travaux['Semaine_Num'].to_numpy(),
+            'Heures_Dispo': horizon[i_ligne],
+            'Heures_Demandées': travaux['_duree'].to_numpy(),
+            'Tonnage_Demandé': travaux['Volume_Prévu_T'].to_numpy(),
+            'Tonnage_Non_Planifié': depassement * capacites,
+        })
+        lignes_charge.append(par_travail.groupby(['Ligne_Prod', 'Semaine_Num'], as_index=False)
+                             .agg({'Heures_Dispo': 'first', 'Heures_Demandées': 'sum',
+                                   'Tonnage_Demandé': 'sum', 'Tonnage_Non_Planifié': 'sum'}))
+    if len(sans_capacite):
+        lignes_charge.append(sans_capacite.groupby('Semaine_Num', as_index=False)
+                             .agg(Tonnage_Demandé=('Volume_Prévu_T', 'sum'))
+                             .assign(Ligne_Prod=SANS_LIGNE, Heures_Dispo=0.0, Heures_Demandées=np.nan,
+                                     Tonnage_Non_Planifié=lambda df: df['Tonnage_Demandé']))
+
+    if not lignes_charge:
+        return pd.DataFrame(columns=COLONNES_CHARGE)
+    charge = pd.concat(lignes_charge, ignore_index=True)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        charge['Taux_Charge'] = np.round(charge['Heures_Demandées'] / charge['Heures_Dispo'], 3)
+    charge['Tonnage_Non_Planifié'] = charge['Tonnage_Non_Planifié'].round(2)
+    charge['Heures_Demandées'] = charge['Heures_Demandées'].round(2)
+    return charge.sort_values(['Semaine_Num', 'Ligne_Prod']).reset_index(drop=True)[COLONNES_CHARGE]
@@ -0,0 +1,242 @@
+"""
+CHAÎNE DE PLANIFICATION SANS INTERFACE
+Extrapolation des prévisions, planning production et alertes de stock,
+écrits en bloc dans le classeur (sans dépendance Streamlit)
+
+Remplace le notebook Colab : mêmes moteurs que l'application, lançable par
+cron ou par une tâche planifiée Heroku.
+
+    python pipeline_planning.py                                  # classeur Google (GCP_SERVICE_ACCOUNT)
+    python pipeline_planning.py --classeur classeur.xlsx         # classeur local (.xlsx ou .sqlite)
+    python pipeline_planning.py --snapshot snapshots/<id>.sqlite --sortie resultats.xlsx
+    python pipeline_planning.py --sans-ecriture --sortie resultats.xlsx
+    python pipeline_planning.py --refuser-si-engages     # n'écrit pas si un OF est en cours / terminé
+
+Le planning recalculé est fusionné avec l'onglet actuel (voir
+fusionner_planning) : les statuts saisis par l'atelier et les OF_ID des
+créneaux inchangés sont conservés.
+
+Le planning lavage n'est pas produit : aucun moteur de lavage n'existe
+encore dans l'application.
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from datetime import datetime
+
+import pandas as pd
+
+from alertes_stocks import MANQUE, calculer_alertes
+from export_donnees import FORMATS, exporter
+from file_ecritures import ajouter_sans_doublon, executer_avec_reprises
+from moteur_planning import (HEURES_PAR_EQUIPE, fusionner_planning, generer_planning_production, of_engages,
+                             ordonnancer_production, parametre, planning_vers_onglet)
+from previsions import METHODES, calculer_extrapolation, lignes_previsions_sheets, nouvelles_extrapolations
+from schema_donnees import typer_donnees
+from sheets_io import (URL_CLASSEUR, charger_onglets, obtenir_client, ouvrir_spreadsheet,
+                       remplacer_onglets)
+
+ONGLETS_REQUIS = ('Previsions', 'Produits', 'REF_Lignes')
+# Onglets réécrits entièrement à chaque exécution
+ONGLETS_RESULTATS = ('Planning_Production', 'Alerte_Stocks')
+
+MOTEURS = {
+    'equipes': "Un OF par jour et par équipe (generer_planning_production)",
+    'capacite': "Ordonnancement sous capacité, heures de début et de fin (ordonnancer_production)",
+}
+
+# =============================================================================
+# SOURCES
+# =============================================================================
+
+def ouvrir_classeur(url=URL_CLASSEUR, classeur_local=None, identifiants=None):
+    """Classeur Google (ou local si `classeur_local` est un chemin .xlsx / .sqlite)
+
+    Identifiants du compte de service : fichier JSON `identifiants`, sinon
+    variable d'environnement GCP_SERVICE_ACCOUNT (comme l'application).
+    """
+    if classeur_local:
+        from sheets_local import obtenir_client_local
+        return obtenir_client_local(classeur_local).open_by_url(url)
+
+    if identifiants:
+        with open(identifiants, encoding='utf-8') as f:
+            service_account_info = json.load(f)
+    elif 'GCP_SERVICE_ACCOUNT' in os.environ:
+        service_account_info = json.loads(os.environ['GCP_SERVICE_ACCOUNT'])
+    else:
+        raise RuntimeError("Aucune authentification : --identifiants ou GCP_SERVICE_ACCOUNT")
+    return ouvrir_spreadsheet(obtenir_client(service_account_info), url)
+
+def charger_depuis_snapshot(chemin):
+    """Données d'un snapshot SQLite (voir snapshot), typées comme au chargement"""
+    from snapshot import charger_snapshot
+    data, _ = charger_snapshot(chemin)
+    if data is None:
+        raise FileNotFoundError(chemin)
+    return typer_donnees(data)
+
+# =============================================================================
+# CHAÎNE DE CALCUL
+# =============================================================================
+
+def executer_chaine(data, methode='moyenne', horizon=2, moteur='equipes', annee=None):
+    """Calcule tous les résultats à partir des onglets chargés (aucune lecture ni écriture)
+
+    Retourne {'extrapolations', 'Planning_Production', 'charge', 'Alerte_Stocks',
+    'of_engages', 'durees'} ; le planning et les alertes tiennent compte des
+    extrapolations, et le planning est fusionné avec l'onglet chargé
+    (`of_engages` : OF de l'onglet dont le statut n'est plus 'Planifié').
+    `charge` n'est calculée que par le moteur 'capacite' (sinon None).
+    """
+    if moteur not in MOTEURS:
+        raise ValueError(f"Moteur inconnu : {moteur}")
+    manquants = [o for o in ONGLETS_REQUIS if len(data.get(o, pd.DataFrame())) == 0]
+    if manquants:
+        raise ValueError(f"Onglet(s) vide(s) ou absent(s) : {', '.join(manquants)}")
+
+    durees = {}
+    debut = time.perf_counter()
+    extrapolations = pd.DataFrame()
+    if horizon > 0:
+        extrapolations = nouvelles_extrapolations(data, calculer_extrapolation(data, methode, horizon))
+    if len(extrapolations):
+        data = dict(data, Previsions=pd.concat([data['Previsions'], extrapolations], ignore_index=True))
+    durees['extrapolation'] = time.perf_counter() - debut
+
+    debut = time.perf_counter()
+    heures = parametre(data, 'Heures_Par_Équipe', HEURES_PAR_EQUIPE)
+    charge = None
+    if moteur == 'capacite':
+        planning, charge = ordonnancer_production(data, annee=annee, heures_par_equipe=heures)
+    else:
+        planning = planning_vers_onglet(generer_planning_production(data), annee=annee, heures_par_equipe=heures)
+    existant = data.get('Planning_Production')
+    engages = int(of_engages(existant).sum()) if existant is not None and len(existant) else 0
+    planning = fusionner_planning(existant, planning)
+    durees['planning production'] = time.perf_counter() - debut
+
+    debut = time.perf_counter()
+    alertes = calculer_alertes(data)
+    durees['alertes'] = time.perf_counter() - debut
+
+    return {'extrapolations': extrapolations, 'Planning_Production': planning, 'charge': charge,
+            'Alerte_Stocks': alertes, 'of_engages': engages, 'durees': durees}
+
+# =============================================================================
+# ÉCRITURE DES RÉSULTATS
+# =============================================================================
+
+def valeurs_feuille(df):
+    """[[en-têtes], [ligne], ...] prêtes pour l'API (dates en AAAA-MM-JJ, vides = '')"""
+    colonnes = {}
+    for colonne in df.columns:
+        serie = df[colonne]
+        if pd.api.types.is_datetime64_any_dtype(serie):
+            serie = serie.dt.strftime('%Y-%m-%d')
+        colonnes[colonne] = serie.astype(object).where(serie.notna(), '')
+    valeurs = pd.DataFrame(colonnes, index=df.index).values.tolist()
+    return [[str(c) for c in df.columns]] + [[v.item() if hasattr(v, 'item') else v for v in ligne]
+                                             for ligne in valeurs]
+
+def ecrire_resultats(spreadsheet, data, resultats):
+    """Deux requêtes en tout : ajout des extrapolations, puis remplacement des onglets résultats
+
+    Les onglets résultats absents du classeur sont ignorés. Retourne la liste
+    des onglets écrits.
+    """
+    existants = {ws.title for ws in spreadsheet.worksheets()}
+    ecrits = []
+
+    extrapolations = resultats['extrapolations']
+    if len(extrapolations) and 'Previsions' in existants:
+        lignes = lignes_previsions_sheets(extrapolations)
+        ajouter_sans_doublon(spreadsheet, 'Previsions', lignes)
+        ecrits.append('Previsions')
+
+    contenus = {o: valeurs_feuille(resultats[o]) for o in ONGLETS_RESULTATS if o in existants}
+    tailles = {o: (len(data[o]) + 1, len(data[o].columns)) for o in contenus if o in data}
+    if contenus:
+        executer_avec_reprises(lambda: remplacer_onglets(spreadsheet, contenus, tailles))
+        ecrits.extend(contenus)
+    return ecrits
+
+def exporter_resultats(resultats, chemin):
+    """Résultats dans un fichier .xlsx, .csv.zip ou .parquet.zip (voir export_donnees)"""
+    format_export = next((f for f, (_, _, ext) in FORMATS.items() if chemin.endswith('.' + ext)), None)
+    if format_export is None:
+        raise ValueError(f"Extension non reconnue : {chemin} (.xlsx, .csv.zip, .parquet.zip)")
+    onglets = {'Extrapolations': resultats['extrapolations'],
+               'Planning_Production': resultats['Planning_Production'],
+               'Alerte_Stocks': resultats['Alerte_Stocks']}
+    if resultats['charge'] is not None:
+        onglets['Charge_Lignes'] = resultats['charge']
+    with open(chemin, 'wb') as f:
+        f.write(exporter(onglets, format_export, [o for o, df in onglets.items() if len(df)]))
+
+# =============================================================================
+# LIGNE DE COMMANDE
+# =============================================================================
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    source = parser.add_mutually_exclusive_group()
+    source.add_argument('--url', default=URL_CLASSEUR, help="classeur Google Sheets (PLANNING_URL_CLASSEUR)")
+    source.add_argument('--classeur', default=os.environ.get('PLANNING_CLASSEUR_LOCAL') or None,
+                        help="classeur local .xlsx ou .sqlite (PLANNING_CLASSEUR_LOCAL)")
+    source.add_argument('--snapshot', help="snapshot SQLite, lecture seule (écrire avec --sortie)")
+    parser.add_argument('--identifiants', help="fichier JSON du compte de service (sinon GCP_SERVICE_ACCOUNT)")
+    parser.add_argument('--methode', choices=list(METHODES), default='moyenne')
+    parser.add_argument('--horizon', type=int, default=2, help="semaines extrapolées (0 : aucune)")
+    parser.add_argument('--moteur', choices=list(MOTEURS), default='equipes')
+    parser.add_argument('--annee', type=int, help="année ISO des numéros de semaine (année en cours)")
+    parser.add_argument('--sortie', help="écrit aussi les résultats dans un fichier .xlsx / .csv.zip / .parquet.zip")
+    parser.add_argument('--sans-ecriture', action='store_true', help="n'écrit rien dans le classeur")
+    parser.add_argument('--refuser-si-engages', action='store_true',
+                        help="n'écrit pas si Planning_Production contient des OF en cours, terminés ou annulés")
+    args = parser.parse_args(argv)
+
+    debut = time.perf_counter()
+    spreadsheet = None
+    if args.snapshot:
+        data = charger_depuis_snapshot(args.snapshot)
+    else:
+        spreadsheet = ouvrir_classeur(args.url, args.classeur, args.identifiants)
+        data, erreurs = charger_onglets(spreadsheet)
+        for onglet, message in erreurs.items():
+            print(f"⚠️ {onglet} : {message}", file=sys.stderr)
+    print(f"Chargement : {sum(len(df) for df in data.values())} lignes en {time.perf_counter() - debut:.2f} s")
+
+    resultats = executer_chaine(data, args.methode, args.horizon, args.moteur, args.annee)
+    for etape, secondes in resultats['durees'].items():
+        print(f"{etape.capitalize()} : {secondes:.2f} s")
+    print(f"{len(resultats['extrapolations'])} extrapolation(s), "
+          f"{len(resultats['Planning_Production'])} OF, "
+          f"{int((resultats['Alerte_Stocks']['Statut'] == MANQUE).sum())} variété(s) en manque")
+    if resultats['charge'] is not None:
+        surcharges = resultats['charge'][resultats['charge']['Tonnage_Non_Planifié'] > 0]
+        if len(surcharges):
+            print(f"⚠️ {len(surcharges)} semaine(s)-ligne(s) surchargée(s), "
+                  f"{surcharges['Tonnage_Non_Planifié'].sum():.1f} T non planifiées")
+
+    if args.sortie:
+        exporter_resultats(resultats, args.sortie)
+        print(f"✅ Résultats : {args.sortie}")
+
+    if resultats['of_engages']:
+        print(f"{resultats['of_engages']} OF engagé(s) dans l'onglet : statuts et identifiants conservés")
+    if spreadsheet is not None and not args.sans_ecriture:
+        if args.refuser_si_engages and resultats['of_engages']:
+            print("❌ Écriture refusée (--refuser-si-engages)", file=sys.stderr)
+            return 2
+        debut = time.perf_counter()
+        ecrits = ecrire_resultats(spreadsheet, data, resultats)
+        print(f"✅ Écrit dans le classeur ({', '.join(ecrits) or 'rien'}) "
+              f"en {time.perf_counter() - debut:.2f} s — {datetime.now():%Y-%m-%d %H:%M}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,109 @@
+"""
+EXTRAPOLATION DES PRÉVISIONS
+Projection vectorisée de tous les produits à la fois (sans dépendance Streamlit)
+"""
+
+import numpy as np
+import pandas as pd
+
+METHODES = {
+    'moyenne': "Moyenne des semaines saisies",
+    'moyenne_ponderee': "Moyenne mobile pondérée (semaines récentes prioritaires)",
+    'lissage_exponentiel': "Lissage exponentiel simple",
+}
+
+# Poids de la moyenne mobile, de la plus ancienne à la plus récente semaine
+POIDS_DEFAUT = (1, 2, 3)
+ALPHA_DEFAUT = 0.5
+
+def _series_hebdo(prev_saisies):
+    """Matrice produits × semaines (volumes sommés, NaN si semaine non saisie)"""
+    return (prev_saisies.groupby(['Code_Produit', 'Semaine_Num'], observed=True)['Volume_Prévu_T']
+            .sum(min_count=1).unstack('Semaine_Num').sort_index(axis=1))
+
+def _moyenne_ponderee(matrice, poids):
+    """Moyenne des len(poids) dernières semaines ; poids renormalisés si trous"""
+    poids = np.asarray(poids, dtype=float)
+    fenetre = matrice[:, -len(poids):]
+    poids = poids[-fenetre.shape[1]:]
+    presents = ~np.isnan(fenetre)
+    somme = np.where(presents, fenetre, 0.0) @ poids
+    total_poids = presents @ poids
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(total_poids > 0, somme / total_poids, np.nan)
+
+def _lissage_exponentiel(matrice, alpha):
+    """s_t = alpha * x_t + (1 - alpha) * s_t-1, calculé pour tous les produits à la fois"""
+    niveau = np.full(matrice.shape[0], np.nan)
+    for colonne in matrice.T:
+        presents = ~np.isnan(colonne)
+        initial = presents & np.isnan(niveau)
+        niveau = np.where(initial, colonne, niveau)
+        lisse = presents & ~initial
+        niveau[lisse] = alpha * colonne[lisse] + (1 - alpha) * niveau[lisse]
+    return niveau
+
+def calculer_extrapolation(data, methode='moyenne', horizon=2, poids=POIDS_DEFAUT, alpha=ALPHA_DEFAUT):
+    """Projette les prévisions saisies sur les `horizon` semaines suivantes
+
+    methode : 'moyenne' (comportement historique), 'moyenne_ponderee'
+    ou 'lissage_exponentiel'. Retourne un DataFrame Semaine_Num,
+    Code_Produit, Volume_Prévu_T, Type_Prévision ('EXTRAPOLÉE').
+    """
+    if methode not in METHODES:
+        raise ValueError(f"Méthode inconnue : {methode}")
+
+    previsions = data['Previsions']
+    prev_saisies = previsions[previsions['Type_Prévision'] == 'SAISIE']
+
+    if len(prev_saisies) < 3:
+        return pd.DataFrame()
+
+    semaine_max = int(prev_saisies['Semaine_Num'].max())
+
+    if methode == 'moyenne':
+        moyennes = prev_saisies.groupby('Code_Produit', observed=True)['Volume_Prévu_T'].mean()
+        produits, volumes = moyennes.index.to_numpy(), moyennes.to_numpy(dtype=float)
+    else:
+        series = _series_hebdo(prev_saisies)
+        matrice = series.to_numpy(dtype=float)
+        if methode == 'moyenne_ponderee':
+            volumes = _moyenne_ponderee(matrice, poids)
+        else:
+            volumes = _lissage_exponentiel(matrice, alpha)
+        produits = series.index.to_numpy()
+
+    # Produits sans aucune valeur exploitable : pas de projection
+    valides = ~np.isnan(volumes)
+    produits, volumes = produits[valides], volumes[valides]
+
+    semaines = np.arange(semaine_max + 1, semaine_max + horizon + 1)
+
+    return pd.DataFrame({
+        'Semaine_Num': np.tile(semaines, len(produits)),
+        'Code_Produit': np.repeat(produits, horizon),
+        'Volume_Prévu_T': np.repeat(np.round(volumes, 2), horizon),
+        'Type_Prévision': 'EXTRAPOLÉE'
+    })
+
+def nouvelles_extrapolations(data, extrapolations):
+    """Extrapolations dont le couple (semaine, produit) n'est pas déjà dans Previsions
+
+    Recalculer sur les mêmes saisies n'ajoute donc rien.
+    """
+    if len(extrapolations) == 0:
+        return extrapolations
+    previsions = data['Previsions']
+    existantes = set(zip(pd.to_numeric(previsions['Semaine_Num'], errors='coerce'),
+                         previsions['Code_Produit'].astype(str)))
+    cles = zip(extrapolations['Semaine_Num'], extrapolations['Code_Produit'].astype(str))
+    return extrapolations[[cle not in existantes for cle in cles]].reset_index(drop=True)
+
+def lignes_previsions_sheets(df_extrap):
+    """Convertit les extrapolations en lignes de l'onglet Previsions"""
+    return [
+        [int(semaine), '', code, float(volume), 'EXTRAPOLÉE', 'Prévisionnel', '', '', '', '']
+        for semaine, code, volume in zip(df_extrap['Semaine_Num'],
+                                         df_extrap['Code_Produit'],
+                                         df_extrap['Volume_Prévu_T'])
+    ]
@@ -0,0 +1,204 @@
+"""
+SAISIE DES RÉSULTATS DE LAVAGE - ÉCRITURE EN UN SEUL COMMIT
+Stock lavé + décrément du lot + statut de l'OL en une requête, avec journal local
+"""
+
+import json
+import os
+import threading
+from datetime import datetime
+
+import gspread
+from gspread.utils import absolute_range_name, rowcol_to_a1
+
+from sheets_io import construire_index
+
+# Journal des écritures (une ligne JSON par changement d'état)
+CHEMIN_JOURNAL = os.environ.get('PLANNING_JOURNAL', os.path.join('journal', 'resultats_lavage.jsonl'))
+
+# Lignes ajoutées d'un coup quand l'onglet des stocks lavés est plein
+LIGNES_AJOUTEES = 100
+
+_verrou_journal = threading.Lock()
+
+def journaliser(entree, chemin=None):
+    """Ajoute l'état courant d'une écriture au journal local"""
+    chemin = chemin or CHEMIN_JOURNAL
+    os.makedirs(os.path.dirname(chemin) or '.', exist_ok=True)
+    with _verrou_journal, open(chemin, 'a', encoding='utf-8') as f:
+        f.write(json.dumps(dict(entree, horodatage=datetime.now().isoformat(timespec='seconds')),
+                           ensure_ascii=False, default=str) + '\n')
+
+def entrees_incertaines(chemin=None):
+    """Écritures dont l'issue n'a pas pu être vérifiée (à contrôler dans le classeur)"""
+    chemin = chemin or CHEMIN_JOURNAL
+    if not os.path.exists(chemin):
+        return []
+    derniers = {}
+    with open(chemin, encoding='utf-8') as f:
+        for ligne in f:
+            entree = json.loads(ligne)
+            derniers[entree['stock_lave_id']] = entree
+    return [e for e in derniers.values() if e['etat'] == 'incertain']
+
+def resoudre_incertaines(lots_laves, chemin=None):
+    """Confirme les écritures incertaines dont le stock lavé figure dans l'onglet relu
+
+    L'écriture est appliquée en entier ou pas du tout : la présence du stock
+    lavé dans `lots_laves` (DataFrame de Lots_Lavés) prouve qu'elle a eu lieu.
+    Son absence ne prouve rien (données du cache antérieures à l'écriture) :
+    ces entrées restent incertaines jusqu'à `acquitter_incertaines`.
+    Retourne les entrées encore incertaines.
+    """
+    incertaines = entrees_incertaines(chemin)
+    if not incertaines or 'Stock_Lavé_ID' not in lots_laves.columns:
+        return incertaines
+    presents = set(lots_laves['Stock_Lavé_ID'].astype(str))
+    restantes = []
+    for entree in incertaines:
+        if str(entree['stock_lave_id']) in presents:
+            journaliser(dict(entree, etat='valide'), chemin)
+        else:
+            restantes.append(entree)
+    return restantes
+
+def acquitter_incertaines(stock_lave_ids, chemin=None):
+    """Marque des écritures incertaines comme vérifiées dans le classeur (état 'acquitte')"""
+    ids = {str(i) for i in stock_lave_ids}
+    for entree in entrees_incertaines(chemin):
+        if str(entree['stock_lave_id']) in ids:
+            journaliser(dict(entree, etat='acquitte'), chemin)
+
+def _premiere_ligne(index, cle, libelle):
+    lignes = index.lignes.get(str(cle))
+    if not lignes:
+        raise ValueError(f"{libelle} {cle} introuvable dans {index.onglet}")
+    return lignes[0]
+
+def _lettre(col):
+    return rowcol_to_a1(1, col)[:-1]
+
+def _agrandir_grille(spreadsheet, index, ligne):
+    """Ajoute des lignes à la grille si `ligne` la dépasse
+
+    `values.batchUpdate` refuse d'écrire hors de la grille : une fois
+    l'onglet plein, la ligne du stock lavé doit d'abord être créée. La taille
+    connue de l'index (relevée avec les onglets, voir sync_donnees) évite
+    toute requête tant que la ligne reste dans la grille ; les métadonnées
+    ne sont lues que si elle est inconnue ou dépassée. Des lignes vides en
+    plus sont sans effet si l'écriture échoue ensuite.
+    """
+    if index.lignes_grille is not None and ligne <= index.lignes_grille:
+        return
+    feuille = spreadsheet.worksheet(index.onglet)
+    if ligne > feuille.row_count:
+        feuille.add_rows(ligne - feuille.row_count + LIGNES_AJOUTEES)
+    index.lignes_grille = feuille.row_count
+
+def preparer_resultat_lavage(spreadsheet, index_laves, index_lots, index_planning, ol, largeur, tentatives=2):
+    """Calcule toutes les cellules cibles puis les vérifie en une seule lecture
+
+    Retourne {'ligne_stock', 'ligne_lot', 'ligne_ol', 'ancien_tonnage', 'ancien_statut'}.
+    La grille de Lots_Lavés est agrandie si la nouvelle ligne la dépasse.
+    Si une position ne correspond plus (feuille modifiée), les index sont
+    reconstruits et la préparation est recommencée.
+    """
+    for _ in range(tentatives):
+        ligne_stock = index_laves.derniere_ligne + 1
+        _agrandir_grille(spreadsheet, index_laves, ligne_stock)
+        ligne_lot = _premiere_ligne(index_lots, ol['Lot_ID'], "Lot")
+        ligne_ol = _premiere_ligne(index_planning, ol['ID_Lavage'], "OL")
+
+        plages = [
+            index_lots.plage(ligne_lot, 'Lot_ID'),
+            index_lots.plage(ligne_lot, 'Tonnage_Brut_Restant'),
+            index_planning.plage(ligne_ol, 'ID_Lavage'),
+            index_planning.plage(ligne_ol, 'Statut'),
+            absolute_range_name(index_laves.onglet, f"A{ligne_stock}:{_lettre(largeur)}{ligne_stock}"),
+        ]
+        try:
+            reponse = spreadsheet.values_batch_get(plages, params={'valueRenderOption': 'UNFORMATTED_VALUE'})
+        except gspread.exceptions.APIError as e:
+            if e.code != 400 or index_laves.lignes_grille is None:
+                raise
+            # Grille réduite hors de l'application : taille relue au tour suivant
+            index_laves.lignes_grille = None
+            continue
+        valeurs = [p.get('values', [[]]) for p in reponse.get('valueRanges', [])]
+        cellules = [v[0][0] if v and v[0] else '' for v in valeurs[:4]]
+
+        if (str(cellules[0]) == str(ol['Lot_ID']) and str(cellules[2]) == str(ol['ID_Lavage'])
+                and not any(valeurs[4][0] if valeurs[4] else [])):
+            return {
+                'ligne_stock': ligne_stock,
+                'ligne_lot': ligne_lot,
+                'ligne_ol': ligne_ol,
+                'ancien_tonnage': float(cellules[1] or 0),
+                'ancien_statut': cellules[3],
+            }
+
+        for index in (index_laves, index_lots, index_planning):
+            index.reconstruire(spreadsheet)
+
+    raise RuntimeError("Les positions du classeur changent pendant la saisie, réessayez")
+
+def _ligne_ecrite(spreadsheet, index_laves, ligne_stock, stock_lave_id):
+    """True/False selon que la ligne du stock lavé est présente, None si illisible"""
+    try:
+        cellule = spreadsheet.values_get(index_laves.plage(ligne_stock, index_laves.colonne_cle))
+    except Exception:
+        return None
+    valeurs = cellule.get('values', [])
+    return bool(valeurs and valeurs[0] and valeurs[0][0] == str(stock_lave_id))
+
+def enregistrer_resultat_lavage(spreadsheet, ol, ligne_stock, tonnage_brut,
+                                index_laves=None, index_lots=None, index_planning=None):
+    """Crée le stock lavé, décrémente le lot et termine l'OL en une seule écriture
+
+    Les trois onglets sont écrits par un unique `values_batch_update`,
+    que Google applique en entier ou pas du tout. Si la réponse n'arrive
+    pas, la ligne du stock lavé est relue pour savoir si l'écriture a eu
+    lieu ; chaque étape est tracée dans le journal local.
+    Retourne le plan d'écriture (lignes visées, ancien et nouveau tonnage).
+    """
+    index_laves = index_laves or construire_index(spreadsheet, 'Lots_Lavés', 'Stock_Lavé_ID')
+    index_lots = index_lots or construire_index(spreadsheet, 'Lots', 'Lot_ID')
+    index_planning = index_planning or construire_index(spreadsheet, 'Planning_Lavage', 'ID_Lavage')
+
+    plan = preparer_resultat_lavage(spreadsheet, index_laves, index_lots, index_planning,
+                                    ol, largeur=len(ligne_stock))
+    plan['nouveau_tonnage'] = plan['ancien_tonnage'] - tonnage_brut
+
+    stock_lave_id = ligne_stock[0]
+    entree = {
+        'stock_lave_id': stock_lave_id,
+        'ol': ol['ID_Lavage'],
+        'lot': ol['Lot_ID'],
+        **plan,
+    }
+    journaliser(dict(entree, etat='en_cours'))
+
+    ligne = plan['ligne_stock']
+    donnees = [
+        {'range': absolute_range_name(index_laves.onglet, f"A{ligne}:{_lettre(len(ligne_stock))}{ligne}"),
+         'values': [ligne_stock]},
+        {'range': index_lots.plage(plan['ligne_lot'], 'Tonnage_Brut_Restant'),
+         'values': [[plan['nouveau_tonnage']]]},
+        {'range': index_planning.plage(plan['ligne_ol'], 'Statut'),
+         'values': [['Terminé']]},
+    ]
+
+    try:
+        spreadsheet.values_batch_update({'valueInputOption': 'USER_ENTERED', 'data': donnees})
+    except Exception:
+        ecrit = _ligne_ecrite(spreadsheet, index_laves, ligne, stock_lave_id)
+        if ecrit is None:
+            journaliser(dict(entree, etat='incertain'))
+            raise
+        if not ecrit:
+            journaliser(dict(entree, etat='annule'))
+            raise
+
+    journaliser(dict(entree, etat='valide'))
+    index_laves.ajouter([stock_lave_id], ligne)
+    return plan
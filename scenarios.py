@@ -0,0 +1,270 @@
+"""
+SCÉNARIOS DE PLANIFICATION
+Hypothèses (équipes, capacités, prévisions, lots déclassés) évaluées en
+parallèle sur une copie des données, sans rien écrire (sans dépendance Streamlit)
+
+    resultats = evaluer_scenarios(data, [
+        {'nom': '3e équipe L2', 'equipes': {'L2': 3}},
+        {'nom': 'Prévisions +15 %', 'facteur_previsions': 1.15},
+        {'nom': 'Lot déclassé', 'lots_declasses': ['LOT_0042']},
+    ])
+"""
+
+import hashlib
+import multiprocessing
+import os
+import pickle
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from itertools import repeat
+
+import numpy as np
+import pandas as pd
+
+from alertes_stocks import MANQUE, calculer_alertes
+from moteur_planning import HEURES_PAR_EQUIPE, JOURS_PAR_SEMAINE, generer_planning_production, parametre
+from previsions import calculer_extrapolation, nouvelles_extrapolations
+
+REFERENCE = 'Référence'
+
+# Clés reconnues dans un scénario (toutes facultatives sauf 'nom')
+CLES_SCENARIO = {
+    'nom': "Libellé du scénario",
+    'equipes': "{Code_Ligne: Nb_Équipes}",
+    'capacites': "{Code_Ligne: Capacité_T_h}",
+    'facteur_previsions': "Multiplicateur de tous les volumes prévus (1.15 = +15 %)",
+    'facteurs_produits': "{Code_Produit: multiplicateur}, en plus du facteur global",
+    'lots_declasses': "[Lot_ID] retirés du stock (Tonnage_Brut_Restant = 0)",
+}
+
+# Seuls ces onglets sont copiés vers les processus
+ONGLETS = ('Previsions', 'Produits', 'REF_Lignes', 'REF_Variétés', 'Lots', 'Affectations', 'Parametres')
+
+INDICATEURS = ['Tonnage_Prévu', 'Tonnage_Planifié', 'Tonnage_Couvert', 'Taux_Couverture',
+               'Charge_Moyenne', 'Charge_Max', 'Semaines_Lignes_Surchargées',
+               'Variétés_En_Manque', 'Manque_T']
+
+# Processus de calcul (1 : évaluation dans le processus courant)
+PROCESSUS_MAX = int(os.environ.get('PLANNING_PROCESSUS_SCENARIOS', min(os.cpu_count() or 1, 4)))
+# Sous ce volume (lignes de prévisions × scénarios), l'envoi aux processus coûte plus qu'il ne rapporte
+SEUIL_PARALLELE = int(os.environ.get('PLANNING_SEUIL_SCENARIOS', 5000))
+
+# =============================================================================
+# APPLICATION D'UN SCÉNARIO
+# =============================================================================
+
+def verifier_scenario(data, scenario):
+    """Lève ValueError si le scénario a une clé inconnue ou vise une ligne / un lot absent"""
+    inconnues = set(scenario) - set(CLES_SCENARIO)
+    if inconnues:
+        raise ValueError(f"Clé(s) de scénario inconnue(s) : {', '.join(sorted(inconnues))}")
+    if not scenario.get('nom'):
+        raise ValueError("Scénario sans nom")
+
+    lignes = set(data['REF_Lignes']['Code_Ligne'].astype(str))
+    for cle in ('equipes', 'capacites'):
+        absentes = set(map(str, scenario.get(cle, {}))) - lignes
+        if absentes:
+            raise ValueError(f"{scenario['nom']} : ligne(s) inconnue(s) {', '.join(sorted(absentes))}")
+
+    lots = set(data['Lots']['Lot_ID'].astype(str))
+    absents = set(map(str, scenario.get('lots_declasses', []))) - lots
+    if absents:
+        raise ValueError(f"{scenario['nom']} : lot(s) inconnu(s) {', '.join(sorted(absents))}")
+
+def appliquer_scenario(data, scenario):
+    """Données modifiées par le scénario ; seuls les onglets touchés sont copiés"""
+    data = dict(data)
+
+    if scenario.get('equipes') or scenario.get('capacites'):
+        lignes = data['REF_Lignes'].copy()
+        codes = lignes['Code_Ligne'].astype(str)
+        for cle, colonne in (('equipes', 'Nb_Équipes'), ('capacites', 'Capacité_T_h')):
+            for code, valeur in scenario.get(cle, {}).items():
+                lignes.loc[codes == str(code), colonne] = valeur
+        data['REF_Lignes'] = lignes
+
+    facteur = scenario.get('facteur_previsions', 1)
+    facteurs_produits = scenario.get('facteurs_produits', {})
+    if facteur != 1 or facteurs_produits:
+        previsions = data['Previsions'].copy()
+        multiplicateurs = previsions['Code_Produit'].astype(str).map(facteurs_produits).fillna(1).to_numpy()
+        previsions['Volume_Prévu_T'] = (pd.to_numeric(previsions['Volume_Prévu_T'], errors='coerce')
+                                        * facteur * multiplicateurs)
+        data['Previsions'] = previsions
+
+    if scenario.get('lots_declasses'):
+        lots = data['Lots'].copy()
+        declasses = lots['Lot_ID'].astype(str).isin([str(l) for l in scenario['lots_declasses']])
+        lots.loc[declasses, 'Tonnage_Brut_Restant'] = 0.0
+        data['Lots'] = lots
+
+    return data
+
+# =============================================================================
+# INDICATEURS
+# =============================================================================
+
+def capacite_hebdo(data):
+    """Tonnage produit en une semaine à pleine capacité, par ligne de production"""
+    lignes = data['REF_Lignes']
+    lignes = lignes[lignes['Type'] == 'Production'].drop_duplicates('Code_Ligne')
+    heures = parametre(data, 'Heures_Par_Équipe', HEURES_PAR_EQUIPE)
+    capacite = (pd.to_numeric(lignes['Capacité_T_h'], errors='coerce').fillna(0).to_numpy()
+                * pd.to_numeric(lignes['Nb_Équipes'], errors='coerce').fillna(0).to_numpy()
+                * heures * JOURS_PAR_SEMAINE)
+    return pd.Series(capacite, index=lignes['Code_Ligne'].astype(str).to_numpy(), name='Capacité_T')
+
+def evaluer(data, scenario, horizon=0, methode='moyenne'):
+    """Indicateurs d'un scénario : (indicateurs, charge max par ligne, écart par variété)
+
+    Le planning vient de generer_planning_production (prévisions saisies,
+    plus `horizon` semaines extrapolées) ; la charge d'une ligne sur une
+    semaine est le tonnage planifié rapporté à sa capacité hebdomadaire, et
+    le tonnage couvert est la part du planning qui tient dans cette capacité.
+    """
+    data = appliquer_scenario(data, scenario)
+    if horizon > 0:
+        extrapolations = nouvelles_extrapolations(data, calculer_extrapolation(data, methode, horizon))
+        if len(extrapolations):
+            data['Previsions'] = pd.concat([data['Previsions'], extrapolations], ignore_index=True)
+
+    planning = generer_planning_production(data)
+    capacite = capacite_hebdo(data)
+    if len(planning):
+        par_semaine = planning.groupby(['Ligne', 'Semaine'], observed=True)['Tonnage'].sum().reset_index()
+        capacite_semaine = par_semaine['Ligne'].astype(str).map(capacite).fillna(0).to_numpy()
+        planifie = par_semaine['Tonnage'].to_numpy()
+        with np.errstate(divide='ignore', invalid='ignore'):
+            par_semaine['Charge'] = np.where(capacite_semaine > 0, planifie / capacite_semaine, np.inf)
+        couvert = np.minimum(planifie, capacite_semaine).sum()
+        charge_lignes = par_semaine.groupby('Ligne', observed=True)['Charge'].max()
+    else:
+        par_semaine = pd.DataFrame({'Charge': []})
+        couvert = 0.0
+        charge_lignes = pd.Series(dtype=float)
+
+    alertes = calculer_alertes(data)
+    manques = alertes[alertes['Statut'] == MANQUE]
+    prevu = float(pd.to_numeric(data['Previsions']['Volume_Prévu_T'], errors='coerce').sum())
+
+    indicateurs = {
+        'Tonnage_Prévu': round(prevu, 1),
+        'Tonnage_Planifié': round(float(planning['Tonnage'].sum()) if len(planning) else 0.0, 1),
+        'Tonnage_Couvert': round(float(couvert), 1),
+        'Taux_Couverture': round(float(couvert) / prevu, 3) if prevu else None,
+        'Charge_Moyenne': round(float(par_semaine['Charge'].mean()), 3) if len(par_semaine) else None,
+        'Charge_Max': round(float(par_semaine['Charge'].max()), 3) if len(par_semaine) else None,
+        'Semaines_Lignes_Surchargées': int((par_semaine['Charge'] > 1).sum()),
+        'Variétés_En_Manque': len(manques),
+        'Manque_T': round(float(-manques['Écart_T'].sum()), 1),
+    }
+    ecarts = alertes.set_index('Code_Variété')['Écart_T']
+    return indicateurs, charge_lignes.round(3), ecarts
+
+# =============================================================================
+# ÉVALUATION PARALLÈLE
+# =============================================================================
+
+_verrou_pool = threading.Lock()
+_pool = None
+_taille_pool = 0
+# Données publiées pour les processus : {jeton: fichier pickle}, les deux dernières versions
+_publications = {}
+_verrou_publications = threading.Lock()
+
+# Côté processus de calcul : données de la dernière version lue {jeton: data}
+_donnees_partagees = {}
+
+def _evaluer_partage(chemin, jeton, scenario, horizon, methode):
+    data = _donnees_partagees.get(jeton)
+    if data is None:
+        with open(chemin, 'rb') as f:
+            data = pickle.load(f)
+        _donnees_partagees.clear()
+        _donnees_partagees[jeton] = data
+    return evaluer(data, scenario, horizon, methode)
+
+def _publier(partage):
+    """(fichier, jeton) des données : écrites une fois par version, lues une fois par processus"""
+    octets = pickle.dumps(partage, protocol=pickle.HIGHEST_PROTOCOL)
+    jeton = hashlib.blake2b(octets, digest_size=16).hexdigest()
+    with _verrou_publications:
+        if jeton not in _publications:
+            chemin = os.path.join(tempfile.gettempdir(), f'planning_scenarios_{os.getpid()}_{jeton}.pkl')
+            with open(chemin, 'wb') as f:
+                f.write(octets)
+            _publications[jeton] = chemin
+            # Version précédente gardée : une évaluation concurrente peut encore la lire
+            for ancien in list(_publications)[:-2]:
+                try:
+                    os.remove(_publications.pop(ancien))
+                except OSError:
+                    pass
+        return _publications[jeton], jeton
+
+def _contexte():
+    # Pas de fork direct : le serveur Streamlit a des threads dont les verrous
+    # seraient hérités dans un état quelconque
+    if 'forkserver' in multiprocessing.get_all_start_methods():
+        contexte = multiprocessing.get_context('forkserver')
+        contexte.set_forkserver_preload(['scenarios'])
+        return contexte
+    return multiprocessing.get_context('spawn')
+
+def _obtenir_pool(processus):
+    """Pool partagé par tout le processus, démarré au premier usage (agrandi si besoin)"""
+    global _pool, _taille_pool
+    with _verrou_pool:
+        if _pool is None or processus > _taille_pool:
+            if _pool is not None:
+                _pool.shutdown(wait=False)
+            _pool = ProcessPoolExecutor(processus, mp_context=_contexte())
+            _taille_pool = processus
+        return _pool
+
+def _abandonner_pool():
+    global _pool, _taille_pool
+    with _verrou_pool:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+        _pool, _taille_pool = None, 0
+
+def evaluer_scenarios(data, scenarios, horizon=0, methode='moyenne', processus=None):
+    """Évalue la référence et chaque scénario, côte à côte
+
+    Au-delà de SEUIL_PARALLELE, les scénarios sont répartis sur le pool de
+    processus partagé (`processus`, PROCESSUS_MAX par défaut) ; les onglets
+    utiles sont écrits une fois par version et lus une fois par processus. Retourne (indicateurs, charge_lignes, ecarts) :
+    un DataFrame par résultat, une colonne par scénario (référence en tête) ;
+    indicateurs en lignes, charge max par ligne de production, écart stock -
+    besoin (T) des variétés en manque dans au moins un scénario.
+    """
+    scenarios = [{'nom': REFERENCE}] + [dict(s) for s in scenarios]
+    noms = [s.get('nom') for s in scenarios]
+    if len(set(noms)) != len(noms):
+        raise ValueError("Noms de scénarios en double")
+    for scenario in scenarios:
+        verifier_scenario(data, scenario)
+
+    partage = {o: data[o] for o in ONGLETS if o in data}
+    processus = min(PROCESSUS_MAX if processus is None else processus, len(scenarios))
+    volume = len(partage.get('Previsions', ())) * len(scenarios)
+    resultats = None
+    if processus > 1 and volume >= SEUIL_PARALLELE:
+        chemin, jeton = _publier(partage)
+        try:
+            resultats = list(_obtenir_pool(processus).map(
+                _evaluer_partage, repeat(chemin), repeat(jeton), scenarios, repeat(horizon), repeat(methode)))
+        except BrokenProcessPool:
+            _abandonner_pool()
+    if resultats is None:
+        resultats = [evaluer(partage, s, horizon, methode) for s in scenarios]
+
+    indicateurs = pd.DataFrame({nom: r[0] for nom, r in zip(noms, resultats)}, dtype=object).reindex(INDICATEURS)
+    charge_lignes = pd.DataFrame({nom: r[1] for nom, r in zip(noms, resultats)})
+    ecarts = pd.DataFrame({nom: r[2] for nom, r in zip(noms, resultats)})
+    ecarts = ecarts[(ecarts < 0).any(axis=1)].sort_values(REFERENCE)
+    return indicateurs, charge_lignes, ecarts
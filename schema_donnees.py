@@ -0,0 +1,176 @@
+"""
+SCHÉMA DES ONGLETS
+Types déclarés par onglet, appliqués une fois au chargement (sans dépendance Streamlit)
+
+Codes répétés -> category, tonnages -> float64, taux -> float32,
+semaines -> int16, dates -> datetime64. Une colonne n'est convertie que si
+la conversion ne perd rien : sinon (texte dans une colonne de nombres, date
+illisible) elle reste telle que lue et l'onglet le signale.
+"""
+
+import threading
+
+import pandas as pd
+
+CATEGORIE = 'category'
+TONNAGE = 'float64'
+TAUX = 'float32'
+SEMAINE = 'int16'
+DATE = 'datetime64[ns]'
+
+SCHEMAS = {
+    'REF_Variétés': {
+        'Taux_Déchet_Moyen': TAUX,
+    },
+    'REF_Lignes': {
+        'Type': CATEGORIE,
+        'Capacité_T_h': TONNAGE,
+    },
+    'Produits': {
+        'Code_Variété': CATEGORIE,
+        'Ligne_Affectée': CATEGORIE,
+        'Actif': CATEGORIE,
+    },
+    'Lots': {
+        'Code_Variété': CATEGORIE,
+        'Producteur': CATEGORIE,
+        'Date_Réception': DATE,
+        'Tonnage_Brut': TONNAGE,
+        'Tonnage_Brut_Restant': TONNAGE,
+        'Taux_Déchet_Estimé': TAUX,
+        'Type_Lot': CATEGORIE,
+        'Statut': CATEGORIE,
+    },
+    'Lots_Lavés': {
+        'Date_Lavage': DATE,
+        'Ligne_Lavage': CATEGORIE,
+        'Code_Variété': CATEGORIE,
+        'Tonnage_Brut': TONNAGE,
+        'Tonnage_Net': TONNAGE,
+        'Taux_Déchet': TAUX,
+        'Taux_Purs': TAUX,
+        'Taux_Grenailles': TAUX,
+        'Taux_Terre': TAUX,
+        'Zone_Stockage': CATEGORIE,
+        'Tonnage_Net_Restant': TONNAGE,
+        'Statut': CATEGORIE,
+    },
+    'Previsions': {
+        'Semaine_Num': SEMAINE,
+        'Code_Produit': CATEGORIE,
+        'Volume_Prévu_T': TONNAGE,
+        'Type_Prévision': CATEGORIE,
+        'Statut': CATEGORIE,
+        'Saisi_Par': CATEGORIE,
+    },
+    'Affectations': {
+        'Code_Produit': CATEGORIE,
+        'Semaine_Début': SEMAINE,
+        'Tonnage_Dispo': TONNAGE,
+        'Tonnage_Brut_Requis': TONNAGE,
+        'Écart_T': TONNAGE,
+        'Statut_Affectation': CATEGORIE,
+        'Source': CATEGORIE,
+    },
+    'Planning_Lavage': {
+        'Semaine_Num': SEMAINE,
+        'Date': DATE,
+        'Ligne_Lavage': CATEGORIE,
+        'Code_Variété': CATEGORIE,
+        'Tonnage_Brut': TONNAGE,
+        'Statut': CATEGORIE,
+    },
+    'Planning_Production': {
+        'Semaine_Num': SEMAINE,
+        'Date': DATE,
+        'Ligne_Prod': CATEGORIE,
+        'Code_Produit': CATEGORIE,
+        'Équipe': CATEGORIE,
+        'Tonnage_Planifié': TONNAGE,
+        'Statut': CATEGORIE,
+    },
+    'Alerte_Stocks': {
+        'Code_Variété': CATEGORIE,
+        'Besoin_T': TONNAGE,
+        'Stock_T': TONNAGE,
+        'Écart_T': TONNAGE,
+        'Statut': CATEGORIE,
+    },
+}
+
+_verrou = threading.Lock()
+_memoire = {}
+
+def _vide(serie):
+    """Cellules vides de la feuille ('' ou absentes)"""
+    return serie.isna() | (serie.astype(str).str.strip() == '')
+
+def convertir_colonne(serie, type_cible):
+    """Colonne convertie, ou None si la conversion perdrait une valeur non vide"""
+    if type_cible == CATEGORIE:
+        return serie.astype(CATEGORIE)
+
+    vide = _vide(serie)
+    if type_cible == DATE:
+        convertie = pd.to_datetime(serie.where(~vide), errors='coerce')
+    else:
+        convertie = pd.to_numeric(serie.where(~vide), errors='coerce')
+    if (convertie.isna() & ~vide).any():
+        return None
+
+    if type_cible == SEMAINE:
+        # Semaine manquante : pas de NaN possible en int16, on garde des flottants
+        if convertie.isna().any() or (convertie % 1 != 0).any():
+            return convertie.astype('float32')
+        return convertie.astype(SEMAINE)
+    return convertie.astype(type_cible)
+
+def typer_onglet(onglet, df):
+    """Applique le schéma de l'onglet et relève sa mémoire avant / après"""
+    schema = SCHEMAS.get(onglet)
+    if not schema or df.empty:
+        return df
+
+    avant = int(df.memory_usage(deep=True).sum())
+    df = df.copy()
+    non_converties = []
+    for colonne, type_cible in schema.items():
+        if colonne not in df.columns or str(df[colonne].dtype) == type_cible:
+            continue
+        convertie = convertir_colonne(df[colonne], type_cible)
+        if convertie is None:
+            non_converties.append(colonne)
+        else:
+            df[colonne] = convertie
+
+    with _verrou:
+        _memoire[onglet] = {
+            'lignes': len(df),
+            'octets_avant': avant,
+            'octets_apres': int(df.memory_usage(deep=True).sum()),
+            'non_converties': non_converties,
+        }
+    return df
+
+def typer_donnees(data):
+    return {onglet: typer_onglet(onglet, df) for onglet, df in data.items()}
+
+def memoire_onglets():
+    """{onglet: {'lignes', 'octets_avant', 'octets_apres', 'non_converties'}} au dernier chargement"""
+    with _verrou:
+        return {onglet: dict(infos) for onglet, infos in _memoire.items()}
+
+def colonne_dates(df, colonne='Date'):
+    """Colonne de dates en datetime64 (déjà convertie au chargement, sinon lue ici)"""
+    serie = df[colonne]
+    if pd.api.types.is_datetime64_any_dtype(serie):
+        return serie
+    return pd.to_datetime(serie, errors='coerce')
+
+def affecter(df, masque, colonne, valeur):
+    """df.loc[masque, colonne] = valeur, en ajoutant la valeur aux catégories si besoin"""
+    serie = df[colonne]
+    if isinstance(serie.dtype, pd.CategoricalDtype) and pd.notna(valeur) \
+            and valeur not in serie.cat.categories:
+        df[colonne] = serie.cat.add_categories([valeur])
+    df.loc[masque, colonne] = valeur
@@ -0,0 +1,433 @@
+"""
+ACCÈS GOOGLE SHEETS - LECTURES ET ÉCRITURES GROUPÉES
+Module sans dépendance Streamlit (utilisable depuis app.py et depuis un script)
+"""
+
+import os
+import threading
+from datetime import datetime, timedelta
+
+import gspread
+import pandas as pd
+from google.auth.exceptions import RefreshError
+from google.auth.transport.requests import Request
+from google.oauth2.service_account import Credentials
+from gspread.utils import a1_to_rowcol, absolute_range_name, extract_id_from_url, numericise_all, rowcol_to_a1
+from requests.adapters import HTTPAdapter
+
+from mesures import mesurer, reponse_http
+from schema_donnees import typer_onglet
+
+SCOPES = [
+    "https://www.googleapis.com/auth/spreadsheets",
+    "https://www.googleapis.com/auth/drive"
+]
+
+# Classeur de production (PLANNING_URL_CLASSEUR pour en viser un autre)
+URL_CLASSEUR = os.environ.get(
+    'PLANNING_URL_CLASSEUR',
+    "https://docs.google.com/spreadsheets/d/1OEwROl08gdVLBiTpnEhs-IZ7ZenDtW1ODNzOL4QkwBk/edit?usp=sharing"
+)
+
+ONGLETS = [
+    'REF_Variétés', 'REF_Lignes', 'Produits', 'Lots', 'Lots_Lavés',
+    'Previsions', 'Affectations', 'Planning_Lavage',
+    'Planning_Production', 'Alerte_Stocks', 'Parametres'
+]
+
+# =============================================================================
+# CLIENT PARTAGÉ (UN PAR PROCESSUS)
+# =============================================================================
+
+# Rafraîchir le jeton avant qu'il n'expire plutôt que d'attendre un 401
+MARGE_RAFRAICHISSEMENT = timedelta(minutes=5)
+TAILLE_POOL_HTTP = 10
+
+_verrou_client = threading.Lock()
+_client = None
+_client_cle = None
+_spreadsheets = {}
+
+def creer_client(service_account_info):
+    """Crée un client gspread avec une session HTTP à connexions réutilisables"""
+    creds = Credentials.from_service_account_info(service_account_info, scopes=SCOPES)
+    gc = gspread.authorize(creds)
+
+    # AuthorizedSession est une requests.Session : on agrandit son pool
+    adapter = HTTPAdapter(pool_connections=TAILLE_POOL_HTTP, pool_maxsize=TAILLE_POOL_HTTP)
+    gc.http_client.session.mount('https://', adapter)
+    # Durée et volume de chaque requête (voir mesures)
+    gc.http_client.session.hooks['response'].append(reponse_http)
+    return gc
+
+def _rafraichir_si_necessaire(gc):
+    """Renouvelle le jeton OAuth s'il est absent ou proche de l'expiration"""
+    creds = gc.http_client.auth
+    if (creds.token is None or creds.expiry is None
+            or creds.expiry - datetime.utcnow() < MARGE_RAFRAICHISSEMENT):
+        creds.refresh(Request())
+
+def obtenir_client(service_account_info):
+    """Retourne le client partagé par tout le processus (créé une seule fois)
+
+    Le jeton est rafraîchi avant expiration. En cas d'échec d'authentification,
+    le client est abandonné et recréé à l'appel suivant.
+    """
+    global _client, _client_cle
+
+    cle = (service_account_info.get('client_email'), service_account_info.get('private_key_id'))
+
+    with _verrou_client:
+        if _client is None or _client_cle != cle:
+            _spreadsheets.clear()
+            _client = creer_client(service_account_info)
+            _client_cle = cle
+
+        try:
+            _rafraichir_si_necessaire(_client)
+        except Exception:
+            _client = None
+            _client_cle = None
+            _spreadsheets.clear()
+            raise
+
+        return _client
+
+def reinitialiser_client():
+    """Oublie le client partagé (après une erreur d'authentification)"""
+    global _client, _client_cle
+    with _verrou_client:
+        _client = None
+        _client_cle = None
+        _spreadsheets.clear()
+
+def est_erreur_auth(erreur):
+    """Indique si une exception provient d'un jeton refusé ou expiré"""
+    if isinstance(erreur, RefreshError):
+        return True
+    return isinstance(erreur, gspread.exceptions.APIError) and erreur.code == 401
+
+def ouvrir_spreadsheet(gc, sheet_url):
+    """Ouvre un classeur une seule fois par client (métadonnées mises en cache)"""
+    cle = (id(gc), sheet_url)
+    with _verrou_client:
+        spreadsheet = _spreadsheets.get(cle)
+    if spreadsheet is None:
+        spreadsheet = gc.open_by_url(sheet_url)
+        with _verrou_client:
+            _spreadsheets[cle] = spreadsheet
+    return spreadsheet
+
+class ClasseurDiffere:
+    """Classeur désigné par son URL, ouvert seulement au premier appel à l'API
+
+    L'id est tiré de l'URL sans requête : il suffit au cache et au snapshot
+    local. La connexion (`connexion()` retourne le client partagé) et
+    `open_by_url` n'ont lieu qu'à la première lecture ou écriture, dans le
+    thread qui la fait (rafraîchissement en arrière-plan compris).
+    """
+
+    def __init__(self, connexion, sheet_url):
+        self.id = extract_id_from_url(sheet_url)
+        self.url = sheet_url
+        self._connexion = connexion
+
+    def ouvrir(self):
+        """Classeur gspread (client et métadonnées partagés, voir ouvrir_spreadsheet)"""
+        try:
+            return ouvrir_spreadsheet(self._connexion(), self.url)
+        except Exception as e:
+            if est_erreur_auth(e):
+                reinitialiser_client()
+            raise
+
+    def __getattr__(self, nom):
+        if nom.startswith('__') or nom == '_connexion':
+            raise AttributeError(nom)
+        return getattr(self.ouvrir(), nom)
+
+# =============================================================================
+# LECTURE MULTI-ONGLETS
+# =============================================================================
+
+def valeurs_vers_dataframe(valeurs):
+    """Construit un DataFrame à partir des valeurs brutes d'un onglet
+
+    Reproduit `get_all_records()` : 1re ligne = en-têtes, lignes complétées
+    à la largeur des en-têtes, nombres convertis, cellules vides = ''.
+    """
+    if not valeurs or not valeurs[0]:
+        return pd.DataFrame()
+
+    headers = valeurs[0]
+    if len(set(headers)) != len(headers):
+        raise ValueError("En-têtes en double")
+
+    largeur = len(headers)
+    lignes = [
+        numericise_all((row + [''] * (largeur - len(row)))[:largeur])
+        for row in valeurs[1:]
+    ]
+    return pd.DataFrame(lignes, columns=headers)
+
+def charger_onglets(spreadsheet, onglets=ONGLETS, grilles=None):
+    """Charge plusieurs onglets en une seule requête `values:batchGet`
+
+    Retourne (data, erreurs) : data = {onglet: DataFrame} typé selon
+    schema_donnees (vide si échec), erreurs = {onglet: message} pour chaque
+    onglet qui n'a pas pu être lu. Si `grilles` (dict) est fourni, il reçoit
+    le nombre de lignes de la grille de chaque onglet (métadonnées déjà lues).
+    """
+    data = {}
+    erreurs = {}
+
+    with mesurer('chargement', f'lecture de {len(onglets)} onglet(s)'):
+        # Un onglet absent ferait échouer tout le batchGet : on filtre d'abord
+        feuilles = spreadsheet.worksheets()
+        existants = {ws.title for ws in feuilles}
+        if grilles is not None:
+            grilles.update({ws.title: ws.row_count for ws in feuilles})
+        a_lire = [o for o in onglets if o in existants]
+        for onglet in onglets:
+            if onglet not in existants:
+                erreurs[onglet] = "Onglet introuvable"
+
+        plages = []
+        if a_lire:
+            reponse = spreadsheet.values_batch_get([absolute_range_name(o) for o in a_lire])
+            plages = reponse.get('valueRanges', [])
+
+    with mesurer('chargement', 'conversion en DataFrames'):
+        for onglet, plage in zip(a_lire, plages):
+            try:
+                data[onglet] = typer_onglet(onglet, valeurs_vers_dataframe(plage.get('values', [])))
+            except Exception as e:
+                erreurs[onglet] = str(e)
+
+    for onglet in onglets:
+        if onglet not in data:
+            erreurs.setdefault(onglet, "Aucune donnée renvoyée")
+            data[onglet] = pd.DataFrame()
+
+    return data, erreurs
+
+# =============================================================================
+# INDEX DES POSITIONS (CLÉ MÉTIER → LIGNE DE LA FEUILLE)
+# =============================================================================
+
+# Clé métier des onglets mis à jour ligne à ligne
+CLES_ONGLETS = {
+    'Planning_Production': 'OF_ID',
+    'Planning_Lavage': 'ID_Lavage',
+    'Lots': 'Lot_ID',
+    'Lots_Lavés': 'Stock_Lavé_ID',
+}
+
+class IndexLignes:
+    """Position des enregistrements d'un onglet : clé → numéros de ligne, colonne → numéro
+
+    Construit à partir des données déjà chargées (ligne i du DataFrame =
+    ligne i + 2 de la feuille), puis tenu à jour lors des ajouts.
+    """
+
+    def __init__(self, onglet, colonne_cle, colonnes, cles, lignes_grille=None):
+        self.onglet = onglet
+        self.colonne_cle = colonne_cle
+        # Lignes de la grille de la feuille (None : inconnu)
+        self.lignes_grille = lignes_grille
+        self._remplir(colonnes, cles)
+
+    def _remplir(self, colonnes, cles):
+        self.colonnes = {nom: idx + 1 for idx, nom in enumerate(colonnes)}
+        self.lignes = {}
+        for row_idx, cle in enumerate(cles, start=2):
+            if cle != '':
+                self.lignes.setdefault(str(cle), []).append(row_idx)
+        self.derniere_ligne = len(cles) + 1
+
+    @classmethod
+    def depuis_dataframe(cls, onglet, colonne_cle, df, lignes_grille=None):
+        return cls(onglet, colonne_cle, list(df.columns), df[colonne_cle].tolist(), lignes_grille)
+
+    def plage(self, row_idx, colonne):
+        """Plage A1 absolue d'une cellule"""
+        return absolute_range_name(self.onglet, rowcol_to_a1(row_idx, self.colonnes[colonne]))
+
+    def ajouter(self, cles, premiere_ligne=None):
+        """Enregistre des lignes ajoutées en fin d'onglet"""
+        premiere_ligne = premiere_ligne or self.derniere_ligne + 1
+        for row_idx, cle in enumerate(cles, start=premiere_ligne):
+            self.lignes.setdefault(str(cle), []).append(row_idx)
+        self.derniere_ligne = max(self.derniere_ligne, premiere_ligne + len(cles) - 1)
+        if self.lignes_grille is not None:
+            # `values:append` agrandit la grille si besoin
+            self.lignes_grille = max(self.lignes_grille, self.derniere_ligne)
+
+    def reconstruire(self, spreadsheet):
+        """Relit uniquement l'en-tête et la colonne clé (jamais la feuille entière)"""
+        entete = spreadsheet.values_get(absolute_range_name(self.onglet, '1:1')).get('values', [[]])[0]
+        col = entete.index(self.colonne_cle) + 1
+        lettre = rowcol_to_a1(1, col)[:-1]
+        colonne = spreadsheet.values_get(absolute_range_name(self.onglet, f'{lettre}2:{lettre}'))
+        cles = [ligne[0] if ligne else '' for ligne in colonne.get('values', [])]
+        self._remplir(entete, cles)
+
+def construire_index(spreadsheet, onglet, colonne_cle):
+    """Index d'un onglet sans données en cache (deux petites lectures)"""
+    index = IndexLignes(onglet, colonne_cle, [], [])
+    index.reconstruire(spreadsheet)
+    return index
+
+def _plages_contigues(lignes):
+    """[3, 4, 5, 9] → [(3, 5), (9, 9)]"""
+    plages = []
+    for row_idx in sorted(set(lignes)):
+        if plages and row_idx == plages[-1][1] + 1:
+            plages[-1] = (plages[-1][0], row_idx)
+        else:
+            plages.append((row_idx, row_idx))
+    return plages
+
+def verifier_positions(spreadsheet, index, cles):
+    """Relit seulement les cellules clés visées pour confirmer que l'index est à jour"""
+    attendu = {}
+    for cle in cles:
+        for row_idx in index.lignes.get(str(cle), []):
+            attendu[row_idx] = str(cle)
+    if not attendu:
+        return True
+
+    lettre = rowcol_to_a1(1, index.colonnes[index.colonne_cle])[:-1]
+    plages = _plages_contigues(attendu)
+    reponse = spreadsheet.values_batch_get([
+        absolute_range_name(index.onglet, f'{lettre}{debut}:{lettre}{fin}') for debut, fin in plages
+    ])
+
+    for (debut, fin), plage in zip(plages, reponse.get('valueRanges', [])):
+        valeurs = plage.get('values', [])
+        for row_idx in range(debut, fin + 1):
+            if row_idx not in attendu:
+                continue
+            ligne = valeurs[row_idx - debut] if row_idx - debut < len(valeurs) else []
+            if not ligne or ligne[0] != attendu[row_idx]:
+                return False
+    return True
+
+# =============================================================================
+# ÉCRITURES GROUPÉES
+# =============================================================================
+
+def maj_cellules(spreadsheet, index, modifications, verifier=True):
+    """Écrit {clé: {colonne: valeur}} en une seule requête `values_batch_update`
+
+    Les lignes viennent de l'index (aucun téléchargement de la feuille).
+    Si la feuille a été réorganisée entre-temps, l'index est reconstruit.
+    Retourne un dict {clé: 'OK' | 'Introuvable'}.
+    """
+    if verifier and not verifier_positions(spreadsheet, index, modifications):
+        index.reconstruire(spreadsheet)
+
+    resultats = {}
+    donnees = []
+    for cle, valeurs in modifications.items():
+        lignes = index.lignes.get(str(cle), [])
+        resultats[cle] = 'OK' if lignes else 'Introuvable'
+        for row_idx in lignes:
+            for colonne, valeur in valeurs.items():
+                donnees.append({'range': index.plage(row_idx, colonne), 'values': [[valeur]]})
+
+    if donnees:
+        spreadsheet.values_batch_update({
+            'valueInputOption': 'USER_ENTERED',
+            'data': donnees
+        })
+
+    return resultats
+
+def maj_statuts_ordres(spreadsheet, onglet, colonne_id, ids, statut, colonne_statut='Statut', index=None):
+    """Change le statut d'une sélection d'ordres (OF ou OL) en une seule requête
+
+    `index` : IndexLignes de l'onglet (construit à la demande s'il manque).
+    Retourne un dict {id: 'OK' | 'Introuvable'} dans l'ordre de `ids`.
+    """
+    verifier = index is not None
+    if index is None:
+        index = construire_index(spreadsheet, onglet, colonne_id)
+
+    return maj_cellules(spreadsheet, index, {ordre_id: {colonne_statut: statut} for ordre_id in ids},
+                        verifier=verifier)
+
+def ajouter_lignes(spreadsheet, onglet, lignes, value_input_option='RAW', index=None):
+    """Ajoute toutes les lignes en fin d'onglet en une seule requête `values:append`
+
+    Si un IndexLignes est fourni, les nouvelles lignes y sont enregistrées.
+    """
+    if not lignes:
+        return None
+    reponse = spreadsheet.values_append(
+        absolute_range_name(onglet),
+        params={'valueInputOption': value_input_option},
+        body={'values': lignes}
+    )
+
+    if index is not None:
+        # 'Lots'!A12:P14 → première ligne écrite = 12
+        plage = reponse.get('updates', {}).get('updatedRange', '')
+        debut = a1_to_rowcol(plage.split('!')[-1].split(':')[0])[0] if plage else None
+        col_cle = index.colonnes[index.colonne_cle] - 1
+        index.ajouter([ligne[col_cle] if col_cle < len(ligne) else '' for ligne in lignes], debut)
+
+    return reponse
+
+def _cellule(valeur):
+    """Valeur comparable : nombres arrondis, texte sans espaces de bord, vide = ''"""
+    if valeur is None:
+        return ''
+    if isinstance(valeur, (int, float)):
+        return round(float(valeur), 6)
+    texte = str(valeur).strip()
+    try:
+        return round(float(texte), 6)
+    except ValueError:
+        return texte
+
+def lignes_en_fin(spreadsheet, onglet, lignes):
+    """Vrai si les dernières lignes de l'onglet sont `lignes` (ajout déjà appliqué)
+
+    Relit l'onglet en valeurs brutes ; un texte envoyé que la feuille a
+    converti en nombre ou en date (USER_ENTERED) est considéré comme égal.
+    """
+    valeurs = spreadsheet.values_get(absolute_range_name(onglet),
+                                     params={'valueRenderOption': 'UNFORMATTED_VALUE'}).get('values', [])
+    if len(valeurs) < len(lignes) + 1:
+        return False
+    for envoyee, lue in zip(lignes, valeurs[-len(lignes):]):
+        envoyee = [_cellule(v) for v in envoyee]
+        lue = [_cellule(v) for v in lue] + [''] * max(0, len(envoyee) - len(lue))
+        for attendu, trouve in zip(envoyee, lue):
+            converti = isinstance(attendu, str) and attendu and isinstance(trouve, float)
+            if attendu != trouve and not converti:
+                return False
+        if any(v != '' for v in lue[len(envoyee):]):
+            return False
+    return True
+
+def remplacer_onglets(spreadsheet, contenus, tailles=None, value_input_option='USER_ENTERED'):
+    """Remplace le contenu de plusieurs onglets en une seule requête `values_batch_update`
+
+    `contenus` = {onglet: [[en-têtes], [ligne], ...]}. `tailles` = {onglet:
+    (lignes, colonnes)} occupées avant l'écriture (en-tête compris) : la partie
+    qui dépasse du nouveau contenu est effacée dans la même requête.
+    """
+    tailles = tailles or {}
+    blocs = []
+    for onglet, valeurs in contenus.items():
+        anciennes_lignes, anciennes_colonnes = tailles.get(onglet, (0, 0))
+        largeur = max([anciennes_colonnes] + [len(ligne) for ligne in valeurs])
+        valeurs = [list(ligne) + [''] * (largeur - len(ligne)) for ligne in valeurs]
+        valeurs += [[''] * largeur for _ in range(anciennes_lignes - len(valeurs))]
+        blocs.append({'range': absolute_range_name(onglet, 'A1'), 'values': valeurs})
+
+    if not blocs:
+        return None
+    return spreadsheet.values_batch_update({'valueInputOption': value_input_option, 'data': blocs})
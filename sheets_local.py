@@ -0,0 +1,341 @@
+"""
+CLASSEUR LOCAL - DOUBLURE DE GOOGLE SHEETS EN MÉMOIRE OU SUR FICHIER
+Mêmes méthodes que les objets gspread utilisés par l'application, avec
+comptage des appels (mesures, benchmarks, développement hors ligne)
+"""
+
+import functools
+import json
+import os
+import re
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timezone
+
+from gspread.utils import numericise
+
+from mesures import enregistrer_appel, releve_courant
+
+# Appels qui correspondent à une requête HTTP vers l'API Sheets / Drive
+APPELS_API = (
+    'worksheets', 'values_get', 'values_batch_get', 'values_batch_update',
+    'values_append', 'get_lastUpdateTime', 'get_all_records', 'get_all_values',
+    'append_row', 'update_cell',
+)
+
+_verrou_registre = threading.Lock()
+_clients = {}
+
+def _colonne_vers_numero(lettres):
+    numero = 0
+    for lettre in lettres:
+        numero = numero * 26 + ord(lettre) - ord('A') + 1
+    return numero
+
+def _borne(a1):
+    """'C5' → (5, 3), 'C' → (None, 3), '5' → (5, None)"""
+    lettres, chiffres = re.fullmatch(r'([A-Z]*)(\d*)', a1.upper()).groups()
+    return (int(chiffres) if chiffres else None,
+            _colonne_vers_numero(lettres) if lettres else None)
+
+def decouper_plage(plage):
+    """"'Lots'!C2:C" → ('Lots', ligne_min, col_min, ligne_max, col_max), None = sans limite"""
+    if '!' in plage:
+        onglet, a1 = plage.rsplit('!', 1)
+    else:
+        onglet, a1 = plage, ''
+    if onglet.startswith("'") and onglet.endswith("'"):
+        onglet = onglet[1:-1].replace("''", "'")
+
+    if not a1:
+        return onglet, 1, 1, None, None
+    debut, _, fin = a1.partition(':')
+    l1, c1 = _borne(debut)
+    l2, c2 = _borne(fin) if fin else (l1, c1)
+    return onglet, l1 or 1, c1 or 1, l2, c2
+
+def _formater(valeur):
+    """Rendu FORMATTED_VALUE (ce que renvoie l'API par défaut)"""
+    if isinstance(valeur, bool):
+        return 'TRUE' if valeur else 'FALSE'
+    if isinstance(valeur, float) and valeur.is_integer():
+        return str(int(valeur))
+    return str(valeur)
+
+def _elaguer(lignes):
+    """L'API ne renvoie ni cellules vides en fin de ligne ni lignes vides en fin de plage"""
+    lignes = [list(l) for l in lignes]
+    for ligne in lignes:
+        while ligne and ligne[-1] == '':
+            ligne.pop()
+    while lignes and not lignes[-1]:
+        lignes.pop()
+    return lignes
+
+def _taille(valeur):
+    return len(json.dumps(valeur, ensure_ascii=False, default=str))
+
+def _appel_api(methode):
+    """Compte l'appel, ajoute la latence simulée et le note dans le relevé de mesures"""
+    @functools.wraps(methode)
+    def enveloppe(self, *args, **kwargs):
+        classeur = getattr(self, 'classeur', self)
+        classeur.appels[methode.__name__] += 1
+        debut = time.perf_counter()
+        if classeur.latence:
+            time.sleep(classeur.latence)
+        resultat = methode(self, *args, **kwargs)
+        # Hors relevé (scripts, benchmarks, threads) : comptage seul
+        if releve_courant() is not None:
+            enregistrer_appel(methode.__name__, time.perf_counter() - debut,
+                              octets_envoyes=_taille([args, kwargs]), octets_recus=_taille(resultat))
+        return resultat
+    return enveloppe
+
+class FeuilleLocale:
+    """Équivalent d'un gspread.Worksheet"""
+
+    def __init__(self, classeur, titre):
+        self.classeur = classeur
+        self.title = titre
+
+    @property
+    def _valeurs(self):
+        return self.classeur.onglets[self.title]
+
+    @property
+    def row_count(self):
+        return max(len(self._valeurs), 1000)
+
+    @_appel_api
+    def get_all_values(self):
+        return self.classeur._lire(self.title, 1, 1, None, None, rendu='FORMATTED_VALUE')
+
+    @_appel_api
+    def get_all_records(self):
+        valeurs = self.classeur._lire(self.title, 1, 1, None, None, rendu='UNFORMATTED_VALUE')
+        if not valeurs:
+            return []
+        entetes = valeurs[0]
+        return [dict(zip(entetes, ligne + [''] * (len(entetes) - len(ligne)))) for ligne in valeurs[1:]]
+
+    @_appel_api
+    def append_row(self, values, value_input_option='RAW', **kwargs):
+        return self.classeur._ajouter(self.title, [values], value_input_option)
+
+    @_appel_api
+    def add_rows(self, rows):
+        with self.classeur._verrou:
+            self._valeurs.extend([] for _ in range(rows))
+            self.classeur._marquer_modifie()
+
+    @_appel_api
+    def update_cell(self, row, col, value):
+        with self.classeur._verrou:
+            self.classeur._ecrire(self.title, row, col, [[value]], 'USER_ENTERED')
+            self.classeur._marquer_modifie()
+
+class ClasseurLocal:
+    """Équivalent d'un gspread.Spreadsheet, données en mémoire
+
+    `onglets` = {titre: [[valeur, ...], ...]} (1re ligne = en-têtes).
+    `appels` compte chaque appel d'API simulé ; `latence` (secondes)
+    est ajoutée à chacun pour reproduire le coût d'un aller-retour réseau.
+    Si `chemin` est fourni, chaque écriture est recopiée dans ce fichier
+    (.xlsx ou .sqlite).
+    """
+
+    def __init__(self, onglets=None, identifiant='classeur-local', titre='Classeur local', latence=0.0, chemin=None):
+        self.id = identifiant
+        self.title = titre
+        self.url = f'local://{identifiant}'
+        self.onglets = {nom: [list(l) for l in valeurs] for nom, valeurs in (onglets or {}).items()}
+        self.latence = latence
+        self.chemin = chemin
+        self.appels = Counter()
+        self.modifie_le = datetime.now(timezone.utc)
+        self._verrou = threading.RLock()
+
+    # -- Construction --------------------------------------------------------
+
+    @classmethod
+    def depuis_dataframes(cls, data, **kwargs):
+        """Classeur à partir de {onglet: DataFrame} (valeurs vides = '')"""
+        onglets = {}
+        for nom, df in data.items():
+            valeurs = df.astype(object).where(df.notna(), '').values.tolist()
+            onglets[nom] = [list(df.columns)] + valeurs
+        return cls(onglets, **kwargs)
+
+    @classmethod
+    def depuis_fichier(cls, chemin, **kwargs):
+        """Classeur à partir d'un export .xlsx ou d'un snapshot .sqlite"""
+        if chemin.endswith('.sqlite'):
+            from snapshot import charger_snapshot
+            data, _ = charger_snapshot(chemin)
+            if data is None:
+                raise FileNotFoundError(chemin)
+            return cls.depuis_dataframes(data, chemin=chemin, **kwargs)
+
+        from openpyxl import load_workbook
+        classeur = load_workbook(chemin, read_only=True, data_only=True)
+        onglets = {
+            feuille.title: [['' if v is None else v for v in ligne] for ligne in feuille.iter_rows(values_only=True)]
+            for feuille in classeur.worksheets
+        }
+        classeur.close()
+        return cls(onglets, chemin=chemin, **kwargs)
+
+    def enregistrer(self, chemin=None):
+        """Recopie le classeur dans un fichier .xlsx ou .sqlite"""
+        chemin = chemin or self.chemin
+        with self._verrou:
+            onglets = {nom: [list(l) for l in valeurs] for nom, valeurs in self.onglets.items()}
+
+        if chemin.endswith('.sqlite'):
+            from sheets_io import valeurs_vers_dataframe
+            from snapshot import enregistrer_snapshot
+            enregistrer_snapshot(chemin, {nom: valeurs_vers_dataframe(_elaguer(v)) for nom, v in onglets.items()})
+            return
+
+        from openpyxl import Workbook
+        classeur = Workbook(write_only=True)
+        for nom, valeurs in onglets.items():
+            feuille = classeur.create_sheet(nom)
+            for ligne in valeurs:
+                feuille.append(ligne)
+        classeur.save(chemin)
+
+    # -- Mécanique interne ---------------------------------------------------
+
+    def _feuille(self, onglet):
+        if onglet not in self.onglets:
+            raise ValueError(f"Unable to parse range: {onglet}")
+        return self.onglets[onglet]
+
+    def _lire(self, onglet, l1, c1, l2, c2, rendu='FORMATTED_VALUE'):
+        with self._verrou:
+            valeurs = self._feuille(onglet)
+            lignes = valeurs[l1 - 1:l2]
+            lignes = [ligne[c1 - 1:c2] for ligne in lignes]
+        if rendu == 'FORMATTED_VALUE':
+            lignes = [[_formater(v) for v in ligne] for ligne in lignes]
+        return _elaguer(lignes)
+
+    @staticmethod
+    def _interpreter(valeurs, value_input_option):
+        """USER_ENTERED : les textes numériques deviennent des nombres, comme dans Sheets"""
+        if value_input_option != 'USER_ENTERED':
+            return [list(l) for l in valeurs]
+        return [[numericise(v) if isinstance(v, str) else v for v in ligne] for ligne in valeurs]
+
+    def _ecrire(self, onglet, ligne, colonne, valeurs, value_input_option):
+        valeurs = self._interpreter(valeurs, value_input_option)
+        with self._verrou:
+            feuille = self._feuille(onglet)
+            for i, nouvelle in enumerate(valeurs):
+                idx = ligne - 1 + i
+                while len(feuille) <= idx:
+                    feuille.append([])
+                cible = feuille[idx]
+                if len(cible) < colonne - 1 + len(nouvelle):
+                    cible.extend([''] * (colonne - 1 + len(nouvelle) - len(cible)))
+                cible[colonne - 1:colonne - 1 + len(nouvelle)] = nouvelle
+
+    def _ajouter(self, onglet, lignes, value_input_option):
+        with self._verrou:
+            feuille = self._feuille(onglet)
+            premiere = len(_elaguer(feuille)) + 1
+            del feuille[premiere - 1:]
+            feuille.extend(self._interpreter(lignes, value_input_option))
+            self._marquer_modifie()
+        largeur = max((len(l) for l in lignes), default=1)
+        fin = _colonne_a1(largeur)
+        return {'updates': {'updatedRange': f"'{onglet}'!A{premiere}:{fin}{premiere + len(lignes) - 1}",
+                            'updatedRows': len(lignes)}}
+
+    def _marquer_modifie(self):
+        self.modifie_le = datetime.now(timezone.utc)
+        if self.chemin:
+            self.enregistrer()
+
+    # -- API gspread ---------------------------------------------------------
+
+    @_appel_api
+    def worksheets(self):
+        return [FeuilleLocale(self, nom) for nom in self.onglets]
+
+    def worksheet(self, titre):
+        self._feuille(titre)
+        return FeuilleLocale(self, titre)
+
+    @_appel_api
+    def get_lastUpdateTime(self):
+        return self.modifie_le.isoformat(timespec='microseconds').replace('+00:00', 'Z')
+
+    @_appel_api
+    def values_get(self, range, params=None):
+        return self._plage_valeurs(range, params)
+
+    @_appel_api
+    def values_batch_get(self, ranges, params=None):
+        return {'spreadsheetId': self.id, 'valueRanges': [self._plage_valeurs(p, params) for p in ranges]}
+
+    @_appel_api
+    def values_batch_update(self, body):
+        option = body.get('valueInputOption', 'RAW')
+        with self._verrou:
+            for bloc in body.get('data', []):
+                onglet, ligne, colonne, _, _ = decouper_plage(bloc['range'])
+                self._ecrire(onglet, ligne, colonne, bloc['values'], option)
+            self._marquer_modifie()
+        return {'spreadsheetId': self.id, 'totalUpdatedCells': sum(
+            len(l) for bloc in body.get('data', []) for l in bloc['values'])}
+
+    @_appel_api
+    def values_append(self, range, params=None, body=None):
+        onglet = decouper_plage(range)[0]
+        return self._ajouter(onglet, body['values'], (params or {}).get('valueInputOption', 'RAW'))
+
+    def _plage_valeurs(self, plage, params):
+        rendu = (params or {}).get('valueRenderOption', 'FORMATTED_VALUE')
+        onglet, l1, c1, l2, c2 = decouper_plage(plage)
+        reponse = {'range': plage, 'majorDimension': 'ROWS'}
+        valeurs = self._lire(onglet, l1, c1, l2, c2, rendu)
+        if valeurs:
+            reponse['values'] = valeurs
+        return reponse
+
+    def nb_appels_api(self):
+        """Total des requêtes simulées"""
+        return sum(n for appel, n in self.appels.items() if appel in APPELS_API)
+
+def _colonne_a1(numero):
+    lettres = ''
+    while numero:
+        numero, reste = divmod(numero - 1, 26)
+        lettres = chr(ord('A') + reste) + lettres
+    return lettres
+
+class ClientLocal:
+    """Équivalent d'un gspread.Client : toute URL ouvre le même classeur local"""
+
+    def __init__(self, classeur):
+        self.classeur = classeur
+
+    def open_by_url(self, url):
+        return self.classeur
+
+    def open_by_key(self, key):
+        return self.classeur
+
+    def open(self, title):
+        return self.classeur
+
+def obtenir_client_local(chemin):
+    """Client local unique par fichier pour tout le processus"""
+    with _verrou_registre:
+        if chemin not in _clients:
+            _clients[chemin] = ClientLocal(ClasseurLocal.depuis_fichier(chemin, identifiant=f'local-{os.path.basename(chemin)}'))
+        return _clients[chemin]
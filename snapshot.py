@@ -0,0 +1,116 @@
+"""
+SNAPSHOT LOCAL DES DONNÉES
+Copie SQLite du dernier jeu de données chargé (démarrage à froid, lecture hors ligne)
+
+Module sans dépendance Streamlit ni Google : lisible depuis un script ou Colab
+
+    from snapshot import charger_snapshot
+    data, infos = charger_snapshot('snapshots/<id_classeur>.sqlite')
+"""
+
+import math
+import os
+import sqlite3
+import threading
+from datetime import datetime
+
+import pandas as pd
+
+# Répertoire des snapshots ('' pour désactiver)
+REPERTOIRE_SNAPSHOT = os.environ.get('PLANNING_SNAPSHOT_DIR', 'snapshots')
+
+_verrou_ecriture = threading.Lock()
+
+def chemin_snapshot(spreadsheet_id, repertoire=None):
+    """Chemin du snapshot d'un classeur, ou None si les snapshots sont désactivés"""
+    repertoire = REPERTOIRE_SNAPSHOT if repertoire is None else repertoire
+    if not repertoire:
+        return None
+    return os.path.join(repertoire, f"{spreadsheet_id}.sqlite")
+
+def _quote(nom):
+    return '"{}"'.format(str(nom).replace('"', '""'))
+
+def _valeur_sql(valeur):
+    """Convertit une cellule pandas/numpy en valeur acceptée par sqlite3"""
+    if valeur is None:
+        return None
+    if isinstance(valeur, float) and math.isnan(valeur):
+        return None
+    if isinstance(valeur, (pd.Timestamp, datetime)):
+        return None if pd.isna(valeur) else valeur.isoformat()
+    if hasattr(valeur, 'item'):
+        return _valeur_sql(valeur.item())
+    if isinstance(valeur, (int, float, str, bytes)):
+        return valeur
+    return str(valeur)
+
+def enregistrer_snapshot(chemin, data, versions=None, marqueur=None):
+    """Écrit tous les onglets dans un fichier SQLite (remplacement atomique)
+
+    Les colonnes sont créées sans type déclaré : chaque cellule garde son
+    type d'origine (nombre ou texte), comme avec `get_all_records()`.
+    """
+    versions = versions or {}
+    os.makedirs(os.path.dirname(chemin) or '.', exist_ok=True)
+    temporaire = f"{chemin}.{os.getpid()}.{threading.get_ident()}.tmp"
+
+    with _verrou_ecriture:
+        conn = sqlite3.connect(temporaire)
+        try:
+            conn.execute("CREATE TABLE _onglets (onglet TEXT PRIMARY KEY, version INTEGER, ordre INTEGER)")
+            conn.execute("CREATE TABLE _infos (cle TEXT PRIMARY KEY, valeur TEXT)")
+
+            for ordre, (onglet, df) in enumerate(data.items()):
+                conn.execute("INSERT INTO _onglets VALUES (?, ?, ?)",
+                             (onglet, int(versions.get(onglet, 0)), ordre))
+                if len(df.columns) == 0:
+                    continue
+
+                table = _quote(f"onglet_{onglet}")
+                colonnes = ', '.join(_quote(c) for c in df.columns)
+                conn.execute(f"CREATE TABLE {table} ({colonnes})")
+                marques = ', '.join('?' * len(df.columns))
+                conn.executemany(
+                    f"INSERT INTO {table} VALUES ({marques})",
+                    ([_valeur_sql(v) for v in ligne] for ligne in df.itertuples(index=False, name=None))
+                )
+
+            conn.executemany("INSERT INTO _infos VALUES (?, ?)", [
+                ('date', datetime.now().isoformat(timespec='seconds')),
+                ('marqueur', marqueur or ''),
+            ])
+            conn.commit()
+        finally:
+            conn.close()
+
+        os.replace(temporaire, chemin)
+
+def charger_snapshot(chemin):
+    """Relit un snapshot : retourne (data, infos) ou (None, None) s'il n'existe pas
+
+    infos = {'date': ..., 'marqueur': ..., 'versions': {onglet: version}}
+    """
+    if not chemin or not os.path.exists(chemin):
+        return None, None
+
+    conn = sqlite3.connect(f"file:{chemin}?mode=ro", uri=True)
+    try:
+        onglets = conn.execute("SELECT onglet, version FROM _onglets ORDER BY ordre").fetchall()
+        infos = dict(conn.execute("SELECT cle, valeur FROM _infos").fetchall())
+        tables = {nom for (nom,) in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+
+        data = {}
+        for onglet, _ in onglets:
+            table = f"onglet_{onglet}"
+            if table not in tables:
+                data[onglet] = pd.DataFrame()
+                continue
+            curseur = conn.execute(f"SELECT * FROM {_quote(table)}")
+            colonnes = [d[0] for d in curseur.description]
+            data[onglet] = pd.DataFrame.from_records(curseur.fetchall(), columns=colonnes)
+    finally:
+        conn.close()
+
+    infos['versions'] = {onglet: version for onglet, version in onglets}
+    return data, infos
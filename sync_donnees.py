@@ -0,0 +1,461 @@
+"""
+SYNCHRONISATION INCRÉMENTALE DES DONNÉES
+Cache partagé par le processus, versionné par onglet (sans dépendance Streamlit)
+"""
+
+import threading
+import time
+
+import pandas as pd
+
+from index_planning import COLONNES_LIGNE, IndexPlanning
+from mesures import mesurer
+from schema_donnees import affecter, typer_onglet
+from sheets_io import CLES_ONGLETS, ONGLETS, IndexLignes, charger_onglets
+from snapshot import charger_snapshot, chemin_snapshot, enregistrer_snapshot
+
+# Intervalle minimal entre deux lectures du marqueur de modification Drive
+INTERVALLE_VERIFICATION = 30
+# Attente avant d'écrire le snapshot : les changements rapprochés n'en font qu'un
+DELAI_SNAPSHOT = 2.0
+
+_verrou_registre = threading.Lock()
+_caches = {}
+
+class _Lecture:
+    """Lecture du classeur en cours, attendue par les autres sessions"""
+
+    def __init__(self, forcee):
+        self.forcee = forcee
+        self.terminee = threading.Event()
+        self.erreur = None
+        # Onglets écrits localement pendant la lecture (à ne pas écraser)
+        self.modifies = set()
+
+def empreinte_dataframe(df):
+    """Empreinte du contenu d'un onglet (colonnes + valeurs)"""
+    if df.empty:
+        return (tuple(df.columns), 0)
+    try:
+        valeurs = int(pd.util.hash_pandas_object(df, index=False).sum())
+    except TypeError:
+        valeurs = hash(df.to_csv(index=False))
+    return (tuple(df.columns), valeurs)
+
+class CacheClasseur:
+    """Onglets d'un classeur avec une version par onglet
+
+    - le marqueur `modifiedTime` de Drive (une requête légère) est consulté
+      au plus toutes les `intervalle` secondes ; les onglets ne sont relus
+      que s'il a changé ;
+    - après relecture, seuls les onglets dont le contenu a changé voient
+      leur version augmenter ;
+    - après une écriture locale, l'onglet est soit patché directement
+      (`modifier_lignes`, `ajouter_lignes_locales`), soit invalidé seul
+      (`invalider`) ;
+    - les onglets de planning sont indexés par jour, semaine et ligne au
+      premier accès de chaque version (`index_planning`) ;
+    - une seule lecture réseau à la fois : les sessions qui arrivent pendant
+      une lecture l'attendent, puis reçoivent les mêmes onglets (partagés,
+      jamais copiés ; voir `_servir`) ; `statistiques` compte les accès servis
+      sans appel, les lectures et les attentes regroupées ;
+    - si `chemin_snapshot` est fourni, le dernier état est recopié en local :
+      au démarrage il est servi immédiatement puis rafraîchi en arrière-plan
+      (avec un `sheets_io.ClasseurDiffere`, la connexion elle-même a lieu
+      dans ce rafraîchissement).
+    """
+
+    def __init__(self, onglets=ONGLETS, intervalle=INTERVALLE_VERIFICATION, chemin_snapshot=None):
+        self.onglets = list(onglets)
+        self.intervalle = intervalle
+        self.frames = {}
+        self.versions = {onglet: 0 for onglet in self.onglets}
+        self.empreintes = {}
+        self.erreurs = {}
+        self.index = {}
+        self.plannings = {}
+        # Lignes de la grille de chaque onglet, relevées à chaque lecture
+        self.grilles = {}
+        self.marqueur = None
+        self.derniere_verification = None
+        self.a_relire = set(self.onglets)
+        # Écritures locales par onglet (modifier_lignes, ajout, invalidation) :
+        # un rafraîchissement n'installe pas un onglet écrit pendant sa lecture
+        self.generations = {onglet: 0 for onglet in self.onglets}
+        self.chemin_snapshot = chemin_snapshot
+        self.source = None
+        self.date_snapshot = None
+        self.erreur_rafraichissement = None
+        self._snapshot_lu = False
+        self._snapshot_demande = False
+        self._ecrivain_snapshot = None
+        self._rafraichissement = None
+        self._dernier_lancement = None
+        self._lecture = None
+        self.compteurs = {'servies': 0, 'lectures': 0, 'regroupees': 0, 'echecs': 0,
+                          'onglets_relus': 0, 'lecture_s': 0.0, 'attente_s': 0.0}
+        self._verrou = threading.RLock()
+
+    def donnees(self, spreadsheet, forcer=False):
+        """Retourne (data, erreurs) à jour, en ne relisant que le nécessaire
+
+        Une seule lecture à la fois par classeur : une session qui arrive
+        pendant une lecture en attend la fin au lieu d'en lancer une autre.
+        """
+        attendu = False
+        while True:
+            with self._verrou:
+                if not self._snapshot_lu and not self.frames and not forcer:
+                    with mesurer('chargement', 'snapshot local'):
+                        self._charger_snapshot()
+
+                if self.marqueur is None and self.frames and not forcer:
+                    # Données du snapshot : servies tout de suite, relecture en arrière-plan
+                    self._lancer_rafraichissement(spreadsheet)
+                    self._compter('servies', attendu)
+                    return self._servir()
+
+                lecture = self._lecture
+                if lecture is None:
+                    if not forcer and not self.a_relire and not self._verification_due():
+                        self._compter('servies', attendu)
+                        return self._servir()
+                    lecture = self._lecture = _Lecture(forcer)
+                    meneur = True
+                else:
+                    meneur = False
+
+            if meneur:
+                self._lire(spreadsheet, lecture)
+                with self._verrou:
+                    return self._servir()
+
+            debut = time.perf_counter()
+            with mesurer('chargement', 'attente de la lecture en cours'):
+                lecture.terminee.wait()
+            with self._verrou:
+                self.compteurs['regroupees'] += 1
+                self.compteurs['attente_s'] += time.perf_counter() - debut
+            if lecture.erreur is not None:
+                raise lecture.erreur
+            # Onglets invalidés pendant l'attente, rechargement forcé : on repasse
+            forcer = forcer and not lecture.forcee
+            attendu = True
+
+    def _verification_due(self):
+        return self.marqueur is None or time.monotonic() - self.derniere_verification >= self.intervalle
+
+    def _compter(self, compteur, attendu):
+        # Une session qui a attendu une lecture est déjà comptée dans 'regroupees'
+        if not attendu:
+            self.compteurs[compteur] += 1
+
+    def _servir(self):
+        """(data, erreurs) : copies superficielles des onglets partagés, sans copie des valeurs
+
+        Avec le copy-on-write de pandas (activé par l'application), une
+        modification faite par une session sur son onglet ne touche ni le
+        cache ni les autres sessions.
+        """
+        return {onglet: df.copy(deep=False) for onglet, df in self.frames.items()}, dict(self.erreurs)
+
+    def _lire(self, spreadsheet, lecture):
+        """Lecture menée pour toutes les sessions : marqueur Drive puis onglets, hors verrou"""
+        debut = time.perf_counter()
+        try:
+            with self._verrou:
+                tout = lecture.forcee or self.marqueur is None
+                a_relire = set(self.onglets) if tout else set(self.a_relire)
+                verifier = tout or self._verification_due()
+                marqueur_connu = self.marqueur
+
+            maintenant = time.monotonic()
+            marqueur = None
+            if verifier:
+                with mesurer('chargement', 'vérification du marqueur Drive'):
+                    marqueur = spreadsheet.get_lastUpdateTime()
+                if marqueur != marqueur_connu:
+                    a_relire = set(self.onglets)
+
+            onglets = [o for o in self.onglets if o in a_relire]
+            grilles = {}
+            if onglets:
+                data, erreurs = charger_onglets(spreadsheet, onglets, grilles)
+
+            with self._verrou:
+                if verifier and len(onglets) == len(self.onglets):
+                    # Marqueur lu avant la relecture : une écriture concurrente
+                    # sera détectée à la vérification suivante
+                    self.marqueur = marqueur
+                if verifier:
+                    self.derniere_verification = maintenant
+                self._noter_grilles(grilles)
+                if onglets:
+                    # Onglet écrit localement pendant la lecture : on garde la
+                    # version locale et on le relira au prochain accès
+                    sautes = lecture.modifies.intersection(onglets)
+                    with mesurer('chargement', 'empreintes et index'):
+                        self._installer([o for o in onglets if o not in sautes], data, erreurs)
+                    self.a_relire.update(sautes)
+                self.compteurs['lectures'] += 1
+                self.compteurs['onglets_relus'] += len(onglets)
+        except Exception as e:
+            lecture.erreur = e
+            with self._verrou:
+                self.compteurs['echecs'] += 1
+            raise
+        finally:
+            with self._verrou:
+                self.compteurs['lecture_s'] += time.perf_counter() - debut
+                self._lecture = None
+            lecture.terminee.set()
+
+    def statistiques(self):
+        """Compteurs du cache : servies (sans appel), lectures, attentes regroupées, échecs..."""
+        with self._verrou:
+            stats = {cle: round(valeur, 3) if isinstance(valeur, float) else valeur
+                     for cle, valeur in self.compteurs.items()}
+            stats['lecture_en_cours'] = self._lecture is not None
+        return stats
+
+    def _installer(self, onglets, data, erreurs):
+        """Remplace les onglets relus et incrémente la version des onglets modifiés"""
+        modifie = False
+        for onglet in onglets:
+            empreinte = empreinte_dataframe(data[onglet])
+            if empreinte != self.empreintes.get(onglet):
+                self.frames[onglet] = data[onglet]
+                self.empreintes[onglet] = empreinte
+                self.versions[onglet] += 1
+                self._indexer(onglet)
+                modifie = True
+            if onglet in erreurs:
+                self.erreurs[onglet] = erreurs[onglet]
+            else:
+                self.erreurs.pop(onglet, None)
+            self.a_relire.discard(onglet)
+
+        self.source = 'sheets'
+        if modifie:
+            self._persister()
+
+    def _indexer(self, onglet):
+        """(Re)construit l'index des positions à chaque chargement de l'onglet"""
+        colonne_cle = CLES_ONGLETS.get(onglet)
+        df = self.frames.get(onglet)
+        if colonne_cle is None or df is None or colonne_cle not in df.columns:
+            self.index.pop(onglet, None)
+            return
+        self.index[onglet] = IndexLignes.depuis_dataframe(onglet, colonne_cle, df, self.grilles.get(onglet))
+
+    def _noter_grilles(self, grilles):
+        """Taille des grilles relue avec les onglets, reportée dans les index existants"""
+        self.grilles.update(grilles)
+        for onglet, lignes in grilles.items():
+            if onglet in self.index:
+                self.index[onglet].lignes_grille = lignes
+
+    def index_lignes(self, onglet):
+        """IndexLignes de l'onglet (None si l'onglet n'est pas indexé ou pas chargé)"""
+        with self._verrou:
+            return self.index.get(onglet)
+
+    def index_planning(self, onglet):
+        """IndexPlanning de l'onglet à sa version courante, construit au premier appel
+
+        None si l'onglet n'est pas un planning ou n'est pas chargé.
+        """
+        with self._verrou:
+            df = self.frames.get(onglet)
+            if df is None or onglet not in COLONNES_LIGNE:
+                return None
+            version = self.versions[onglet]
+            indexe = self.plannings.get(onglet)
+            if indexe is None or indexe[0] != version:
+                with mesurer('chargement', f'index {onglet}'):
+                    self.plannings[onglet] = (version, IndexPlanning(df, COLONNES_LIGNE[onglet]))
+            return self.plannings[onglet][1]
+
+    def _charger_snapshot(self):
+        """Installe le dernier snapshot local s'il existe"""
+        self._snapshot_lu = True
+        try:
+            data, infos = charger_snapshot(self.chemin_snapshot)
+        except Exception as e:
+            print(f"Snapshot illisible ({self.chemin_snapshot}) : {e}")
+            return
+        if data is None:
+            return
+
+        for onglet in self.onglets:
+            df = typer_onglet(onglet, data.get(onglet, pd.DataFrame()))
+            self.frames[onglet] = df
+            self.empreintes[onglet] = empreinte_dataframe(df)
+            self.versions[onglet] += 1
+            self._indexer(onglet)
+        self.source = 'snapshot'
+        self.date_snapshot = infos.get('date')
+
+    def _lancer_rafraichissement(self, spreadsheet):
+        """Relit tout le classeur dans un thread (au plus une fois par intervalle)"""
+        maintenant = time.monotonic()
+        if self._rafraichissement is not None and self._rafraichissement.is_alive():
+            return
+        if self._dernier_lancement is not None and maintenant - self._dernier_lancement < self.intervalle:
+            return
+
+        self._dernier_lancement = maintenant
+        self._rafraichissement = threading.Thread(
+            target=self._rafraichir, args=(spreadsheet,), daemon=True
+        )
+        self._rafraichissement.start()
+
+    def _rafraichir(self, spreadsheet):
+        with self._verrou:
+            generations = dict(self.generations)
+        # Requêtes hors verrou : les sessions continuent de lire le snapshot
+        try:
+            marqueur = spreadsheet.get_lastUpdateTime()
+            grilles = {}
+            data, erreurs = charger_onglets(spreadsheet, self.onglets, grilles)
+        except Exception as e:
+            print(f"Rafraîchissement depuis Google Sheets impossible : {e}")
+            self.erreur_rafraichissement = str(e) or type(e).__name__
+            return
+
+        with self._verrou:
+            self.erreur_rafraichissement = None
+            self.marqueur = marqueur
+            self.derniere_verification = time.monotonic()
+            self._noter_grilles(grilles)
+            # Onglet écrit localement pendant la lecture : version locale gardée,
+            # relu au prochain accès (comme dans _lire)
+            sautes = {o for o in self.onglets if self.generations[o] != generations[o]}
+            self._installer([o for o in self.onglets if o not in sautes], data, erreurs)
+            self.a_relire.update(sautes)
+
+    def _persister(self):
+        """Demande l'écriture du snapshot local
+
+        Un seul thread écrit, DELAI_SNAPSHOT après la demande et toujours
+        l'état le plus récent : les demandes arrivées entre-temps sont
+        regroupées, et un état ancien ne remplace jamais un état plus récent.
+        """
+        if not self.chemin_snapshot:
+            return
+        with self._verrou:
+            self._snapshot_demande = True
+            if self._ecrivain_snapshot is None:
+                self._ecrivain_snapshot = threading.Thread(target=self._ecrire_snapshots, daemon=True)
+                self._ecrivain_snapshot.start()
+
+    def _ecrire_snapshots(self):
+        while True:
+            time.sleep(DELAI_SNAPSHOT)
+            with self._verrou:
+                if not self._snapshot_demande:
+                    self._ecrivain_snapshot = None
+                    return
+                self._snapshot_demande = False
+                frames = dict(self.frames)
+                versions = dict(self.versions)
+                marqueur = self.marqueur
+            try:
+                enregistrer_snapshot(self.chemin_snapshot, frames, versions, marqueur)
+            except Exception as e:
+                print(f"Écriture du snapshot impossible : {e}")
+
+    def _noter_ecriture(self, onglet):
+        self.generations[onglet] += 1
+        if self._lecture is not None:
+            self._lecture.modifies.add(onglet)
+
+    def adopter_marqueur(self, avant, apres):
+        """Marqueur Drive relevé autour d'une écriture de l'application
+
+        Si le classeur n'avait pas changé depuis la dernière vérification
+        (`avant` == marqueur connu), le nouveau marqueur est adopté : la
+        vérification suivante ne relira que les onglets à relire (`a_relire`),
+        pas les onze onglets. Retourne True si le marqueur a été adopté.
+        """
+        with self._verrou:
+            if self.marqueur is None or avant != self.marqueur:
+                return False
+            self.marqueur = apres
+            return True
+
+    def invalider(self, *onglets):
+        """Force la relecture de ces seuls onglets au prochain accès"""
+        with self._verrou:
+            for onglet in onglets:
+                if onglet in self.versions:
+                    self.a_relire.add(onglet)
+                    self._noter_ecriture(onglet)
+
+    def modifier_lignes(self, onglet, colonne_id, ids, valeurs):
+        """Reporte dans le cache une écriture faite (ou en file) dans Google Sheets
+
+        `valeurs` = {colonne: nouvelle valeur} appliqué aux lignes dont
+        `colonne_id` est dans `ids`. Le DataFrame est remplacé (jamais modifié
+        en place) pour ne pas altérer les données déjà servies aux sessions.
+        """
+        with self._verrou:
+            df = self.frames.get(onglet)
+            if df is None or colonne_id not in df.columns or any(c not in df.columns for c in valeurs):
+                self.a_relire.add(onglet)
+                return
+
+            masque = df[colonne_id].astype(str).isin([str(i) for i in ids])
+            if not masque.any():
+                return
+
+            df = df.copy()
+            self._noter_ecriture(onglet)
+            for colonne, valeur in valeurs.items():
+                affecter(df, masque, colonne, valeur)
+
+            self.frames[onglet] = df
+            self.empreintes[onglet] = empreinte_dataframe(df)
+            self.versions[onglet] += 1
+
+            # Statut, résultats... : les positions restent valables
+            indexe = self.plannings.get(onglet)
+            if indexe is not None and indexe[0] == self.versions[onglet] - 1 \
+                    and not set(valeurs) & indexe[1].colonnes_cles():
+                self.plannings[onglet] = (self.versions[onglet], indexe[1].avec_planning(df))
+            self._persister()
+
+    def ajouter_lignes_locales(self, onglet, lignes):
+        """Ajoute en fin d'onglet des lignes en cours d'écriture (ordre des colonnes de la feuille)
+
+        Affichage immédiat en attendant la relecture qui suit l'écriture réelle.
+        """
+        with self._verrou:
+            df = self.frames.get(onglet)
+            if df is None or not lignes:
+                self.a_relire.add(onglet)
+                return
+
+            self._noter_ecriture(onglet)
+            nouvelles = pd.DataFrame([list(l[:len(df.columns)]) + [''] * (len(df.columns) - len(l))
+                                      for l in lignes], columns=df.columns)
+            self.frames[onglet] = typer_onglet(onglet, pd.concat([df, nouvelles], ignore_index=True))
+            self.empreintes[onglet] = empreinte_dataframe(self.frames[onglet])
+            self.versions[onglet] += 1
+
+    def version(self, onglet):
+        with self._verrou:
+            return self.versions.get(onglet, 0)
+
+def statistiques_caches():
+    """{spreadsheet_id: statistiques du cache} pour ce processus"""
+    with _verrou_registre:
+        caches = dict(_caches)
+    return {spreadsheet_id: cache.statistiques() for spreadsheet_id, cache in caches.items()}
+
+def obtenir_cache(spreadsheet_id):
+    """Cache unique par classeur pour tout le processus"""
+    with _verrou_registre:
+        if spreadsheet_id not in _caches:
+            _caches[spreadsheet_id] = CacheClasseur(chemin_snapshot=chemin_snapshot(spreadsheet_id))
+        return _caches[spreadsheet_id]